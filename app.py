@@ -16,6 +16,7 @@ from footprint_utils.exception_handler import alert_popups
 start_logging_callbacks(config.APP_REQUESTS_LOG)
 
 import callbacks  # noq
+import footprint_rendering
 
 
 # logos
@@ -118,6 +119,7 @@ app = Dash(
 )
 
 server = app.server
+footprint_rendering.register_footprint_routes(app)
 
 app.layout = dmc.MantineProvider(get_dashboard_layout(app))
 app.title = 'IAGOS footprints'
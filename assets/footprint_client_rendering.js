@@ -0,0 +1,105 @@
+// Client-side rendering of footprints (FOOTPRINT_MAP_SOURCE = 'client' in config): a footprint grid, quantized
+// on a log scale by footprint_rendering.get_footprint_grid, is colourized in the browser with the residence time
+// scale and cut-off chosen, so that changing them needs no request to the server.
+
+(function () {
+    const TRANSFORMS = {
+        lin: [x => x, x => x],
+        sqrt: [Math.sqrt, x => x * x],
+        log: [Math.log, Math.exp],
+    };
+    // web Mercator y (on the unit sphere) and its inverse
+    const latToY = lat => Math.log(Math.tan(Math.PI / 4 + lat * Math.PI / 360));
+    const yToLat = y => (2 * Math.atan(Math.exp(y)) - Math.PI / 2) * 180 / Math.PI;
+    // the same as Python's f'{x:.1e}'
+    const formatTick = function (x) {
+        const m = x.toExponential(1).match(/^(.*)e([+-])(\d+)$/);
+        return `${m[1]}e${m[2]}${m[3].padStart(2, '0')}`;
+    };
+
+    function decodeValues(grid) {
+        const codes = Uint8Array.from(atob(grid.codes), c => c.charCodeAt(0));
+        const values = new Float64Array(codes.length);
+        for (let i = 0; i < codes.length; i++) {
+            values[i] = codes[i] > 0 ? Math.exp(grid.log_offset + (codes[i] - 1) * grid.log_scale) : 0;
+        }
+        return values;
+    }
+
+    function renderFootprint(grid, scale, cutoff, figure) {
+        if (!grid || !figure) {
+            return window.dash_clientside.no_update;
+        }
+        const [valueToColor, colorToValue] = TRANSFORMS[scale];
+        const [nlat, nlon] = grid.shape;
+        const values = decodeValues(grid);
+
+        let valueMax = 0;
+        for (const v of values) {
+            valueMax = Math.max(valueMax, v);
+        }
+        const threshold = cutoff * valueMax;
+        let valueMin = valueMax;
+        for (const v of values) {
+            if (v > threshold) {
+                valueMin = Math.min(valueMin, v);
+            }
+        }
+        const colorMin = valueToColor(valueMin), colorMax = valueToColor(valueMax);
+        const colorSpan = colorMax > colorMin ? colorMax - colorMin : 1;
+
+        // RGBA of grid cells
+        const ncolors = grid.colormap.length;
+        const cellRgba = new Uint8ClampedArray(4 * values.length);
+        values.forEach(function (v, i) {
+            if (v <= threshold) {
+                return;
+            }
+            const idx = Math.round((valueToColor(v) - colorMin) / colorSpan * (ncolors - 1));
+            const [r, g, b] = grid.colormap[idx];
+            cellRgba.set([r, g, b, Math.floor(255 * Math.sqrt(idx / (ncolors - 1)))], 4 * i);
+        });
+
+        // canvas rows are evenly spaced in web Mercator, from the north; each takes the grid row it falls in
+        const lon0 = grid.lon[0] - grid.dlon / 2, lon1 = grid.lon[1] + grid.dlon / 2;
+        const lat0 = grid.lat[0] - grid.dlat / 2, lat1 = grid.lat[1] + grid.dlat / 2;
+        const y0 = latToY(lat0), y1 = latToY(lat1);
+        const height = 4 * nlat;
+        const canvas = document.createElement('canvas');
+        canvas.width = nlon;
+        canvas.height = height;
+        const ctx = canvas.getContext('2d');
+        const img = ctx.createImageData(nlon, height);
+        for (let row = 0; row < height; row++) {
+            const lat = yToLat(y1 - (row + 0.5) * (y1 - y0) / height);
+            const gridRow = Math.min(Math.max(Math.floor((lat - lat0) / grid.dlat), 0), nlat - 1);
+            img.data.set(cellRgba.subarray(4 * nlon * gridRow, 4 * nlon * (gridRow + 1)), 4 * nlon * row);
+        }
+        ctx.putImageData(img, 0, 0);
+
+        const trace = JSON.parse(JSON.stringify(grid.colorscale_trace));
+        const tickpos = Array.from({length: 11}, (_, i) => i / 10);
+        trace.marker.colorbar.tickvals = tickpos;
+        trace.marker.colorbar.ticktext = tickpos.map(
+            p => formatTick(colorToValue((1 - p) * colorMin + p * colorMax))
+        );
+
+        const newFigure = Object.assign({}, figure);
+        newFigure.layout = Object.assign({}, figure.layout);
+        newFigure.layout.mapbox = Object.assign({}, figure.layout.mapbox);
+        newFigure.layout.mapbox.layers = [{
+            sourcetype: 'image',
+            source: canvas.toDataURL('image/png'),
+            coordinates: [[lon0, lat1], [lon1, lat1], [lon1, lat0], [lon0, lat0]],
+        }];
+        newFigure.data = figure.data.slice();
+        newFigure.data[1] = trace;
+        return newFigure;
+    }
+
+    window.dash_clientside = Object.assign({}, window.dash_clientside, {
+        footprint: Object.assign({}, (window.dash_clientside || {}).footprint, {
+            render_footprint: renderFootprint,
+        }),
+    });
+})();
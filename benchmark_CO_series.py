@@ -0,0 +1,102 @@
+import sys
+import time
+import argparse
+import numpy as np
+
+import callbacks
+from footprint_utils import helper
+from footprint_data_access import data_access, get_iagos_airports, get_CO_ts
+
+
+def get_CO_series_per_series(airport_code, vertical_layer, emission_inventory, emission_region, gap):
+    """
+    The former builder of callbacks._get_CO_series: one xarray selection and two gap insertions per series,
+    and the SOFT-IO total summed pairwise with pandas.
+    """
+    CO_ts = get_CO_ts(airport_code)
+    CO_ts = CO_ts\
+        .sel({'layer': vertical_layer, 'emission_inventory': emission_inventory, 'region': emission_region}, drop=True)\
+        .assign_coords({'customdata': CO_ts['profile_idx_for_airport']})\
+        .swap_dims({'profile_idx': 'time'})
+
+    CO_ser = {}
+    for lvl in [2, 1]:
+        _CO_da = CO_ts['CO_mean'].where(CO_ts['CO_processing_level'] == lvl, drop=True)
+        CO_ser[lvl] = (
+            helper.insert_nan_into_timeseries_gaps(_CO_da.to_series(), gap=gap),
+            helper.insert_nan_into_timeseries_gaps(_CO_da['customdata'].to_series(), gap=gap)
+        )
+
+    SOFTIO_ser = {}
+    for ei in emission_inventory:
+        _SOFTIO_da = CO_ts['CO_contrib_mean'].sel({'emission_inventory': ei}, drop=True)
+        SOFTIO_ser[ei] = (
+            helper.insert_nan_into_timeseries_gaps(_SOFTIO_da.to_series(), gap=gap),
+            helper.insert_nan_into_timeseries_gaps(_SOFTIO_da['customdata'].to_series(), gap=gap)
+        )
+
+    if len(emission_inventory) > 1:
+        ser, customdata = SOFTIO_ser[emission_inventory[0]]
+        customdata = customdata.copy()
+        for ei in emission_inventory[1:]:
+            ser2, customdata2 = SOFTIO_ser[ei]
+            ser = ser + ser2
+            customdata.update(customdata2)
+        SOFTIO_ser['ALL'] = ser, customdata
+    return CO_ser, SOFTIO_ser
+
+
+def _get_exectime(func, repeat):
+    exectime = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        exectime = min(exectime, time.perf_counter() - start)
+    return exectime
+
+
+def _assert_series_equal(expected, actual):
+    assert expected.keys() == actual.keys(), (expected.keys(), actual.keys())
+    for k in expected:
+        for e, a in zip(expected[k], actual[k]):
+            assert np.array_equal(e.index.values, a.index.values, equal_nan=True), k
+            assert np.allclose(e.values.astype('f8'), a.values.astype('f8'), equal_nan=True), k
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Measure the time of building the CO and SOFT-IO series of the CO graph (callbacks._get_CO_series) '
+                    'against the former per-series builder, on the airports with the most profiles'
+    )
+    parser.add_argument('airports', nargs='*', help='airport codes (default: the --top airports with the most profiles)')
+    parser.add_argument('--top', type=int, default=3)
+    parser.add_argument('--layer', default=None, help='vertical layer (default: the first one)')
+    parser.add_argument('--region', default='TOTAL', help='emission region')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    # so that both builders read the series at the resolution of profiles
+    data_access.CO_TS_MAX_PROFILES = sys.maxsize
+    airports = args.airports or list(get_iagos_airports(top=args.top)[0]['short_name'])
+
+    print(f'{"airport":>8} {"nprofiles":>10} {"former (s)":>11} {"batched (s)":>12} {"speedup":>8}')
+    for airport_code in airports:
+        CO_ts = get_CO_ts(airport_code)
+        layer = args.layer or str(CO_ts['layer'].values[0])
+        emission_inventory = [str(ei) for ei in CO_ts['emission_inventory'].values]
+        series_args = (airport_code, layer, emission_inventory, args.region)
+
+        expected = get_CO_series_per_series(*series_args, gap=callbacks.CO_TS_GAP_BY_RESOLUTION['profile'])
+        actual = callbacks._get_CO_series(*series_args, None, None)
+        for e, a in zip(expected, actual):
+            _assert_series_equal(e, a)
+
+        former_time = _get_exectime(
+            lambda: get_CO_series_per_series(*series_args, gap=callbacks.CO_TS_GAP_BY_RESOLUTION['profile']),
+            args.repeat
+        )
+        batched_time = _get_exectime(lambda: callbacks._get_CO_series(*series_args, None, None), args.repeat)
+        print(
+            f'{airport_code:>8} {len(CO_ts["profile_idx"]):>10} {former_time:>11.4f} {batched_time:>12.4f} '
+            f'{former_time / batched_time:>7.1f}x'
+        )
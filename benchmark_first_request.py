@@ -0,0 +1,87 @@
+import os
+import sys
+import json
+import pathlib
+import argparse
+import tempfile
+import subprocess
+
+
+_APP_DIR = pathlib.Path(__file__).resolve().parent
+
+# run in a fresh process, like a newly started worker
+_WORKER_SCRIPT = '''
+import sys
+import json
+import time
+start = time.perf_counter()
+import callbacks
+import warm_up
+from footprint_data_access import get_iagos_airports
+from layout import DEFAULT_VERTICAL_LAYER, DEFAULT_EMISSION_INVENTORY, DEFAULT_EMISSION_REGION
+boot_time = time.perf_counter() - start
+
+airport_rank, with_warm_up = int(sys.argv[1]), sys.argv[2] == '1'
+start = time.perf_counter()
+if with_warm_up:
+    warm_up.warm_up()
+warm_up_time = time.perf_counter() - start
+
+airports, _ = get_iagos_airports(top=airport_rank + 1)
+airport_code = airports['short_name'].iloc[min(airport_rank, len(airports) - 1)]
+co_fig_args = DEFAULT_VERTICAL_LAYER, DEFAULT_EMISSION_INVENTORY, DEFAULT_EMISSION_REGION, None, None, None
+start = time.perf_counter()
+callbacks._get_CO_fig(airport_code, *co_fig_args)
+first_request_time = time.perf_counter() - start
+start = time.perf_counter()
+callbacks._get_CO_fig(airport_code, *co_fig_args)
+second_request_time = time.perf_counter() - start
+print(json.dumps({
+    'airport': airport_code,
+    'boot': boot_time,
+    'warm_up': warm_up_time,
+    'first_request': first_request_time,
+    'second_request': second_request_time,
+}))
+'''
+
+
+def run_worker(numba_cache_dir, airport_rank, with_warm_up):
+    """
+    :return: dict with the times (in seconds) of 'boot' (imports, including numba compilation or cache loading),
+    'warm_up', 'first_request' and 'second_request' (the CO graph of an airport)
+    """
+    env = dict(os.environ, NUMBA_CACHE_DIR=str(numba_cache_dir))
+    out = subprocess.run(
+        [sys.executable, '-c', _WORKER_SCRIPT, str(airport_rank), '1' if with_warm_up else '0'],
+        cwd=_APP_DIR, env=env, check=True, capture_output=True, text=True,
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Measure the latency of the first CO graph request of a newly started worker: with the numba '
+                    'kernels compiled at boot or loaded from the on-disk cache, and with or without warm_up.warm_up'
+    )
+    parser.add_argument(
+        '--airport-rank', type=int, default=1,
+        help='rank of the airport requested by the number of profiles (default 1: the second one, so that '
+             'the request does not hit the caches filled by the warm-up, which uses the first one)'
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as numba_cache_dir:
+        scenarios = [
+            ('no numba cache, no warm-up', False),
+            ('numba cache, no warm-up', False),
+            ('numba cache, warm-up', True),
+        ]
+        print(f'{"":>28} {"boot (s)":>9} {"warm-up (s)":>12} {"1st req (s)":>12} {"2nd req (s)":>12}')
+        for name, with_warm_up in scenarios:
+            t = run_worker(numba_cache_dir, args.airport_rank, with_warm_up)
+            print(
+                f'{name:>28} {t["boot"]:>9.3f} {t["warm_up"]:>12.3f} {t["first_request"]:>12.3f} '
+                f'{t["second_request"]:>12.3f}'
+            )
+        print(f'airport: {t["airport"]}')
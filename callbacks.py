@@ -2,12 +2,11 @@ import warnings
 import sys
 import pathlib
 import toolz
-import functools
 import numpy as np
 import pandas as pd
 import xarray as xr
 import dash
-from dash import Output, Input, State, Patch
+from dash import Output, Input, State, Patch, ClientsideFunction
 import dash_bootstrap_components as dbc
 
 import plotly.graph_objects as go
@@ -19,27 +18,38 @@ from log import log_exception, logger, log_callback, log_exectime
 from layout import AIRPORT_SELECT_ID, VERTICAL_LAYER_RADIO_ID, FOOTPRINT_MAP_GRAPH_ID, PREVIOUS_TIME_BUTTON_ID, \
     DATE_FROM_ID, DATE_TO_ID, \
     NEXT_TIME_BUTTON_ID, REWIND_TIME_BUTTON_ID, FASTFORWARD_TIME_BUTTON_ID, CURRENT_PROFILE_IDX_BY_AIRPORT_STORE_ID, \
-    CO_GRAPH_ID, PROFILE_GRAPH_ID, EMISSION_INVENTORY_CHECKLIST_ID,  EMISSION_REGION_SELECT_ID, TIME_INPUT_ID, \
+    FOOTPRINT_GRID_STORE_ID, CO_GRAPH_STATE_STORE_ID, CO_GRAPH_ID, PROFILE_GRAPH_ID, EMISSION_INVENTORY_CHECKLIST_ID,  EMISSION_REGION_SELECT_ID, TIME_INPUT_ID, \
     COLOR_HEX_BY_GFED4_REGION, COLOR_HEX_BY_EMISSION_INVENTORY, GEO_REGIONS_WITHOUT_TOTAL, FILLPATTERN_SHAPE_BY_EMISSION_INVENTORY, DATA_DOWNLOAD_BUTTON_ID, \
     DATA_DOWNLOAD_POPUP_ID, add_watermark, ONLY_SIGNIFICANT_REGIONS_CHECKBOX_ID, ONLY_SIGNIFICANT_REGIONS_PERCENTAGE_ID, \
     RESIDENCE_TIME_SCALE_RADIO_ID, RESIDENCE_TIME_CUTOFF_RADIO_ID, \
     IAGOS_COLOR_HEX, IAGOS_COLOR_BRIGHT_HEX, IAGOS_AIRPORT_SIZE
 from footprint_utils import footprint_viz, helper
-from footprint_data_access import get_residence_time, get_flight_id_and_profile_by_airport_and_profile_idx, \
+import footprint_rendering
+import prefetch
+from footprint_data_access import get_flight_id_and_profile_by_airport_and_profile_idx, \
     airports_df, airport_name_by_code, get_iagos_airports, \
-    get_CO_ts, get_coords_by_airport_and_profile_idx, get_COprofile, get_COprofile_climatology
+    get_CO_ts, get_CO_ts_resolution, get_coords_by_airport_and_profile_idx, get_COprofile, get_COprofile_climatology
 
 
 USE_GL = 500
+# max number of points of a trace of the CO time series (with the graph zoomed in, up to twice as many)
+CO_TS_MAX_POINTS = 2000
+# time gaps of the CO time series broken by nan's, by resolution of the series (see get_CO_ts)
+CO_TS_GAP_BY_RESOLUTION = {
+    'profile': np.timedelta64(4, 'D'),
+    'day': np.timedelta64(4, 'D'),
+    'week': np.timedelta64(17, 'D'),
+    'month': np.timedelta64(75, 'D'),
+}
 
 
 # TODO: improve test for not available footprint data: see e.g. FRA in FT layer on 2013-02-23 06:38
-@functools.lru_cache(maxsize=8)
+# not memoized: the Patch is modified by the caller; footprint map layers are cached by footprint_rendering
 def get_footprint_img(
         airport_code,
         layer,
         profile_idx,
-        color_scale_transform=(np.log, np.exp),
+        residence_time_scale='log',
         residence_time_cutoff=1e-3,
         update_center_and_zoom=True,
 ):
@@ -55,20 +65,16 @@ def get_footprint_img(
     fig = Patch()
 
     flight_id, profile = get_flight_id_and_profile_by_airport_and_profile_idx(airport_code, profile_idx)
-    res_time_per_km2 = get_residence_time(flight_id, profile, layer)
-    if res_time_per_km2 is not None:
-        da = res_time_per_km2.load()
-        img, coordinates, colorscale_trace = footprint_viz.get_footprint_viz(
-            da,
-            color_scale_transform=color_scale_transform,
-            residence_time_cutoff=residence_time_cutoff,
-        )
-        fig['layout']['mapbox']['layers'] = [{
-            'sourcetype': 'image',
-            'source': img,
-            'coordinates': coordinates,
-        }]
-        fig['data'][1] = colorscale_trace
+    map_layers = footprint_rendering.get_footprint_map_layers(
+        flight_id, profile, layer, residence_time_scale, residence_time_cutoff
+    )
+    if map_layers is not None:
+        mapbox_layers, coordinates, colorscale_trace = map_layers
+        # with FOOTPRINT_MAP_SOURCE = 'client', the layer and the colorbar are set in the browser
+        if mapbox_layers is not None:
+            fig['layout']['mapbox']['layers'] = mapbox_layers
+        if colorscale_trace is not None:
+            fig['data'][1] = colorscale_trace
         del fig['layout']['annotations'][1]
 
         if update_center_and_zoom:
@@ -172,6 +178,9 @@ def update_airport_on_map_click(map_click_data, date_from, date_to):
     Input(DATE_FROM_ID, 'value'),
     Input(DATE_TO_ID, 'value'),
     State(CURRENT_PROFILE_IDX_BY_AIRPORT_STORE_ID, 'data'),
+    State(VERTICAL_LAYER_RADIO_ID, 'value'),
+    State(RESIDENCE_TIME_SCALE_RADIO_ID, 'value'),
+    State(RESIDENCE_TIME_CUTOFF_RADIO_ID, 'value'),
 )
 @log_exception
 def update_current_time_by_airport(
@@ -180,7 +189,8 @@ def update_current_time_by_airport(
         co_graph_click_data,
         time_input,
         date_from, date_to,
-        current_profile_idx_by_airport
+        current_profile_idx_by_airport,
+        vertical_layer, residence_time_scale, residence_time_cutoff,
 ):
     dash_ctx = list(dash.ctx.triggered_prop_ids.values())
 
@@ -208,6 +218,10 @@ def update_current_time_by_airport(
     profile_idx = min(max(profile_idx, min_profile_idx), max_profile_idx)
 
     current_profile_idx_by_airport[airport_code] = profile_idx
+    prefetch.prefetch_profiles(
+        airport_code, profile_idx, big_time_step, min_profile_idx, max_profile_idx,
+        vertical_layer, residence_time_scale, residence_time_cutoff,
+    )
 
     curr_time = CO_ts['time'][profile_idx - min_profile_idx].item()
     curr_time = pd.Timestamp(curr_time).strftime("%Y-%m-%d %H:%M")
@@ -225,15 +239,20 @@ def _update_footprint_map_comment(
     return f'Footprint from {vertical_layer} layer over {airport_name} ({airport_code}) on {pd.Timestamp(curr_time).strftime("%Y-%m-%d %H:%M")}'
 
 
+# footprints rendered in the browser are restyled there, with no request to the server
+_ClientOrServerInput = State if footprint_rendering.FOOTPRINT_MAP_SOURCE == 'client' else Input
+
+
 @callback_with_exc_handling(
     Output(FOOTPRINT_MAP_GRAPH_ID, 'figure'),
+    Output(FOOTPRINT_GRID_STORE_ID, 'data'),
     Input(AIRPORT_SELECT_ID, 'value'),
     Input(VERTICAL_LAYER_RADIO_ID, 'value'),
     Input(CURRENT_PROFILE_IDX_BY_AIRPORT_STORE_ID, 'data'),
     Input(DATE_FROM_ID, 'value'),
     Input(DATE_TO_ID, 'value'),
-    Input(RESIDENCE_TIME_SCALE_RADIO_ID, 'value'),
-    Input(RESIDENCE_TIME_CUTOFF_RADIO_ID, 'value'),
+    _ClientOrServerInput(RESIDENCE_TIME_SCALE_RADIO_ID, 'value'),
+    _ClientOrServerInput(RESIDENCE_TIME_CUTOFF_RADIO_ID, 'value'),
     prevent_initial_call=True,
 )
 @log_exception
@@ -251,13 +270,7 @@ def update_footprint_map(
 
     dash_ctx = list(dash.ctx.triggered_prop_ids.values())
 
-    if residence_time_scale == 'lin':
-        color_scale_transform = (lambda x: x, lambda x: x)
-    elif residence_time_scale == 'sqrt':
-        color_scale_transform = (np.sqrt, lambda x: x ** 2)
-    elif residence_time_scale == 'log':
-        color_scale_transform = (np.log, np.exp)
-    else:
+    if residence_time_scale not in footprint_viz.COLOR_SCALE_TRANSFORMS:
         raise ValueError(f'unknown residence_time_scale={residence_time_scale}')
 
     # change center and zoom only when airport has changed
@@ -267,7 +280,7 @@ def update_footprint_map(
         airport_code,
         vertical_layer,
         profile_idx,
-        color_scale_transform=color_scale_transform,
+        residence_time_scale=residence_time_scale,
         residence_time_cutoff=residence_time_cutoff,
         update_center_and_zoom=update_center_and_zoom,
     )
@@ -296,56 +309,108 @@ def update_footprint_map(
             f'on <b>{pd.Timestamp(curr_time).strftime("%Y-%m-%d %H:%M")}</b> as a receptor'
     fig['layout']['title'] = title
 
-    return fig
+    if footprint_rendering.FOOTPRINT_MAP_SOURCE == 'client':
+        flight_id, profile = get_flight_id_and_profile_by_airport_and_profile_idx(airport_code, profile_idx)
+        footprint_grid = footprint_rendering.get_footprint_grid(flight_id, profile, vertical_layer)
+    else:
+        footprint_grid = dash.no_update
 
+    return fig, footprint_grid
 
-@callback_with_exc_handling(
-    Output(CO_GRAPH_ID, 'figure'),
-    Input(AIRPORT_SELECT_ID, 'value'),
-    Input(VERTICAL_LAYER_RADIO_ID, 'value'),
-    Input(EMISSION_INVENTORY_CHECKLIST_ID, 'value'),
-    Input(EMISSION_REGION_SELECT_ID, 'value'),
-    Input(CURRENT_PROFILE_IDX_BY_AIRPORT_STORE_ID, 'data'),
-    Input(DATE_FROM_ID, 'value'),
-    Input(DATE_TO_ID, 'value'),
-)
-@log_exception
-def update_CO_fig(
-        airport_code, vertical_layer, emission_inventory, emission_region, current_profile_idx_by_airport,
-        date_from, date_to
-):
-    if not airport_code:
-        raise dash.exceptions.PreventUpdate
 
-    emission_inventory = sorted(emission_inventory)
+if footprint_rendering.FOOTPRINT_MAP_SOURCE == 'client':
+    # see assets/footprint_client_rendering.js
+    dash.clientside_callback(
+        ClientsideFunction(namespace='footprint', function_name='render_footprint'),
+        Output(FOOTPRINT_MAP_GRAPH_ID, 'figure', allow_duplicate=True),
+        Input(FOOTPRINT_GRID_STORE_ID, 'data'),
+        Input(RESIDENCE_TIME_SCALE_RADIO_ID, 'value'),
+        Input(RESIDENCE_TIME_CUTOFF_RADIO_ID, 'value'),
+        State(FOOTPRINT_MAP_GRAPH_ID, 'figure'),
+        prevent_initial_call=True,
+    )
 
-    CO_ts = get_CO_ts(airport_code, date_from=date_from, date_to=date_to)
-    CO_ts = CO_ts\
-        .sel({'layer': vertical_layer, 'emission_inventory': emission_inventory, 'region': emission_region}, drop=True)\
-        .assign_coords({'customdata': CO_ts['profile_idx_for_airport']})\
-        .swap_dims({'profile_idx': 'time'})
 
-    CO_ser = {}
-    for lvl in [2, 1]:
-        _CO_da = CO_ts['CO_mean'].where(CO_ts['CO_processing_level'] == lvl, drop=True)
-        CO_ser[lvl] = (
-            helper.insert_nan_into_timeseries_gaps(_CO_da.to_series()),
-            helper.insert_nan_into_timeseries_gaps(_CO_da['customdata'].to_series())
-        )
+def _get_CO_series(
+        airport_code, vertical_layer, emission_inventory, emission_region, date_from, date_to, window=None
+):
+    """
+    :param window: None or tuple (time_from, time_to); the resolution of the series is chosen so that
+    the time window (or else the period [date_from, date_to]) is not too long (see get_CO_ts_resolution)
+    :return: tuple (CO_ser, SOFTIO_ser); dicts of tuples (series, customdata) by processing level
+    and by emission inventory, resp., with nan's inserted into time gaps; if there is more than one emission
+    inventory, SOFTIO_ser['ALL'] is their total
+    """
+    resolution = get_CO_ts_resolution(airport_code, *(window or (date_from, date_to)))
+    CO_ts = get_CO_ts(airport_code, date_from=date_from, date_to=date_to, resolution=resolution)
+    gap = CO_TS_GAP_BY_RESOLUTION[resolution]
+    CO_ts = CO_ts.sel(
+        {'layer': vertical_layer, 'emission_inventory': emission_inventory, 'region': emission_region}, drop=True
+    )
+    time = CO_ts['time'].values
+    customdata = CO_ts['profile_idx_for_airport'].values
+    CO_mean = CO_ts['CO_mean'].values
+    CO_processing_level = CO_ts['CO_processing_level'].values
 
-    SOFTIO_ser = {}
-    for ei in emission_inventory:
-        _SOFTIO_da = CO_ts['CO_contrib_mean'].sel({'emission_inventory': ei}, drop=True)
-        SOFTIO_ser[ei] = (
-            helper.insert_nan_into_timeseries_gaps(_SOFTIO_da.to_series()),
-            helper.insert_nan_into_timeseries_gaps(_SOFTIO_da['customdata'].to_series())
-        )
+    SOFTIO_block = CO_ts['CO_contrib_mean'].transpose('profile_idx', 'emission_inventory').values.astype('f8')
+    SOFTIO_columns = list(emission_inventory)
+    if len(emission_inventory) > 1:
+        SOFTIO_block = np.concatenate([SOFTIO_block, SOFTIO_block.sum(axis=1, keepdims=True)], axis=1)
+        SOFTIO_columns.append('ALL')
+
+    # all series in one pass: IAGOS CO of each processing level and SOFT-IO (all profiles), each with its gaps
+    levels = [2, 1]
+    series = helper.insert_nan_into_gaps(
+        time,
+        [customdata, CO_mean, SOFTIO_block],
+        gap=gap,
+        rows=[CO_processing_level == lvl for lvl in levels] + [np.ones(len(time), dtype=bool)],
+    )
 
-    nrows = 2 if len(SOFTIO_ser) > 0 else 1
-    fig = make_subplots(rows=nrows, cols=1, shared_xaxes=True, vertical_spacing=0.02) #vertical_spacing=0.3)
+    CO_ser = {}
+    for lvl, (_time, (_customdata, _CO_mean, _)) in zip(levels, series):
+        _time = pd.DatetimeIndex(_time)
+        CO_ser[lvl] = (pd.Series(_CO_mean, index=_time), pd.Series(_customdata, index=_time))
 
-    # add traces with IAGOS CO
+    SOFTIO_ser = {}
+    _time, (_customdata, _, SOFTIO_block) = series[-1]
+    _time = pd.DatetimeIndex(_time)
+    _customdata = pd.Series(_customdata, index=_time)
+    for i, ei in enumerate(SOFTIO_columns):
+        SOFTIO_ser[ei] = (pd.Series(SOFTIO_block[:, i], index=_time), _customdata)
+
+    return CO_ser, SOFTIO_ser
+
+
+def _downsample(ser, customdata, window):
+    idx = helper.get_downsampling_indices(ser, CO_TS_MAX_POINTS, window=window)
+    return ser.iloc[idx], customdata.iloc[idx]
+
+
+def _get_x_range_from_relayout(relayout_data):
+    """
+    :return: tuple (changed, x_range); x_range is a tuple (time_from, time_to) if the time axis was zoomed
+    or panned, or None if it was reset
+    """
+    if not relayout_data:
+        return False, None
+    for k, v in relayout_data.items():
+        axis, _, prop = k.partition('.')
+        if not axis.startswith('xaxis'):
+            continue
+        if prop == 'autorange':
+            return True, None
+        elif prop == 'range':
+            return True, tuple(v)
+        elif prop == 'range[0]' and f'{axis}.range[1]' in relayout_data:
+            return True, (v, relayout_data[f'{axis}.range[1]'])
+    return False, None
+
+
+def _get_IAGOS_CO_traces(CO_ser, window=None):
+    traces = []
     for lvl, (ser, customdata) in CO_ser.items():
+        ser, customdata = _downsample(ser, customdata, window)
         if lvl == 2:
             color = 'rgba(0, 0, 0, 1)'
         else:
@@ -367,12 +432,14 @@ def update_CO_fig(
             marker={'color': color, 'size': 5},
             line={'color': color, 'width': 1},
         )
+        traces.append(trace)
+    return traces
 
-        fig.add_trace(trace, row=1, col=1)
 
-    # add traces with SOFT-IO
+def _get_SOFTIO_traces(SOFTIO_ser, emission_inventory, emission_region, window=None):
+    traces = []
     for ei in emission_inventory:
-        ser, customdata = SOFTIO_ser[ei]
+        ser, customdata = _downsample(*SOFTIO_ser[ei], window)
 
         if USE_GL and len(ser) > USE_GL:
             go_scatter = go.Scattergl
@@ -399,18 +466,12 @@ def update_CO_fig(
             marker={'size': 3},
             **trace_kwargs
         )
-
-        fig.add_trace(trace, row=2, col=1)
+        traces.append(trace)
 
     # SOFT-IO total
     if len(emission_inventory) > 1:
-        emission_inventory_it = iter(emission_inventory)
-        ei = next(emission_inventory_it)
-        ser, customdata = SOFTIO_ser[ei]
-        for ei in emission_inventory_it:
-            ser2, customdata2 = SOFTIO_ser[ei]
-            ser = ser + ser2
-            customdata.update(customdata2)
+        ser, customdata = SOFTIO_ser['ALL']
+        ser, customdata = _downsample(ser, customdata, window)
 
         if USE_GL and len(ser) > USE_GL:
             go_scatter = go.Scattergl
@@ -429,7 +490,62 @@ def update_CO_fig(
             line={'color': color},
             marker={'size': 3, 'color': color},
         )
+        traces.append(trace)
+
+    return traces
+
+
+def _get_CO_fig_title(airport_code, vertical_layer):
+    return {
+        'text': f'CO measurements by IAGOS and modelled CO contributions by SOFT-IO (ppb)'
+                f'<br>over {airport_name_by_code[airport_code]} (<b>{airport_code}</b>), '
+                f'averaged in the <b>{vertical_layer}</b> layer',
+                #f'emission regions={", ".join(emission_region)}</sup>',
+    }
+
+
+def _get_current_time_shapes(airport_code, current_profile_idx_by_airport):
+    # vertical bar indicating a current time
+    if current_profile_idx_by_airport is None or airport_code not in current_profile_idx_by_airport:
+        return []
+    profile_idx = current_profile_idx_by_airport[airport_code]
+    curr_time = get_coords_by_airport_and_profile_idx(airport_code, profile_idx)['time'].item()
+    curr_time = pd.Timestamp(curr_time)
+    return [
+        {
+            'line': {'color': 'grey', 'width': 1, 'dash': 'dot'},
+            'type': 'line',
+            'x0': curr_time,
+            'x1': curr_time,
+            'xref': 'x',
+            'y0': 0,
+            'y1': 1,
+            'yref': 'paper',
+        }
+    ]
+
+
+def _get_CO_fig(
+        airport_code, vertical_layer, emission_inventory, emission_region, current_profile_idx_by_airport,
+        date_from, date_to, window=None
+):
+    """
+    :param window: None or tuple (time_from, time_to); the time window shown, in which traces are downsampled
+    less (see helper.get_downsampling_indices)
+    """
+    CO_ser, SOFTIO_ser = _get_CO_series(
+        airport_code, vertical_layer, emission_inventory, emission_region, date_from, date_to, window=window
+    )
+
+    nrows = 2 if len(SOFTIO_ser) > 0 else 1
+    fig = make_subplots(rows=nrows, cols=1, shared_xaxes=True, vertical_spacing=0.02) #vertical_spacing=0.3)
+
+    # add traces with IAGOS CO
+    for trace in _get_IAGOS_CO_traces(CO_ser, window=window):
+        fig.add_trace(trace, row=1, col=1)
 
+    # add traces with SOFT-IO
+    for trace in _get_SOFTIO_traces(SOFTIO_ser, emission_inventory, emission_region, window=window):
         fig.add_trace(trace, row=2, col=1)
 
     # fig.update_xaxes({'rangeslider': {'visible': True}, 'type': 'date'}, row=1)
@@ -443,12 +559,7 @@ def update_CO_fig(
     )
 
     fig.update_layout(
-        title={
-            'text': f'CO measurements by IAGOS and modelled CO contributions by SOFT-IO (ppb)'
-                    f'<br>over {airport_name_by_code[airport_code]} (<b>{airport_code}</b>), '
-                    f'averaged in the <b>{vertical_layer}</b> layer',
-                    #f'emission regions={", ".join(emission_region)}</sup>',
-        },
+        title=_get_CO_fig_title(airport_code, vertical_layer),
         uirevision=airport_code,
         autosize=False,
         margin={'autoexpand': True, 'r': 0, 't': 60, 'l': 0, 'b': 0},
@@ -459,29 +570,103 @@ def update_CO_fig(
         # modebar={'orientation': 'v'}
     )
 
-    # draw vertical bar indicating a current time
-    if current_profile_idx_by_airport is not None and airport_code in current_profile_idx_by_airport:
-        profile_idx = current_profile_idx_by_airport[airport_code]
-        curr_time = get_coords_by_airport_and_profile_idx(airport_code, profile_idx)['time'].item()
-        curr_time = pd.Timestamp(curr_time)
-        fig['layout']['shapes'] = [
-            {
-                'line': {'color': 'grey', 'width': 1, 'dash': 'dot'},
-                'type': 'line',
-                'x0': curr_time,
-                'x1': curr_time,
-                'xref': 'x',
-                'y0': 0,
-                'y1': 1,
-                'yref': 'paper',
-            }
-        ]
+    fig['layout']['shapes'] = _get_current_time_shapes(airport_code, current_profile_idx_by_airport)
 
     # print(fig)
 
     return add_watermark(fig)
 
 
+def _patch_CO_fig(
+        drawn, airport_code, vertical_layer, emission_inventory, emission_region, current_profile_idx_by_airport,
+        date_from, date_to, window=None
+):
+    """
+    Patch of the CO figure drawn with the parameters drawn (see update_CO_fig): the current time bar, and only
+    if the layer, the region, emission inventories or the time window changed, the affected traces.
+    """
+    fig = Patch()
+    layer_changed = vertical_layer != drawn['vertical_layer']
+    window_changed = window != drawn['window']
+    if layer_changed or window_changed or emission_region != drawn['emission_region'] or \
+            emission_inventory != drawn['emission_inventory']:
+        CO_ser, SOFTIO_ser = _get_CO_series(
+            airport_code, vertical_layer, emission_inventory, emission_region, date_from, date_to, window=window
+        )
+        if layer_changed or window_changed:
+            for i, trace in enumerate(_get_IAGOS_CO_traces(CO_ser, window=window)):
+                fig['data'][i] = trace.update(xaxis='x', yaxis='y')
+        if layer_changed:
+            fig['layout']['title'] = _get_CO_fig_title(airport_code, vertical_layer)
+
+        # SOFT-IO traces follow the 2 IAGOS ones; the total is there if more than one inventory
+        ntraces_drawn = len(drawn['emission_inventory'])
+        if ntraces_drawn > 1:
+            ntraces_drawn += 1
+        for i in reversed(range(2, 2 + ntraces_drawn)):
+            del fig['data'][i]
+        fig['data'].extend([
+            trace.update(xaxis='x2', yaxis='y2')
+            for trace in _get_SOFTIO_traces(SOFTIO_ser, emission_inventory, emission_region, window=window)
+        ])
+
+    fig['layout']['shapes'] = _get_current_time_shapes(airport_code, current_profile_idx_by_airport)
+    return fig
+
+
+@callback_with_exc_handling(
+    Output(CO_GRAPH_ID, 'figure'),
+    Output(CO_GRAPH_STATE_STORE_ID, 'data'),
+    Input(AIRPORT_SELECT_ID, 'value'),
+    Input(VERTICAL_LAYER_RADIO_ID, 'value'),
+    Input(EMISSION_INVENTORY_CHECKLIST_ID, 'value'),
+    Input(EMISSION_REGION_SELECT_ID, 'value'),
+    Input(CURRENT_PROFILE_IDX_BY_AIRPORT_STORE_ID, 'data'),
+    Input(DATE_FROM_ID, 'value'),
+    Input(DATE_TO_ID, 'value'),
+    Input(CO_GRAPH_ID, 'relayoutData'),
+    State(CO_GRAPH_STATE_STORE_ID, 'data'),
+)
+@log_exception
+def update_CO_fig(
+        airport_code, vertical_layer, emission_inventory, emission_region, current_profile_idx_by_airport,
+        date_from, date_to, relayout_data, drawn
+):
+    if not airport_code:
+        raise dash.exceptions.PreventUpdate
+
+    dash_ctx = list(dash.ctx.triggered_prop_ids.values())
+
+    # the time window shown; traces are re-queried with more points in it when the graph is zoomed or panned
+    window = drawn['window'] if drawn is not None and drawn['airport_code'] == airport_code else None
+    if CO_GRAPH_ID in dash_ctx:
+        x_range_changed, x_range = _get_x_range_from_relayout(relayout_data)
+        if x_range_changed:
+            window = list(x_range) if x_range is not None else None
+        elif len(dash_ctx) == 1:
+            raise dash.exceptions.PreventUpdate
+
+    emission_inventory = sorted(emission_inventory)
+    params = airport_code, vertical_layer, emission_inventory, emission_region, current_profile_idx_by_airport, \
+        date_from, date_to, window
+    # parameters of the figure in the browser; the most frequent change, a step in time, moves the time bar only
+    new_drawn = {
+        'airport_code': airport_code,
+        'vertical_layer': vertical_layer,
+        'emission_inventory': emission_inventory,
+        'emission_region': emission_region,
+        'date_from': date_from,
+        'date_to': date_to,
+        'window': window,
+    }
+
+    # a full rebuild if the airport or dates changed, or if the number of subplots changes
+    if drawn is None or any(drawn[k] != new_drawn[k] for k in ['airport_code', 'date_from', 'date_to']) or \
+            bool(drawn['emission_inventory']) != bool(emission_inventory):
+        return _get_CO_fig(*params), new_drawn
+    return _patch_CO_fig(drawn, *params), new_drawn
+
+
 @callback_with_exc_handling(
     Output(PROFILE_GRAPH_ID, 'figure'),
     Input(AIRPORT_SELECT_ID, 'value'),
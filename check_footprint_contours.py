@@ -0,0 +1,77 @@
+import sys
+import argparse
+import numpy as np
+import xarray as xr
+
+from footprint_utils import footprint_viz
+from footprint_data_access import get_residence_time_for_profile
+from prerender_footprints import get_profiles
+
+
+def get_degenerate_footprints():
+    """
+    :return: dict of footprints with no values above any cutoff, by name
+    """
+    lon = np.arange(-180, 180, 0.5)
+    lat = np.arange(-89.75, 90, 0.5)
+    coords = {'longitude': lon, 'latitude': lat}
+    dims = ('latitude', 'longitude')
+    return {
+        'all nan': xr.DataArray(np.full((len(lat), len(lon)), np.nan, dtype='f4'), coords=coords, dims=dims),
+        'all zero': xr.DataArray(np.zeros((len(lat), len(lon)), dtype='f4'), coords=coords, dims=dims),
+    }
+
+
+def check(da, residence_time_cutoff, expect_layers):
+    """
+    Checks that footprint_viz.get_footprint_contours renders a footprint for all color scales, with polygons
+    if and only if expect_layers.
+    :return: list of str; errors
+    """
+    errors = []
+    for color_scale_transform in footprint_viz.COLOR_SCALE_TRANSFORMS:
+        try:
+            layers, coordinates, colorscale_trace = footprint_viz.get_footprint_contours(
+                da, color_scale_transform, residence_time_cutoff
+            )
+        except Exception as e:
+            errors.append(f'{color_scale_transform}, cutoff={residence_time_cutoff}: {e!r}')
+            continue
+        if bool(layers) != expect_layers:
+            errors.append(f'{color_scale_transform}, cutoff={residence_time_cutoff}: {len(layers)} layers')
+        if len(coordinates) != 4:
+            errors.append(f'{color_scale_transform}, cutoff={residence_time_cutoff}: coordinates={coordinates}')
+    return errors
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Check that footprint contours (footprint_viz.get_footprint_contours) are rendered '
+                    'for footprints drawn at random and for footprints with no values (all nan or zero)'
+    )
+    parser.add_argument('--nsamples', type=int, default=20, help='number of profiles')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    errors = []
+    for name, da in get_degenerate_footprints().items():
+        for residence_time_cutoff in [3e-4, 3e-3, 3e-2]:
+            errors.extend(f'{name}: {e}' for e in check(da, residence_time_cutoff, expect_layers=False))
+
+    profiles = get_profiles(top=None, date_from=None, date_to=None)
+    rng = np.random.default_rng(args.seed)
+    n = 0
+    for i in rng.choice(len(profiles), size=min(args.nsamples, len(profiles)), replace=False):
+        footprint = get_residence_time_for_profile(*profiles[i])
+        if footprint is None:
+            continue
+        for layer in footprint['layer'].values:
+            da = footprint.sel({'layer': layer})
+            errors.extend(
+                f'{profiles[i]}, {layer}: {e}' for e in check(da, 3e-3, expect_layers=bool(da.max() > 0))
+            )
+            n += 1
+
+    print(f'{n} footprints and {len(get_degenerate_footprints())} degenerate ones checked; {len(errors)} errors')
+    if errors:
+        sys.exit('\n'.join(errors))
@@ -0,0 +1,121 @@
+import sys
+import time
+import argparse
+import numpy as np
+import xarray as xr
+
+from footprint_utils import footprint_viz
+from layout import RESIDENCE_TIME_CUTOFFS
+
+
+def get_synthetic_footprints(rng, n, dlon=1., dlat=1.):
+    """
+    Footprints with no data needed: a few gaussian blobs of random positions and sizes on a regular global grid
+    (as the one of footprints, with cell centers at +-dlon / 2, +-dlat / 2 off the edges).
+    :return: xarray DataArray with dimensions (sample, lat, lon), float16
+    """
+    lon = np.arange(-180 + dlon / 2, 180, dlon)
+    lat = np.arange(-90 + dlat / 2, 90, dlat)
+    lon2d, lat2d = np.meshgrid(lon, lat)
+    values = np.zeros((n, len(lat), len(lon)))
+    for i in range(n):
+        for _ in range(rng.integers(1, 4)):
+            lon0, lat0 = rng.uniform(-180, 180), rng.uniform(-80, 80)
+            sigma = rng.uniform(1, 10)
+            # distance in lon wraps around the dateline
+            dx = (lon2d - lon0 + 180) % 360 - 180
+            values[i] += rng.uniform(0.1, 1) * np.exp(-0.5 * ((dx / sigma) ** 2 + ((lat2d - lat0) / sigma) ** 2))
+    return xr.DataArray(
+        values.astype('f2'), dims=('sample', 'lat', 'lon'), coords={'lon': lon, 'lat': lat}, name='residence_time'
+    )
+
+
+def compare(da, residence_time_cutoff):
+    """
+    Compares footprint_viz.remap_to_mercator against footprint_viz.regrid (datashader) for a footprint, both of
+    the footprint trimmed to the cutoff but not cropped. Then checks that the remap of the cropped footprint
+    (with the grid of the uncropped one, as in footprint_viz.get_footprint_viz) is a window of the former.
+    :return: tuple (max error relative to the max of the footprint, fraction of pixels with nan in one output only,
+    regrid time, remap time)
+    """
+    lon, lat = da.geo.get_lon_lat_label()
+    da = da.sel({lat: slice(-85, 85)}).astype('f4')
+    grid = da[lon].values, da[lat].values
+    da_trimmed = da.where(da > da.max() * residence_time_cutoff)
+
+    start = time.perf_counter()
+    expected, expected_coordinates = footprint_viz.regrid(
+        da_trimmed, upsampling_resol_factor=(10, 10), is_proj_rectilinear=True
+    )
+    regrid_time = time.perf_counter() - start
+    actual, actual_coordinates = footprint_viz.remap_to_mercator(da_trimmed, upsampling_resol_factor=(10, 10))
+
+    assert expected.shape == actual.shape, (expected.shape, actual.shape)
+    assert np.allclose(expected['x'], actual['x']) and np.allclose(expected['y'], actual['y'])
+    assert np.allclose(np.array(expected_coordinates, dtype='f8'), np.array(actual_coordinates, dtype='f8'))
+
+    start = time.perf_counter()
+    cropped, _ = footprint_viz.remap_to_mercator(
+        footprint_viz.trim_small_values(da, threshold=residence_time_cutoff),
+        upsampling_resol_factor=(10, 10),
+        grid=grid,
+    )
+    remap_time = time.perf_counter() - start
+    window = actual.sel({'x': cropped['x'], 'y': cropped['y']})
+    assert np.array_equal(window.values, cropped.values, equal_nan=True), 'cropped remap differs from the full one'
+    outside = actual.copy()
+    outside.loc[{'x': cropped['x'], 'y': cropped['y']}] = np.nan
+    assert np.isnan(outside.values).all(), 'cropped remap misses some pixels of the full one'
+
+    expected, actual = expected.values, actual.values
+    nan_mismatch = np.mean(np.isnan(expected) != np.isnan(actual))
+    both = ~np.isnan(expected) & ~np.isnan(actual)
+    err = np.abs(expected[both] - actual[both]).max(initial=0) / np.nanmax(expected)
+    return err, nan_mismatch, regrid_time, remap_time
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Check that the precomputed Mercator remap (footprint_viz.remap_to_mercator) reproduces '
+                    'the datashader regridding (footprint_viz.regrid) on footprints drawn at random'
+    )
+    parser.add_argument(
+        '--synthetic', action='store_true',
+        help='use synthetic footprints on a 1 deg grid instead of the ones of profiles (no data needed)'
+    )
+    parser.add_argument('--nsamples', type=int, default=20, help='number of profiles')
+    parser.add_argument('--rtol', type=float, default=1e-5, help='tolerance relative to the max of a footprint')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    if args.synthetic:
+        synthetic = get_synthetic_footprints(rng, args.nsamples)
+        footprints = (synthetic.sel({'sample': [i]}).rename({'sample': 'layer'}) for i in range(args.nsamples))
+    else:
+        from footprint_data_access import get_residence_time_for_profile
+        from prerender_footprints import get_profiles
+
+        profiles = get_profiles(top=None, date_from=None, date_to=None)
+        footprints = (
+            get_residence_time_for_profile(*profiles[i])
+            for i in rng.choice(len(profiles), size=min(args.nsamples, len(profiles)), replace=False)
+        )
+
+    max_err, max_nan_mismatch, regrid_time, remap_time, n = 0, 0, 0, 0, 0
+    for footprint in footprints:
+        if footprint is None:
+            continue
+        for layer in footprint['layer'].values:
+            for residence_time_cutoff in RESIDENCE_TIME_CUTOFFS:
+                err, nan_mismatch, _regrid_time, _remap_time = compare(footprint.sel({'layer': layer}), residence_time_cutoff)
+                max_err = max(max_err, err)
+                max_nan_mismatch = max(max_nan_mismatch, nan_mismatch)
+                regrid_time += _regrid_time
+                remap_time += _remap_time
+                n += 1
+
+    print(f'{n} footprints; max relative error: {max_err:.2e}; max fraction of nan mismatch: {max_nan_mismatch:.2e}')
+    print(f'mean time: {regrid_time / max(n, 1) * 1e3:.1f}ms (regrid), {remap_time / max(n, 1) * 1e3:.1f}ms (remap)')
+    if max_err > args.rtol or max_nan_mismatch > 0:
+        sys.exit('remap does not match regrid')
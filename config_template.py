@@ -18,3 +18,56 @@ APP_LOGS = f'{APP_LOG_DIR}/log.txt'
 APP_REQUESTS_LOG = f'{APP_LOG_DIR}/requests.log'
 
 APP_DATA_DIR = '/home/user/my-app/data'
+
+# optional; directory with a snapshot of the data structures derived from APP_DATA_DIR/CO_data.nc
+# (default: APP_DATA_DIR/data_access_snapshot); it must be writable by the application or built with
+# python gen_data_access_snapshot.py
+DATA_ACCESS_SNAPSHOT_DIR = f'{APP_DATA_DIR}/data_access_snapshot'
+
+# optional; if set, COprofile data and climatology are preloaded into this directory by preload_shared_data.py
+# (called by gunicorn.conf.py before workers start) and memory-mapped by all workers;
+# use a tmpfs directory so that the data reside in shared memory
+SHARED_DATA_DIR = '/dev/shm/aaft'
+
+# optional; a directory of the cache of decoded footprint chunks, shared by all workers on a host
+# (None or not set disables the cache); FOOTPRINT_CHUNK_CACHE_SIZE is its size limit in bytes
+FOOTPRINT_CHUNK_CACHE_DIR = '/home/user/my-app/cache/footprint_chunks'
+FOOTPRINT_CHUNK_CACHE_SIZE = 2 * 1024 ** 3
+
+# optional; max number of points of a CO time series read at the resolution of profiles; longer series are read from
+# weekly or monthly aggregates, if built by python gen_CO_aggregates.py (default 5000)
+CO_TS_MAX_PROFILES = 5000
+
+# optional; 'dense' (default), 'sparse' (requires python gen_sparse_footprints.py)
+# or 'quantized' (requires python gen_quantized_footprints.py)
+FOOTPRINT_STORE = 'dense'
+
+# optional; a directory of rendered footprint images served by the application (None or not set disables it);
+# it can be filled in advance with python prerender_footprints.py
+FOOTPRINT_RENDER_CACHE_DIR = '/home/user/my-app/cache/footprint_renderings'
+
+# optional; format of footprint images: 'png' (default) or 'webp' (lossless; smaller)
+FOOTPRINT_IMG_FORMAT = 'png'
+
+# optional; 'image' (default; one image per footprint, which can be pre-rendered), 'tiles' (XYZ tiles rendered
+# on demand), 'client' (footprints rendered in the browser, which applies the residence time scale and cutoff
+# without a request to the server) or 'contours' (filled contours as GeoJSON; no image requests);
+# FOOTPRINT_TILE_CACHE_SIZE is the number of tiles kept in memory by each worker
+FOOTPRINT_MAP_SOURCE = 'image'
+FOOTPRINT_TILE_CACHE_SIZE = 4096
+
+# optional; a directory of the cache of footprint map layers, shared by all workers on a host and kept across
+# restarts (None or not set: each worker keeps recent ones in memory); FOOTPRINT_MAP_CACHE_SIZE is its size limit
+# in bytes
+FOOTPRINT_MAP_CACHE_DIR = '/home/user/my-app/cache/footprint_map_layers'
+FOOTPRINT_MAP_CACHE_SIZE = 2 ** 30
+
+# optional; after each step in time, the footprint maps and CO profiles of the profiles up to PREFETCH_DISTANCE steps
+# (and one big step) away are prepared in the background by PREFETCH_MAX_WORKERS threads of each worker
+# (PREFETCH_DISTANCE = 0 disables it)
+PREFETCH_DISTANCE = 2
+PREFETCH_MAX_WORKERS = 2
+
+# optional; each worker logs its statistics (prefetching, caches) every WORKER_STATS_LOG_INTERVAL seconds
+# (None or 0 disables it)
+WORKER_STATS_LOG_INTERVAL = 600
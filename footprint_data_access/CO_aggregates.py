@@ -0,0 +1,111 @@
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+
+# pandas period frequency by resolution
+_FREQ_BY_RESOLUTION = {'day': 'D', 'week': 'W', 'month': 'M'}
+RESOLUTIONS = list(_FREQ_BY_RESOLUTION)
+# variables aggregated (mean, min, max and count of non-nan values over the profiles of a bin)
+AGGREGATED_VARS = ['CO_mean', 'CO_contrib_mean']
+
+
+def _reduce_bins(a, bin_start):
+    """
+    :param a: numpy array with profiles along the last axis, sorted by bins
+    :param bin_start: numpy 1d-array; the first profile of each bin
+    :return: tuple (mean, min, max, count) of numpy arrays with bins along the last axis; nan's are ignored
+    """
+    valid = ~np.isnan(a)
+    count = np.add.reduceat(valid, bin_start, axis=-1)
+    total = np.add.reduceat(np.where(valid, a, 0), bin_start, axis=-1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(count > 0, total / count, np.nan)
+    return mean, np.fmin.reduceat(a, bin_start, axis=-1), np.fmax.reduceat(a, bin_start, axis=-1), count
+
+
+def compute_CO_aggregates(CO_ds, resolution):
+    """
+    Aggregates CO profiles by airport and time period: the mean, min, max and count of each of AGGREGATED_VARS.
+    The bins are along the dimension 'bin' (only the non-empty ones), sorted by airport code and time.
+    :param CO_ds: xarray Dataset with the dimension 'profile_idx' and the coordinates 'code' and 'time'
+    (see data_access._load_CO_data)
+    :param resolution: str; one of RESOLUTIONS
+    :return: xarray Dataset; the coordinate 'time' is the mean time of profiles of a bin, 'period_start' is
+    the start of the period, 'first_profile_idx' is the profile_idx of the first profile of a bin;
+    CO_processing_level of a bin is the lowest one of its profiles
+    """
+    freq = _FREQ_BY_RESOLUTION[resolution]
+    code = CO_ds['code'].values.astype(str)
+    time = CO_ds['time'].values
+    order = np.lexsort((time, code))
+    code, time = code[order], time[order]
+    period_start = pd.DatetimeIndex(time).to_period(freq).start_time.values
+
+    new_bin = np.ones(len(order), dtype=bool)
+    new_bin[1:] = (code[1:] != code[:-1]) | (period_start[1:] != period_start[:-1])
+    bin_start, = np.nonzero(new_bin)
+    nprofiles = np.diff(np.append(bin_start, len(order)))
+    bin_time = (np.add.reduceat(time.astype('i8'), bin_start) // nprofiles).astype('M8[ns]')
+
+    data_vars = {
+        'nprofiles': ('bin', nprofiles.astype('i4')),
+        'CO_processing_level': (
+            'bin', np.minimum.reduceat(CO_ds['CO_processing_level'].values[order], bin_start).astype('i1')
+        ),
+    }
+    for var in AGGREGATED_VARS:
+        da = CO_ds[var].transpose(..., 'profile_idx')
+        dims = da.dims[:-1] + ('bin', )
+        mean, _min, _max, count = _reduce_bins(da.values[..., order], bin_start)
+        data_vars.update({
+            var: (dims, mean.astype('f4')),
+            f'{var}_min': (dims, _min.astype('f4')),
+            f'{var}_max': (dims, _max.astype('f4')),
+            f'{var}_count': (dims, count.astype('i4')),
+        })
+
+    coords = {dim: CO_ds[dim].values for dim in ['layer', 'emission_inventory', 'region']}
+    coords.update({
+        'code': ('bin', code[bin_start]),
+        'time': ('bin', bin_time),
+        'period_start': ('bin', period_start[bin_start]),
+        'first_profile_idx': ('bin', CO_ds['profile_idx'].values[order][bin_start]),
+    })
+    return xr.Dataset(data_vars, coords=coords, attrs={'resolution': resolution})
+
+
+def write_CO_aggregates(CO_ds, path, resolutions, source_signature):
+    """
+    Writes CO aggregates at several resolutions into a netCDF file, one group per resolution.
+    :param path: str or pathlib.Path
+    :param resolutions: list of str
+    :param source_signature: dict; signature of CO_data.nc (see snapshot.get_file_signature), by which
+    the aggregates are validated when read
+    """
+    mode = 'w'
+    for resolution in resolutions:
+        ds = compute_CO_aggregates(CO_ds, resolution)
+        ds.attrs.update({f'source_{k}': v for k, v in source_signature.items()})
+        ds.to_netcdf(path, mode=mode, group=resolution, engine='h5netcdf')
+        mode = 'a'
+
+
+def read_CO_aggregates(path, resolution):
+    """
+    :return: tuple (ds, bin_slice_by_airport, source_signature), where bin_slice_by_airport is a dict of slices
+    of the dimension 'bin'; or None if the resolution is not in the file
+    """
+    try:
+        ds = xr.load_dataset(path, group=resolution, engine='h5netcdf')
+    except OSError:
+        return None
+    code = ds['code'].values.astype(str)
+    airport_codes, airport_offsets = np.unique(code, return_index=True)
+    airport_offsets = np.append(airport_offsets, len(code))
+    bin_slice_by_airport = {
+        airport_code: slice(start, stop)
+        for airport_code, start, stop in zip(airport_codes, airport_offsets[:-1], airport_offsets[1:])
+    }
+    source_signature = {k[len('source_'):]: v for k, v in ds.attrs.items() if k.startswith('source_')}
+    return ds, bin_slice_by_airport, source_signature
@@ -1,11 +1,17 @@
 from .data_access import (
     get_iagos_airports,
     get_residence_time,
+    get_residence_time_for_profile,
+    get_footprint_chunk_cache_stats,
+    get_footprint_store_signature,
     get_coords_by_airport_and_profile_idx,
     get_flight_id_and_profile_by_airport_and_profile_idx,
     airports_df,
     airport_name_by_code,
     get_CO_ts,
+    get_CO_time_range,
+    get_CO_ts_resolution,
     get_COprofile,
     get_COprofile_climatology,
+    get_memory_report,
 )
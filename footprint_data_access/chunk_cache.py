@@ -0,0 +1,87 @@
+import json
+import hashlib
+from collections.abc import MutableMapping
+import numcodecs
+from numcodecs.compat import ensure_bytes
+
+
+class DecodedChunkCacheStore(MutableMapping):
+    """
+    A read-only zarr (v2) store which wraps another store and keeps decoded (i.e. decompressed) chunks in a cache,
+    e.g. diskcache.Cache shared by all processes on a host. Array metadata are presented with compressor=None and
+    filters=None, so that zarr takes the decoded chunks from the cache as they are. Arrays of object dtype are
+    passed through without caching.
+    """
+    def __init__(self, store, cache, store_id):
+        """
+        :param store: a zarr store (a MutableMapping), e.g. zarr.storage.DirectoryStore
+        :param cache: a MutableMapping-like object with get and set methods, e.g. diskcache.Cache
+        :param store_id: str; identifies the store within the cache, e.g. its path
+        """
+        self._store = store
+        self._cache = cache
+        self._store_id = store_id
+        self._codecs_by_array = {}
+
+    def _set_codecs(self, array_path, meta):
+        if meta['dtype'] == '|O':
+            self._codecs_by_array[array_path] = None
+            return meta
+        compressor = numcodecs.get_codec(meta['compressor']) if meta.get('compressor') else None
+        filters = [numcodecs.get_codec(f) for f in meta['filters']] if meta.get('filters') else []
+        # the digest changes when the array is rewritten (e.g. repacked with other chunks or compressor)
+        digest = hashlib.sha1(json.dumps(meta, sort_keys=True).encode()).hexdigest()
+        self._codecs_by_array[array_path] = (compressor, filters, digest)
+        return dict(meta, compressor=None, filters=None)
+
+    def _get_codecs(self, array_path):
+        if array_path not in self._codecs_by_array:
+            zarray_key = f'{array_path}/.zarray' if array_path else '.zarray'
+            self._set_codecs(array_path, json.loads(self._store[zarray_key]))
+        return self._codecs_by_array[array_path]
+
+    def __getitem__(self, key):
+        array_path, _, name = key.rpartition('/')
+        if name == '.zarray':
+            meta = self._set_codecs(array_path, json.loads(self._store[key]))
+            return json.dumps(meta).encode()
+        elif name == '.zmetadata':
+            consolidated_meta = json.loads(self._store[key])
+            for meta_key, meta in consolidated_meta['metadata'].items():
+                meta_array_path, _, meta_name = meta_key.rpartition('/')
+                if meta_name == '.zarray':
+                    consolidated_meta['metadata'][meta_key] = self._set_codecs(meta_array_path, meta)
+            return json.dumps(consolidated_meta).encode()
+        elif name.startswith('.'):
+            return self._store[key]
+
+        codecs = self._get_codecs(array_path)
+        if codecs is None:
+            return self._store[key]
+        compressor, filters, digest = codecs
+        cache_key = f'{self._store_id}/{digest}/{key}'
+        chunk = self._cache.get(cache_key)
+        if chunk is None:
+            chunk = self._store[key]  # KeyError for a missing chunk is handled by zarr (fill value)
+            if compressor is not None:
+                chunk = compressor.decode(chunk)
+            for _filter in reversed(filters):
+                chunk = _filter.decode(chunk)
+            chunk = ensure_bytes(chunk)
+            self._cache.set(cache_key, chunk)
+        return chunk
+
+    def __contains__(self, key):
+        return key in self._store
+
+    def __iter__(self):
+        return iter(self._store)
+
+    def __len__(self):
+        return len(self._store)
+
+    def __setitem__(self, key, value):
+        raise PermissionError(f'{type(self).__name__} is read-only')
+
+    def __delitem__(self, key):
+        raise PermissionError(f'{type(self).__name__} is read-only')
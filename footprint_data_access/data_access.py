@@ -1,26 +1,60 @@
+import os
 import functools
 import pathlib
 import numpy as np
 import pandas as pd
 import xarray as xr
 
+import config
 from footprint_utils import helper
+from footprint_utils.single_flight import single_flight
+from footprint_data_access import snapshot, shared_data, CO_aggregates
+from footprint_data_access.chunk_cache import DecodedChunkCacheStore
+from footprint_data_access.sparse_footprint import SparseFootprints
+from footprint_data_access.quantized_footprint import QuantizedFootprints
 from log import log_exectime, logger
 from config import APP_DATA_DIR
 
 
 DATA_PATH = pathlib.Path(APP_DATA_DIR)
+SNAPSHOT_DIR = pathlib.Path(getattr(config, 'DATA_ACCESS_SNAPSHOT_DIR', DATA_PATH / 'data_access_snapshot'))
+# 'dense' (footprint_by_flight_id.zarr), 'sparse' (footprint_by_flight_id_sparse.zarr, see gen_sparse_footprints.py)
+# or 'quantized' (footprint_by_flight_id_quantized.zarr, see gen_quantized_footprints.py)
+FOOTPRINT_STORE = getattr(config, 'FOOTPRINT_STORE', 'dense')
+FOOTPRINT_CHUNK_CACHE_DIR = getattr(config, 'FOOTPRINT_CHUNK_CACHE_DIR', None)
+FOOTPRINT_CHUNK_CACHE_SIZE = getattr(config, 'FOOTPRINT_CHUNK_CACHE_SIZE', 2 ** 31)
+# get_CO_ts_resolution switches to aggregates (see gen_CO_aggregates.py) when a time series has more points
+CO_TS_MAX_PROFILES = getattr(config, 'CO_TS_MAX_PROFILES', 5000)
 
 _fp_da = None
+_fp_chunk_cache = None
+_snapshot = None
 
 CO_data_url = DATA_PATH / 'CO_data.nc'
 COprofile_data_url = DATA_PATH / 'COprofile_data.nc'
 COprofile_climat_data_url = DATA_PATH / 'COprofile_climat_data.nc'
 footprint_data_url = DATA_PATH / 'footprint_by_flight_id.zarr'
+sparse_footprint_data_url = DATA_PATH / 'footprint_by_flight_id_sparse.zarr'
+quantized_footprint_data_url = DATA_PATH / 'footprint_by_flight_id_quantized.zarr'
+CO_aggregates_url = DATA_PATH / 'CO_aggregates.nc'
 
+_snapshot_sources = {'CO_data': CO_data_url}
+# to be increased whenever the content of the data access snapshot changes
+_SNAPSHOT_CONTENT_VERSION = 2
+_shared_data_sources = {'COprofile_data': COprofile_data_url, 'COprofile_climat_data': COprofile_climat_data_url}
 
-_COprofile_ds = xr.open_dataset(COprofile_data_url, engine='h5netcdf')
-_COprofile_ds = _COprofile_ds.assign_coords({'height': helper.hasl_by_pressure(_COprofile_ds.air_press_AC)})
+
+def _open_COprofile_data(load=False):
+    open_dataset = xr.load_dataset if load else xr.open_dataset
+    _COprofile_ds = open_dataset(COprofile_data_url, engine='h5netcdf')
+    return _COprofile_ds.assign_coords({'height': helper.hasl_by_pressure(_COprofile_ds.air_press_AC)})
+
+
+_shared_datasets = shared_data.read_shared_data(_shared_data_sources)
+if _shared_datasets is not None:
+    _COprofile_ds = _shared_datasets['COprofile']
+else:
+    _COprofile_ds = _open_COprofile_data()
 
 
 def _valid_airport_code(code):
@@ -35,10 +69,8 @@ def _valid_airport_code(code):
     return valid_code
 
 
-@functools.lru_cache
 @log_exectime
-# TODO: _get_CO_data is called twice (first time due to imports, which is useless)
-def _get_CO_data():
+def _load_CO_data():
     _CO_ds = xr.load_dataset(CO_data_url, engine='h5netcdf')
     _CO_ds = _CO_ds.stack({'profile_idx': ('flight_id', 'profile')}, create_index=False)
     CO_filter = (_CO_ds['CO_count'] > 0).any('layer') & _valid_airport_code(_CO_ds['code'])
@@ -48,12 +80,48 @@ def _get_CO_data():
     return _CO_ds
 
 
+def _get_CO_data():
+    return _snapshot['datasets']['CO_data']
+
+
 @functools.cache
 def _get_airports_data():
-    return _get_CO_data().reset_coords()[['code', 'city', 'state', 'lon', 'lat', 'elevation', 'time']]
+    # sorted by time, so that apply_time_filter can use binary search
+    return _get_CO_data().reset_coords()[['code', 'city', 'state', 'lon', 'lat', 'elevation', 'time']].sortby('time')
+
+
+def get_CO_time_range():
+    """
+    :return: tuple (time_min, time_max) of pandas Timestamp; the period of all profiles
+    """
+    time = _get_airports_data()['time'].values
+    return pd.Timestamp(time[0]), pd.Timestamp(time[-1])
+
+
+def _is_sorted(a):
+    return len(a) < 2 or bool(np.all(a[1:] >= a[:-1]))
+
+
+def _get_time_slice(time, date_from=None, date_to=None):
+    """
+    :param time: numpy 1d-array of datetime64; sorted, with no NaT
+    :return: slice of the positions of time in the period [date_from, date_to]
+    """
+    start, stop = 0, len(time)
+    if date_from:
+        start = np.searchsorted(time, np.datetime64(pd.to_datetime(date_from)), side='left')
+    if date_to:
+        stop = np.searchsorted(time, np.datetime64(pd.to_datetime(date_to)), side='right')
+    return slice(start, max(start, stop))
 
 
 def apply_time_filter(ds, date_from=None, date_to=None):
+    time = ds['time']
+    if time.ndim == 1 and _is_sorted(time.values):
+        # time is sorted (and has no NaT), hence a slice can be found by binary search; isel returns views
+        dim, = time.dims
+        return ds.isel({dim: _get_time_slice(time.values, date_from=date_from, date_to=date_to)})
+
     cond = xr.full_like(ds['time'], fill_value=True, dtype='bool')
     for _date, cmp in zip([date_from, date_to], [ds['time'].__ge__, ds['time'].__le__]):
         if _date:
@@ -61,8 +129,87 @@ def apply_time_filter(ds, date_from=None, date_to=None):
     return ds.where(cond, drop=True)
 
 
+def _get_profile_count_cube(code, time, airport_codes):
+    """
+    Builds cumulative counts of profiles by airport and by half-day slot: the slot 2*d contains profiles
+    at midnight of the day d (counted from the day of the first profile), the slot 2*d+1 - the profiles later that day.
+    :param code: numpy array of airport codes of profiles
+    :param time: numpy array of datetime64 of profiles
+    :param airport_codes: numpy array of sorted, unique airport codes
+    :return: tuple (day0, cube); day0 is datetime64[D]; cube is int32 numpy array of shape (len(airport_codes), nslots + 1)
+    such that cube[i, k] is the number of profiles of the airport airport_codes[i] in the slots < k
+    """
+    time = time.astype('M8[ns]')
+    day = time.astype('M8[D]')
+    day0 = day.min()
+    slot = 2 * ((day - day0) // np.timedelta64(1, 'D')) + (time != day)
+    nslots = 2 * ((day.max() - day0) // np.timedelta64(1, 'D') + 1)
+    cube = np.zeros((len(airport_codes), nslots + 1), dtype='i4')
+    np.add.at(cube, (np.searchsorted(airport_codes, code), slot + 1), 1)
+    return day0, np.cumsum(cube, axis=1, out=cube)
+
+
+def _get_slot(date, day0, nslots, is_date_to):
+    if not date:
+        return nslots if is_date_to else 0
+    t = np.datetime64(pd.to_datetime(date), 'ns')
+    day = t.astype('M8[D]')
+    if t != day:
+        # the cube has resolution of 1 day
+        return None
+    slot = 2 * ((day - day0) // np.timedelta64(1, 'D')) + (1 if is_date_to else 0)
+    return min(max(slot, 0), nslots)
+
+
+def _get_nprofiles_by_airport(date_from=None, date_to=None):
+    """
+    Counts profiles by airport in the period [date_from, date_to], using the cube of cumulative counts.
+    :return: numpy array of int, aligned with _snapshot['arrays']['airport_codes'], or None if the dates
+    are not at midnight
+    """
+    day0 = _snapshot['arrays']['cube_day0'][()]
+    cube = _snapshot['arrays']['profile_count_cube']
+    nslots = cube.shape[1] - 1
+    slot_from = _get_slot(date_from, day0, nslots, is_date_to=False)
+    slot_to = _get_slot(date_to, day0, nslots, is_date_to=True)
+    if slot_from is None or slot_to is None:
+        return None
+    return np.maximum(cube[:, slot_to] - cube[:, slot_from], 0)
+
+
+@functools.cache
+def _get_airports_info():
+    airport_ds = _get_airports_data().groupby('code').first()
+    return airport_ds.to_dataframe().reset_index().rename(columns={
+        'code': 'short_name',
+        'city': 'long_name',
+        'lon': 'longitude',
+        'lat': 'latitude',
+        'elevation': 'altitude',
+    })
+
+
 @functools.lru_cache(maxsize=32)
 def get_iagos_airports(date_from=None, date_to=None, top=None):
+    nprofiles = _get_nprofiles_by_airport(date_from=date_from, date_to=date_to)
+    if nprofiles is not None:
+        _iagos_airports = _get_airports_info().assign(nprofiles=nprofiles)
+        _iagos_airports = _iagos_airports[_iagos_airports['nprofiles'] > 0].reset_index(drop=True)
+    else:
+        _iagos_airports = _aggregate_iagos_airports(date_from=date_from, date_to=date_to)
+
+    if date_from is not None or date_to is not None:
+        mask = airports_df['short_name'].isin(_iagos_airports['short_name'])
+    else:
+        mask = None
+
+    if top is not None and len(_iagos_airports) > 0:
+        return _iagos_airports.nlargest(top, 'nprofiles'), mask
+    else:
+        return _iagos_airports, mask
+
+
+def _aggregate_iagos_airports(date_from=None, date_to=None):
     ds = _get_airports_data()
     ds = apply_time_filter(ds, date_from=date_from, date_to=date_to)
     if ds['code'].size == 0:
@@ -73,7 +220,7 @@ def get_iagos_airports(date_from=None, date_to=None, top=None):
         ds = ds.assign({'nprofiles': ds['profile_idx']})
         airport_ds['nprofiles'] = ds[['nprofiles', 'code']].groupby('code').count()['nprofiles']
 
-    _iagos_airports = airport_ds.to_dataframe().reset_index().rename(columns={
+    return airport_ds.to_dataframe().reset_index().rename(columns={
         'code': 'short_name',
         'city': 'long_name',
         'lon': 'longitude',
@@ -81,31 +228,104 @@ def get_iagos_airports(date_from=None, date_to=None, top=None):
         'elevation': 'altitude',
     })
 
-    if date_from is not None or date_to is not None:
-        mask = airports_df['short_name'].isin(_iagos_airports['short_name'])
-    else:
-        mask = None
 
-    if top is not None and len(_iagos_airports) > 0:
-        return _iagos_airports.nlargest(top, 'nprofiles'), mask
+def _get_footprint_store(url):
+    global _fp_chunk_cache
+    if FOOTPRINT_CHUNK_CACHE_DIR is None:
+        return str(url)
+
+    import diskcache
+    import zarr
+    if _fp_chunk_cache is None:
+        _fp_chunk_cache = diskcache.Cache(
+            directory=FOOTPRINT_CHUNK_CACHE_DIR,
+            size_limit=FOOTPRINT_CHUNK_CACHE_SIZE,
+            eviction_policy='least-recently-used',
+            statistics=True,
+        )
+    return DecodedChunkCacheStore(zarr.storage.DirectoryStore(str(url)), _fp_chunk_cache, store_id=str(url))
+
+
+def _open_footprint_data():
+    if FOOTPRINT_STORE == 'dense':
+        return xr.open_zarr(_get_footprint_store(footprint_data_url))['res_time_per_km2']
+    elif FOOTPRINT_STORE == 'sparse':
+        return SparseFootprints(_get_footprint_store(sparse_footprint_data_url))
+    elif FOOTPRINT_STORE == 'quantized':
+        return QuantizedFootprints(_get_footprint_store(quantized_footprint_data_url))
     else:
-        return _iagos_airports, mask
+        raise ValueError(f'unknown FOOTPRINT_STORE={FOOTPRINT_STORE}')
+
+
+@functools.lru_cache(maxsize=1)
+def get_footprint_store_signature():
+    """
+    Identifies the footprint store in use and its version (the signature of its consolidated metadata, which
+    is rewritten whenever the store is), e.g. for keys of cached renderings of footprints.
+    :return: dict with keys 'store' (FOOTPRINT_STORE), 'size' and 'mtime_ns'
+    """
+    url = {
+        'dense': footprint_data_url,
+        'sparse': sparse_footprint_data_url,
+        'quantized': quantized_footprint_data_url,
+    }[FOOTPRINT_STORE]
+    try:
+        sig = snapshot.get_file_signature(url / '.zmetadata', with_hash=False)
+    except OSError as e:
+        logger().warning(f'could not get the signature of the footprint store {url}: {e!r}')
+        sig = {}
+    return {'store': FOOTPRINT_STORE, **sig}
+
+
+def get_footprint_chunk_cache_stats():
+    """
+    Statistics of the decoded footprint chunks cache, shared by all workers on a host.
+    :return: dict or None if the cache is disabled (see FOOTPRINT_CHUNK_CACHE_DIR in config)
+    """
+    if _fp_chunk_cache is None:
+        return None
+    hits, misses = _fp_chunk_cache.stats()
+    return {
+        'hits': hits,
+        'misses': misses,
+        'volume': _fp_chunk_cache.volume(),
+        'size_limit': _fp_chunk_cache.size_limit,
+    }
 
 
 @functools.lru_cache(maxsize=8)
-def get_residence_time(flight_id, profile, layer):
+@single_flight
+def get_residence_time_for_profile(flight_id, profile):
+    """
+    Reads all vertical layers of a footprint at once and keeps them in memory.
+    :return: DataArray with the dimension 'layer' or None if the footprint is not available
+    """
     global _fp_da
     if _fp_da is None:
-        _ds = xr.open_zarr(footprint_data_url)
-        _fp_da = _ds['res_time_per_km2']
+        _fp_da = _open_footprint_data()
     try:
-        da = _fp_da.sel({'flight_id': flight_id, 'profile': profile, 'layer': layer}, drop=True)
+        if FOOTPRINT_STORE == 'dense':
+            da = _fp_da.sel({'flight_id': flight_id, 'profile': profile}, drop=True).load()
+        else:
+            da = _fp_da.get_footprint(flight_id, profile)
     except KeyError:
         da = None
     return da
 
 
+def get_residence_time(flight_id, profile, layer):
+    # a view on the footprint of all layers; switching layers needs no I/O
+    da = get_residence_time_for_profile(flight_id, profile)
+    if da is None:
+        return None
+    try:
+        return da.sel({'layer': layer}, drop=True)
+    except KeyError:
+        return None
+
+
 @functools.lru_cache(maxsize=256)
+@single_flight
 def get_COprofile(flight_id, profile):
     try:
         profile_ds = _COprofile_ds.sel({'flight_id': flight_id, 'profile': profile}).load()
@@ -114,9 +334,8 @@ def get_COprofile(flight_id, profile):
     return profile_ds
 
 
-@functools.lru_cache
 @log_exectime
-def get_COprofile_climatology():
+def _compute_COprofile_climatology():
     # print('get_COprofile_climatology()...')
     _COprofile_climat_ds = xr.load_dataset(COprofile_climat_data_url, engine='h5netcdf')
     _clim_5y_mean_ds = _COprofile_climat_ds.rolling({'year': 5}, min_periods=1, center=True).mean()
@@ -128,6 +347,44 @@ def get_COprofile_climatology():
     })
 
 
+@functools.lru_cache
+def get_COprofile_climatology():
+    if _shared_datasets is not None:
+        return _shared_datasets['COprofile_climatology']
+    return _compute_COprofile_climatology()
+
+
+@log_exectime
+def write_shared_data():
+    """
+    Loads COprofile data and climatology into shared memory (see shared_data.SHARED_DATA_DIR), unless they are already
+    there and up-to-date. To be run once before application workers start, e.g. by preload_shared_data.py.
+    """
+    if shared_data.read_shared_data(_shared_data_sources) is not None:
+        logger().info(f'shared data in {shared_data.SHARED_DATA_DIR} are up-to-date')
+        return
+    shared_data.write_shared_data(
+        _shared_data_sources,
+        datasets={
+            'COprofile': _open_COprofile_data(load=True),
+            'COprofile_climatology': _compute_COprofile_climatology(),
+        }
+    )
+
+
+def get_memory_report():
+    """
+    Memory usage of the current process (e.g. a gunicorn worker) with a split into private and shared bytes,
+    together with the size of the datasets memory-mapped from the snapshot and from the shared memory.
+    :return: dict
+    """
+    report = {'pid': os.getpid()}
+    report.update(shared_data.get_process_memory())
+    report['snapshot_nbytes'] = _get_CO_data().nbytes
+    report['shared_data_nbytes'] = sum(ds.nbytes for ds in _shared_datasets.values()) if _shared_datasets else 0
+    return report
+
+
 def get_coords_by_airport_and_profile_idx(aiport_code, profile_idx):
     return _coords_by_airport[aiport_code][profile_idx]
 
@@ -138,21 +395,178 @@ def get_flight_id_and_profile_by_airport_and_profile_idx(aiport_code, profile_id
     return coords['flight_id'].item(), coords['profile'].item()
 
 
+@functools.cache
+def _get_CO_aggregates(resolution):
+    """
+    :return: tuple (ds, bin_slice_by_airport) or None if the aggregates are missing or outdated w.r.t. CO_data.nc
+    """
+    if not CO_aggregates_url.exists():
+        return None
+    aggregates = CO_aggregates.read_CO_aggregates(CO_aggregates_url, resolution)
+    if aggregates is None:
+        return None
+    ds, bin_slice_by_airport, source_signature = aggregates
+    if not snapshot.is_signature_valid(CO_data_url, source_signature):
+        logger().warning(f'{CO_aggregates_url} is outdated; run gen_CO_aggregates.py')
+        return None
+    return ds, bin_slice_by_airport
+
+
+@log_exectime
+def build_CO_aggregates(resolutions=('week', 'month')):
+    """
+    Computes aggregates of CO time series by airport and time period and saves them into CO_aggregates_url.
+    """
+    CO_aggregates.write_CO_aggregates(
+        _get_CO_data(), CO_aggregates_url, resolutions, source_signature=snapshot.get_file_signature(CO_data_url)
+    )
+    _get_CO_aggregates.cache_clear()
+    get_CO_ts.cache_clear()
+
+
 @functools.lru_cache(maxsize=32)
 @log_exectime
-def get_CO_ts(airport_code, date_from=None, date_to=None):
+def get_CO_ts(airport_code, date_from=None, date_to=None, resolution='profile'):
+    """
+    :param resolution: str; 'profile' or one of CO_aggregates.RESOLUTIONS; in the latter case, the dimension
+    'profile_idx' enumerates time periods and profile_idx_for_airport refers to the first profile of a period
+    :return: xarray Dataset with the attribute 'resolution'; falls back to 'profile' if the aggregates are
+    not available
+    """
     coords = _coords_by_airport[airport_code]
-    CO_ts = _get_CO_data().sel({'profile_idx': coords['profile_idx']})
-    CO_ts = CO_ts.assign_coords({'profile_idx_for_airport': ('profile_idx', np.arange(len(CO_ts['profile_idx'])))})
+    aggregates = _get_CO_aggregates(resolution) if resolution != 'profile' else None
+    if aggregates is not None:
+        ds, bin_slice_by_airport = aggregates
+        CO_ts = ds.isel({'bin': bin_slice_by_airport.get(airport_code, slice(0, 0))}).rename({'bin': 'profile_idx'})
+        profile_idx_for_airport = pd.Index(coords['profile_idx'].values).get_indexer(CO_ts['first_profile_idx'].values)
+        CO_ts = CO_ts.assign_coords({'profile_idx_for_airport': ('profile_idx', profile_idx_for_airport)})
+    else:
+        resolution = 'profile'
+        CO_ts = _get_CO_data().sel({'profile_idx': coords['profile_idx']})
+        CO_ts = CO_ts.assign_coords({'profile_idx_for_airport': ('profile_idx', np.arange(len(CO_ts['profile_idx'])))})
     CO_ts = apply_time_filter(CO_ts, date_from=date_from, date_to=date_to)
-    logger().info(f'airport_code={airport_code}, CO_ts.nbytes = {CO_ts.nbytes / 1e6}M')
+    CO_ts.attrs['resolution'] = resolution
+    logger().info(f'airport_code={airport_code}, resolution={resolution}, CO_ts.nbytes = {CO_ts.nbytes / 1e6}M')
     return CO_ts
 
 
-_coords_by_airport = {}
-for airport, coords_for_airport in _get_CO_data()['profile_idx'].groupby('code'):
-    _coords_by_airport[airport] = coords_for_airport.sortby('time')
+@functools.lru_cache(maxsize=256)
+def get_CO_ts_resolution(airport_code, date_from=None, date_to=None):
+    """
+    Picks the finest resolution of the CO time series of an airport for which the series in the period
+    [date_from, date_to] has at most CO_TS_MAX_PROFILES points.
+    :return: str; 'profile' or one of CO_aggregates.RESOLUTIONS
+    """
+    coords = _coords_by_airport[airport_code]
+    if len(coords) <= CO_TS_MAX_PROFILES:
+        return 'profile'
+    # the lengths of the series are found by binary search in the sorted times of profiles or of bins,
+    # so that no series is built (nor cached by get_CO_ts) for a zoom window
+    available_resolution = 'profile'
+    for resolution in ['profile'] + CO_aggregates.RESOLUTIONS:
+        if resolution == 'profile':
+            time = coords['time'].values
+        else:
+            aggregates = _get_CO_aggregates(resolution)
+            if aggregates is None:
+                continue
+            ds, bin_slice_by_airport = aggregates
+            time = ds['time'].values[bin_slice_by_airport.get(airport_code, slice(0, 0))]
+        available_resolution = resolution
+        time_slice = _get_time_slice(time, date_from=date_from, date_to=date_to)
+        if time_slice.stop - time_slice.start <= CO_TS_MAX_PROFILES:
+            break
+    # the finest one short enough or else the coarsest one available
+    return available_resolution
+
+
+def _get_profile_order_by_airport(CO_ds):
+    """
+    Sorts profiles by airport code and time.
+    :param CO_ds: xarray Dataset with the dimension 'profile_idx'
+    :return: tuple (profile_order, airport_codes, airport_offsets) of numpy arrays; the profiles of the airport
+    airport_codes[i] are at the positions profile_order[airport_offsets[i]:airport_offsets[i + 1]], sorted by time
+    """
+    code = CO_ds['code'].values.astype(str)
+    profile_order = np.lexsort((CO_ds['time'].values, code))
+    airport_codes, airport_offsets = np.unique(code[profile_order], return_index=True)
+    airport_offsets = np.append(airport_offsets, len(profile_order))
+    return profile_order, airport_codes, airport_offsets
+
 
-airports_df, _ = get_iagos_airports(top=None)
-airports_df = airports_df.sort_values('long_name')
+def _clear_caches():
+    for func in [_get_airports_data, _get_airports_info, get_iagos_airports]:
+        func.cache_clear()
+
+
+@log_exectime
+def build_snapshot():
+    """
+    Builds the derived data structures from the source files and saves them into SNAPSHOT_DIR; only one process
+    on a host builds it at a time (see snapshot.lock).
+    :return: dict; see snapshot.read_snapshot
+    """
+    with snapshot.lock(SNAPSHOT_DIR):
+        return _build_snapshot()
+
+
+def _build_snapshot():
+    global _snapshot
+    CO_ds = _load_CO_data()
+    profile_order, airport_codes, airport_offsets = _get_profile_order_by_airport(CO_ds)
+    cube_day0, profile_count_cube = _get_profile_count_cube(
+        CO_ds['code'].values.astype(str), CO_ds['time'].values, airport_codes
+    )
+
+    # get_iagos_airports relies on _get_CO_data and the cube
+    _snapshot = {
+        'datasets': {'CO_data': CO_ds},
+        'arrays': {
+            'profile_order': profile_order,
+            'airport_codes': airport_codes,
+            'airport_offsets': airport_offsets,
+            'cube_day0': cube_day0,
+            'profile_count_cube': profile_count_cube,
+        },
+        'frames': {},
+    }
+    _clear_caches()
+    _airports_df, _ = get_iagos_airports(top=None)
+    _clear_caches()
+    _snapshot['frames']['airports_df'] = _airports_df.sort_values('long_name')
+
+    try:
+        snapshot.write_snapshot(SNAPSHOT_DIR, _snapshot_sources, **_snapshot, content_version=_SNAPSHOT_CONTENT_VERSION)
+    except OSError as e:
+        logger().exception(f'could not write the snapshot into {SNAPSHOT_DIR}', exc_info=e)
+        return _snapshot
+    _clear_caches()
+    return snapshot.read_snapshot(SNAPSHOT_DIR, _snapshot_sources, content_version=_SNAPSHOT_CONTENT_VERSION) or _snapshot
+
+
+@log_exectime
+def _get_snapshot():
+    _s = snapshot.read_snapshot(SNAPSHOT_DIR, _snapshot_sources, content_version=_SNAPSHOT_CONTENT_VERSION)
+    if _s is None:
+        with snapshot.lock(SNAPSHOT_DIR):
+            # another process may have built the snapshot while this one was waiting for the lock
+            _s = snapshot.read_snapshot(SNAPSHOT_DIR, _snapshot_sources, content_version=_SNAPSHOT_CONTENT_VERSION)
+            if _s is None:
+                logger().info(f'no valid snapshot in {SNAPSHOT_DIR}; building it...')
+                _s = _build_snapshot()
+    return _s
+
+
+_snapshot = _get_snapshot()
+
+_coords_by_airport = {}
+_profile_idx = _get_CO_data()['profile_idx']
+for airport, start, stop in zip(
+        _snapshot['arrays']['airport_codes'],
+        _snapshot['arrays']['airport_offsets'][:-1],
+        _snapshot['arrays']['airport_offsets'][1:]
+):
+    _coords_by_airport[str(airport)] = _profile_idx.isel({'profile_idx': _snapshot['arrays']['profile_order'][start:stop]})
+
+airports_df = _snapshot['frames']['airports_df']
 airport_name_by_code = dict(zip(airports_df['short_name'], airports_df['long_name']))
@@ -0,0 +1,102 @@
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from footprint_utils import xarray_extras  # noq
+
+
+FOOTPRINT_VAR = 'res_time_per_km2'
+CODE_VAR = 'res_time_code'
+
+
+def quantize(a, dtype='u1', floor=1e-4):
+    """
+    Log-scale quantization of footprints: the code 0 stands for values <= floor * max of a footprint,
+    the codes 1, ..., max_code are evenly spaced in log(value) between log(floor * max) and log(max).
+    :param a: numpy array of shape (..., lat, lon); the max is taken over the last two axes
+    :param dtype: 'u1' or 'u2'
+    :param floor: float; relative to the max of a footprint
+    :return: tuple (codes, log_offset, log_scale); codes is of dtype dtype and of the shape of a,
+    log_offset and log_scale are float32 of shape a.shape[:-2]
+    """
+    max_code = np.iinfo(dtype).max
+    a = np.nan_to_num(a.astype('f4'), nan=0)
+    a_max = a.max(axis=(-2, -1))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_offset = np.where(a_max > 0, np.log(a_max * floor), 0).astype('f4')
+        log_scale = np.full_like(log_offset, -np.log(floor) / (max_code - 1))
+        codes = 1 + np.rint((np.log(a) - log_offset[..., None, None]) / log_scale[..., None, None])
+    codes = np.where(a > (a_max * floor)[..., None, None], np.clip(codes, 1, max_code), 0)
+    return codes.astype(dtype), log_offset, log_scale
+
+
+def dequantize(codes, log_offset, log_scale):
+    """
+    Inverse of quantize (up to the quantization error).
+    :return: float32 numpy array of the shape of codes
+    """
+    values = np.exp(log_offset[..., None, None] + (codes.astype('f4') - 1) * log_scale[..., None, None])
+    return np.where(codes > 0, values, 0).astype('f4')
+
+
+def write_quantized_footprints(fp_da, store, dtype='u1', floor=1e-4, batch_size=100, progress=None):
+    """
+    Writes footprints as log-quantized codes, with per-footprint log_offset and log_scale,
+    chunked so that all layers of a (flight_id, profile) are in one chunk.
+    :param fp_da: DataArray with dimensions (flight_id, profile, layer, lat, lon), possibly lazy (e.g. from open_zarr)
+    :param store: a zarr store or a path
+    :param dtype: 'u1' or 'u2'
+    :param floor: float; must be smaller than the smallest residence time cutoff available in the application
+    :param batch_size: int; number of flight_id's processed at once
+    :param progress: None or a callable taking the number of flight_id's done
+    """
+    lat, lon = fp_da.geo.get_lat_label(), fp_da.geo.get_lon_label()
+    fp_da = fp_da.transpose('flight_id', 'profile', 'layer', lat, lon)
+    nflight = fp_da.sizes['flight_id']
+    encoding = {CODE_VAR: {'chunks': (1, 1) + fp_da.shape[2:]}}
+
+    for i in range(0, nflight, batch_size):
+        batch_da = fp_da.isel({'flight_id': slice(i, i + batch_size)})
+        codes, log_offset, log_scale = quantize(batch_da.values, dtype=dtype, floor=floor)
+        coords = {dim: batch_da[dim] for dim in batch_da.dims}
+        ds = xr.Dataset(
+            {
+                CODE_VAR: (batch_da.dims, codes),
+                'log_offset': (batch_da.dims[:3], log_offset),
+                'log_scale': (batch_da.dims[:3], log_scale),
+            },
+            coords=coords,
+            attrs={'floor': floor},
+        )
+        if i == 0:
+            ds.to_zarr(store, mode='w', encoding=encoding, consolidated=True)
+        else:
+            ds.to_zarr(store, append_dim='flight_id', consolidated=True)
+        if progress is not None:
+            progress(min(i + batch_size, nflight))
+
+
+class QuantizedFootprints:
+    """
+    Reader of footprints written by write_quantized_footprints.
+    """
+    def __init__(self, store):
+        """
+        :param store: a zarr store or a path
+        """
+        self._ds = xr.open_zarr(store)
+        self._log_offset = self._ds['log_offset'].values
+        self._log_scale = self._ds['log_scale'].values
+        self._flight_id_index = pd.Index(self._ds['flight_id'].values)
+        self._profile_index = pd.Index(self._ds['profile'].values)
+
+    def get_footprint(self, flight_id, profile):
+        """
+        Decodes the footprint of all layers of a profile; values below the floor are set to 0.
+        :return: float32 DataArray with dimensions (layer, lat, lon)
+        :raise KeyError: if flight_id or profile is not found
+        """
+        i, j = self._flight_id_index.get_loc(flight_id), self._profile_index.get_loc(profile)
+        codes_da = self._ds[CODE_VAR].isel({'flight_id': i, 'profile': j}, drop=True).load()
+        values = dequantize(codes_da.values, self._log_offset[i, j], self._log_scale[i, j])
+        return codes_da.copy(data=values).rename(FOOTPRINT_VAR)
@@ -0,0 +1,61 @@
+import pathlib
+
+import config
+from footprint_data_access import snapshot
+
+
+# a directory on a tmpfs (e.g. /dev/shm/aaft) makes the preloaded datasets reside in shared memory;
+# None disables the shared-memory backing mode
+SHARED_DATA_DIR = getattr(config, 'SHARED_DATA_DIR', None)
+
+_PROC_MEMORY_FIELDS = {
+    'Rss': 'rss',
+    'Pss': 'pss',
+    'Shared_Clean': 'shared_clean',
+    'Shared_Dirty': 'shared_dirty',
+    'Private_Clean': 'private_clean',
+    'Private_Dirty': 'private_dirty',
+}
+
+
+def write_shared_data(sources, datasets):
+    """
+    Puts datasets into SHARED_DATA_DIR; to be called once, e.g. in the gunicorn master process before forking workers.
+    :param sources: dict of (key, path of a source file)
+    :param datasets: dict of (name, xarray Dataset)
+    """
+    if SHARED_DATA_DIR is None:
+        raise ValueError('SHARED_DATA_DIR is not set in config')
+    snapshot.write_snapshot(pathlib.Path(SHARED_DATA_DIR), sources, datasets=datasets)
+
+
+def read_shared_data(sources):
+    """
+    Opens datasets put into SHARED_DATA_DIR by write_shared_data. Arrays are memory-mapped read-only,
+    hence all processes share the same physical memory.
+    :param sources: dict of (key, path of a source file)
+    :return: dict of (name, xarray Dataset) or None if the shared-memory mode is disabled or data are missing / outdated
+    """
+    if SHARED_DATA_DIR is None:
+        return None
+    _snapshot = snapshot.read_snapshot(pathlib.Path(SHARED_DATA_DIR), sources, mmap_mode='r')
+    if _snapshot is None:
+        return None
+    return _snapshot['datasets']
+
+
+def get_process_memory(pid='self'):
+    """
+    Memory usage of a process, based on /proc/<pid>/smaps_rollup (Linux only).
+    :param pid: int or 'self'
+    :return: dict with keys 'rss', 'pss', 'shared', 'private' (and more detailed ones), in bytes
+    """
+    mem = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            field, _, value = line.partition(':')
+            if field in _PROC_MEMORY_FIELDS:
+                mem[_PROC_MEMORY_FIELDS[field]] = int(value.split()[0]) * 1024
+    mem['shared'] = mem.get('shared_clean', 0) + mem.get('shared_dirty', 0)
+    mem['private'] = mem.get('private_clean', 0) + mem.get('private_dirty', 0)
+    return mem
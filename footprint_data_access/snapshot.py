@@ -0,0 +1,225 @@
+import json
+import os
+import fcntl
+import contextlib
+import shutil
+import pickle
+import hashlib
+import pathlib
+import tempfile
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from log import logger
+
+
+SNAPSHOT_VERSION = 1
+
+_MANIFEST_FILENAME = 'manifest.json'
+_DATASET_LAYOUT_FILENAME = 'layout.pkl'
+
+
+def get_file_sha256(path, blocksize=1 << 24):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(blocksize), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def get_file_signature(path, with_hash=True):
+    """
+    Signature of a source file used to validate a snapshot.
+    :param path: str or pathlib.Path
+    :param with_hash: bool; if True, compute sha256 of the file content (can be slow for large files)
+    :return: dict with keys 'size', 'mtime_ns' and optionally 'sha256'
+    """
+    st = os.stat(path)
+    sig = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+    if with_hash:
+        sig['sha256'] = get_file_sha256(path)
+    return sig
+
+
+def is_signature_valid(path, sig):
+    """
+    Checks a source file against its signature (see get_file_signature).
+    :param path: str or pathlib.Path
+    :param sig: dict
+    :return: bool
+    """
+    # size and mtime are checked first; the hash is computed only if mtime has changed but size has not
+    # (e.g. a data file copied / restored from a backup)
+    try:
+        st = os.stat(path)
+    except OSError:
+        return False
+    if st.st_size != sig.get('size'):
+        return False
+    if st.st_mtime_ns == sig.get('mtime_ns'):
+        return True
+    return sig.get('sha256') is not None and get_file_sha256(path) == sig['sha256']
+
+
+def write_dataset(ds, path):
+    """
+    Writes a dataset into a directory of .npy files (one file per variable), so that it can be memory-mapped
+    by read_dataset. Variables with object dtype are pickled (and hence are not memory-mapped).
+    :param ds: xarray Dataset
+    :param path: pathlib.Path; a directory which is created
+    """
+    path.mkdir(parents=True)
+    variables = []
+    for i, (name, var) in enumerate(ds.variables.items()):
+        values = var.values
+        filename = f'{i}.npy'
+        np.save(path / filename, values, allow_pickle=values.dtype.hasobject)
+        variables.append({
+            'name': name,
+            'filename': filename,
+            'dims': var.dims,
+            'attrs': var.attrs,
+            'is_coord': name in ds.coords,
+            'pickled': values.dtype.hasobject,
+        })
+    with open(path / _DATASET_LAYOUT_FILENAME, 'wb') as f:
+        pickle.dump({'variables': variables, 'attrs': ds.attrs}, f)
+
+
+def read_dataset(path, mmap_mode='r'):
+    """
+    Reads a dataset written by write_dataset.
+    :param path: pathlib.Path
+    :param mmap_mode: str or None; see numpy.load; with 'r' (default) arrays are read-only and memory-mapped
+    :return: xarray Dataset
+    """
+    with open(path / _DATASET_LAYOUT_FILENAME, 'rb') as f:
+        layout = pickle.load(f)
+    data_vars, coords = {}, {}
+    for var in layout['variables']:
+        if var['pickled']:
+            values = np.load(path / var['filename'], allow_pickle=True)
+        else:
+            values = np.load(path / var['filename'], mmap_mode=mmap_mode)
+        variables = coords if var['is_coord'] else data_vars
+        variables[var['name']] = xr.Variable(var['dims'], values, attrs=var['attrs'])
+    return xr.Dataset(data_vars=data_vars, coords=coords, attrs=layout['attrs'])
+
+
+def write_snapshot(snapshot_dir, sources, datasets=None, arrays=None, frames=None, content_version=0):
+    """
+    Writes a snapshot of derived data structures, together with a manifest of source files signatures.
+    The snapshot is first written into a temporary directory which then replaces snapshot_dir.
+    :param snapshot_dir: pathlib.Path
+    :param sources: dict of (key, path of a source file)
+    :param datasets: dict of (name, xarray Dataset)
+    :param arrays: dict of (name, numpy array); arrays cannot be of object dtype
+    :param frames: dict of (name, pandas DataFrame)
+    :param content_version: int; to be increased when the content of the snapshot changes
+    """
+    snapshot_dir = pathlib.Path(snapshot_dir)
+    snapshot_dir.parent.mkdir(parents=True, exist_ok=True)
+    tmp_dir = pathlib.Path(tempfile.mkdtemp(prefix=f'.{snapshot_dir.name}-', dir=snapshot_dir.parent))
+    try:
+        manifest = {
+            'version': SNAPSHOT_VERSION,
+            'content_version': content_version,
+            'sources': {k: get_file_signature(path) for k, path in sources.items()},
+            'datasets': sorted(datasets or {}),
+            'arrays': sorted(arrays or {}),
+            'frames': sorted(frames or {}),
+        }
+        for name, ds in (datasets or {}).items():
+            write_dataset(ds, tmp_dir / 'datasets' / name)
+        (tmp_dir / 'arrays').mkdir()
+        for name, a in (arrays or {}).items():
+            np.save(tmp_dir / 'arrays' / f'{name}.npy', a, allow_pickle=False)
+        (tmp_dir / 'frames').mkdir()
+        for name, df in (frames or {}).items():
+            df.to_pickle(tmp_dir / 'frames' / f'{name}.pkl')
+        # the manifest goes last, so that an incomplete snapshot is never considered valid
+        with open(tmp_dir / _MANIFEST_FILENAME, 'w') as f:
+            json.dump(manifest, f, indent=2)
+
+        old_dir = None
+        if snapshot_dir.exists():
+            old_dir = snapshot_dir.with_name(f'{tmp_dir.name}-old')
+            os.rename(snapshot_dir, old_dir)
+        os.rename(tmp_dir, snapshot_dir)
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    if old_dir is not None:
+        # files memory-mapped by other processes remain valid after removal
+        shutil.rmtree(old_dir, ignore_errors=True)
+
+
+def read_snapshot(snapshot_dir, sources, mmap_mode='r', content_version=0):
+    """
+    Reads a snapshot written by write_snapshot, provided it is valid against the source files.
+    :param snapshot_dir: pathlib.Path
+    :param sources: dict of (key, path of a source file); must have the same keys as when the snapshot was written
+    :param mmap_mode: str or None; see numpy.load
+    :param content_version: int; must be the same as when the snapshot was written
+    :return: dict with keys 'datasets', 'arrays' and 'frames', or None if the snapshot is missing or invalid
+    """
+    snapshot_dir = pathlib.Path(snapshot_dir)
+    try:
+        with open(snapshot_dir / _MANIFEST_FILENAME) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if manifest.get('version') != SNAPSHOT_VERSION or manifest.get('content_version') != content_version or \
+            set(manifest['sources']) != set(sources):
+        logger().info(f'snapshot {snapshot_dir} is outdated')
+        return None
+    for k, path in sources.items():
+        if not is_signature_valid(path, manifest['sources'][k]):
+            logger().info(f'snapshot {snapshot_dir} is outdated with respect to {path}')
+            return None
+
+    try:
+        return {
+            'datasets': {
+                name: read_dataset(snapshot_dir / 'datasets' / name, mmap_mode=mmap_mode)
+                for name in manifest['datasets']
+            },
+            'arrays': {
+                name: np.load(snapshot_dir / 'arrays' / f'{name}.npy', mmap_mode=mmap_mode)
+                for name in manifest['arrays']
+            },
+            'frames': {
+                name: pd.read_pickle(snapshot_dir / 'frames' / f'{name}.pkl')
+                for name in manifest['frames']
+            },
+        }
+    except (OSError, EOFError) as e:
+        # the snapshot has been replaced by write_snapshot in another process in the meantime
+        logger().info(f'snapshot {snapshot_dir} could not be read: {e!r}')
+        return None
+
+
+@contextlib.contextmanager
+def lock(snapshot_dir):
+    """
+    Exclusive lock of a snapshot among processes on a host, e.g. so that only one of application workers started
+    at the same time builds a missing snapshot. It is a lock file next to snapshot_dir; if the file cannot be created,
+    the lock is not taken.
+    :param snapshot_dir: pathlib.Path
+    """
+    snapshot_dir = pathlib.Path(snapshot_dir)
+    try:
+        snapshot_dir.parent.mkdir(parents=True, exist_ok=True)
+        f = open(snapshot_dir.with_name(f'.{snapshot_dir.name}.lock'), 'w')
+    except OSError as e:
+        logger().warning(f'could not lock snapshot {snapshot_dir}: {e!r}')
+        yield
+        return
+    with f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
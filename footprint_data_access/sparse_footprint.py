@@ -0,0 +1,102 @@
+import numpy as np
+import pandas as pd
+import xarray as xr
+import zarr
+
+from footprint_utils import xarray_extras  # noq
+
+
+FOOTPRINT_VAR = 'res_time_per_km2'
+# chunk size of the 1-d arrays with values and cell indices
+_CHUNK_SIZE = 2 ** 18
+
+
+def write_sparse_footprints(fp_da, store, floor=1e-4, batch_size=100, progress=None):
+    """
+    Writes footprints into a sparse zarr group: for each (flight_id, profile, layer), only the cells with values
+    > floor * (max of the footprint) are kept as flat cell indices and values. Footprints are stored one after another,
+    ordered by (flight_id, profile, layer), so that all layers of a profile are contiguous.
+    :param fp_da: DataArray with dimensions (flight_id, profile, layer, lat, lon), possibly lazy (e.g. from open_zarr)
+    :param store: a zarr store or a path
+    :param floor: float; must be smaller than the smallest residence time cutoff available in the application
+    :param batch_size: int; number of flight_id's processed at once
+    :param progress: None or a callable taking the number of flight_id's done
+    """
+    lat, lon = fp_da.geo.get_lat_label(), fp_da.geo.get_lon_label()
+    fp_da = fp_da.transpose('flight_id', 'profile', 'layer', lat, lon)
+    nflight, nprofile, nlayer, nlat, nlon = fp_da.shape
+
+    group = zarr.open_group(store, mode='w')
+    group.attrs.update({'floor': floor, 'lat': lat, 'lon': lon})
+    for dim in ['flight_id', 'profile', 'layer', lat, lon]:
+        coord = fp_da[dim].values
+        if coord.dtype.kind == 'O':
+            coord = coord.astype(str)
+        group.array(dim, coord)
+    values = group.zeros('values', shape=(0, ), chunks=(_CHUNK_SIZE, ), dtype=fp_da.dtype)
+    cell_idx = group.zeros('cell_idx', shape=(0, ), chunks=(_CHUNK_SIZE, ), dtype='u4')
+    start = group.zeros('start', shape=(nflight, nprofile, nlayer), chunks=(nflight, nprofile, nlayer), dtype='i8')
+    count = group.zeros('count', shape=(nflight, nprofile, nlayer), chunks=(nflight, nprofile, nlayer), dtype='i8')
+
+    offset = 0
+    for i in range(0, nflight, batch_size):
+        a = fp_da.isel({'flight_id': slice(i, i + batch_size)}).values
+        batch_shape = a.shape[:3]
+        a = a.reshape((-1, nlat * nlon))
+        with np.errstate(invalid='ignore'):
+            a_max = np.max(np.where(np.isnan(a), -np.inf, a), axis=1)
+            mask = a > (a_max * floor)[:, None]
+        footprint_idx, _cell_idx = np.nonzero(mask)  # row-major, so footprints are contiguous
+        _count = np.bincount(footprint_idx, minlength=len(a))
+        _start = offset + np.cumsum(_count) - _count
+        values.append(a[footprint_idx, _cell_idx])
+        cell_idx.append(_cell_idx.astype('u4'))
+        start[i:i + batch_size] = _start.reshape(batch_shape)
+        count[i:i + batch_size] = _count.reshape(batch_shape)
+        offset += len(_cell_idx)
+        if progress is not None:
+            progress(min(i + batch_size, nflight))
+    zarr.consolidate_metadata(store)
+
+
+class SparseFootprints:
+    """
+    Reader of footprints written by write_sparse_footprints.
+    """
+    def __init__(self, store):
+        """
+        :param store: a zarr store or a path
+        """
+        group = zarr.open_consolidated(store, mode='r')
+        self._values = group['values']
+        self._cell_idx = group['cell_idx']
+        self._start = group['start'][:]
+        self._count = group['count'][:]
+        self._lat, self._lon = group.attrs['lat'], group.attrs['lon']
+        self._coords = {dim: group[dim][:] for dim in ['layer', self._lat, self._lon]}
+        self._flight_id_index = pd.Index(group['flight_id'][:])
+        self._profile_index = pd.Index(group['profile'][:])
+
+    def get_footprint(self, flight_id, profile):
+        """
+        Rebuilds the footprint of all layers of a profile; cells not kept in the sparse store are set to 0.
+        :return: DataArray with dimensions (layer, lat, lon)
+        :raise KeyError: if flight_id or profile is not found
+        """
+        i, j = self._flight_id_index.get_loc(flight_id), self._profile_index.get_loc(profile)
+        start, count = self._start[i, j], self._count[i, j]
+        # all layers of the profile are contiguous, hence one read
+        lo, hi = start[0], start[-1] + count[-1]
+        values = self._values[lo:hi]
+        cell_idx = self._cell_idx[lo:hi]
+
+        nlat, nlon = len(self._coords[self._lat]), len(self._coords[self._lon])
+        a = np.zeros((len(start), nlat * nlon), dtype=self._values.dtype)
+        layer_idx = np.repeat(np.arange(len(start)), count)
+        a[layer_idx, cell_idx] = values
+        return xr.DataArray(
+            a.reshape((len(start), nlat, nlon)),
+            dims=('layer', self._lat, self._lon),
+            coords=self._coords,
+            name=FOOTPRINT_VAR,
+        )
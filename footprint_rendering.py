@@ -0,0 +1,441 @@
+import io
+import json
+import base64
+import functools
+import urllib.parse
+import plotly
+import dash
+import flask
+import PIL.Image
+
+import config
+from footprint_utils import footprint_viz, render_cache
+from footprint_utils.single_flight import single_flight
+from footprint_data_access import get_residence_time, get_footprint_store_signature
+from footprint_data_access.quantized_footprint import quantize
+
+
+# optional; if set, rendered footprints are stored in this directory (see also prerender_footprints.py)
+FOOTPRINT_RENDER_CACHE_DIR = getattr(config, 'FOOTPRINT_RENDER_CACHE_DIR', None)
+
+# optional; 'png' (default) or 'webp' (lossless)
+FOOTPRINT_IMG_FORMAT = getattr(config, 'FOOTPRINT_IMG_FORMAT', 'png')
+
+# optional; 'image' (default; one image per footprint, which can be pre-rendered), 'tiles' (XYZ tiles rendered
+# on demand for the visible part of the map at its zoom), 'client' (the footprint grid is sent to the browser,
+# which renders it; see get_footprint_grid) or 'contours' (filled contours as GeoJSON layers);
+# FOOTPRINT_TILE_CACHE_SIZE is the number of tiles kept in memory by each worker
+FOOTPRINT_MAP_SOURCE = getattr(config, 'FOOTPRINT_MAP_SOURCE', 'image')
+FOOTPRINT_TILE_CACHE_SIZE = getattr(config, 'FOOTPRINT_TILE_CACHE_SIZE', 4096)
+
+# optional; a directory of the cache of footprint map layers (see get_footprint_map_layers), shared by all workers
+# on a host and kept across restarts (None or not set: each worker keeps recent map layers in memory);
+# FOOTPRINT_MAP_CACHE_SIZE is its size limit in bytes (locks and counters of the cache are kept apart from it,
+# in the subdirectory 'meta')
+FOOTPRINT_MAP_CACHE_DIR = getattr(config, 'FOOTPRINT_MAP_CACHE_DIR', None)
+FOOTPRINT_MAP_CACHE_SIZE = getattr(config, 'FOOTPRINT_MAP_CACHE_SIZE', 2 ** 30)
+
+# to be increased whenever rendering changes, so that previously rendered footprints are not served
+RENDERING_VERSION = 2
+
+FOOTPRINT_IMG_ROUTE = 'footprint-img/'
+FOOTPRINT_TILES_ROUTE = 'footprint-tiles/'
+_MIMETYPE_BY_IMG_FORMAT = {'png': 'image/png', 'webp': 'image/webp'}
+# a URL identifies its image content, which can be hence cached for good
+_FOOTPRINT_IMG_MAX_AGE = 365 * 24 * 3600
+# footprint grids sent to the browser are cropped and quantized at this floor (relative to the max);
+# it must not exceed the smallest residence time cutoff available
+CLIENT_GRID_FLOOR = 1e-4
+
+_map_cache = None
+# locks and counters of the map cache, which must not be evicted as map layers are
+_map_cache_meta = None
+_MISSING = object()
+# max time (in seconds) of computing map layers by a worker while the others wait for the result
+_MAP_CACHE_LOCK_EXPIRE = 60
+# time (in seconds) for which a footprint not available is kept in the map cache
+_MAP_CACHE_NOT_AVAILABLE_EXPIRE = 3600
+
+
+def get_rendering_key(flight_id, profile, layer, residence_time_scale, residence_time_cutoff,
+                      img_format=FOOTPRINT_IMG_FORMAT):
+    return render_cache.get_key({
+        'flight_id': flight_id,
+        'profile': profile,
+        'layer': layer,
+        'scale': residence_time_scale,
+        'cutoff': residence_time_cutoff,
+        'format': img_format,
+        'footprint_store': get_footprint_store_signature(),
+        'version': RENDERING_VERSION,
+    })
+
+
+def render_footprint(flight_id, profile, layer, residence_time_scale, residence_time_cutoff,
+                     img_format=FOOTPRINT_IMG_FORMAT):
+    """
+    Renders a footprint as an image.
+    :param img_format: 'png' or 'webp'
+    :return: tuple (img_bytes, meta) where meta is a dict with keys 'coordinates' (of the image corners)
+    and 'colorscale_trace'; or None if the footprint is not available
+    """
+    res_time_per_km2 = get_residence_time(flight_id, profile, layer)
+    if res_time_per_km2 is None:
+        return None
+    img, coordinates, colorscale_trace = footprint_viz.get_footprint_viz(
+        res_time_per_km2.load(),
+        color_scale_transform=residence_time_scale,
+        residence_time_cutoff=residence_time_cutoff,
+    )
+    meta = {'coordinates': coordinates, 'colorscale_trace': colorscale_trace}
+    # the same (JSON-compatible) form as when read from the cache
+    meta = json.loads(json.dumps(meta, cls=plotly.utils.PlotlyJSONEncoder))
+    return _save_img(img, img_format=img_format), meta
+
+
+@functools.lru_cache(maxsize=32)
+@single_flight
+def get_footprint_rendering(flight_id, profile, layer, residence_time_scale, residence_time_cutoff):
+    """
+    Same as render_footprint (in the format FOOTPRINT_IMG_FORMAT), but served from the cache
+    FOOTPRINT_RENDER_CACHE_DIR, if available. Recent renderings are kept in memory too, so that an image is not
+    rendered twice: first for the footprint map callback, then for the image request.
+    """
+    if FOOTPRINT_RENDER_CACHE_DIR is None:
+        return render_footprint(flight_id, profile, layer, residence_time_scale, residence_time_cutoff)
+
+    key = get_rendering_key(flight_id, profile, layer, residence_time_scale, residence_time_cutoff)
+    rendering = render_cache.get(FOOTPRINT_RENDER_CACHE_DIR, key)
+    if rendering is None:
+        rendering = render_footprint(flight_id, profile, layer, residence_time_scale, residence_time_cutoff)
+        if rendering is not None:
+            render_cache.put(FOOTPRINT_RENDER_CACHE_DIR, key, *rendering)
+    return rendering
+
+
+def _save_img(img, img_format=FOOTPRINT_IMG_FORMAT):
+    buf = io.BytesIO()
+    if img_format == 'webp':
+        img.save(buf, format='webp', lossless=True)
+    else:
+        img.save(buf, format=img_format)
+    return buf.getvalue()
+
+
+@functools.lru_cache(maxsize=32)
+@single_flight
+def get_footprint_tile_source(flight_id, profile, layer, residence_time_scale, residence_time_cutoff):
+    """
+    :return: dict (see footprint_viz.get_footprint_tile_source) or None if the footprint is not available
+    """
+    res_time_per_km2 = get_residence_time(flight_id, profile, layer)
+    if res_time_per_km2 is None:
+        return None
+    return footprint_viz.get_footprint_tile_source(
+        res_time_per_km2.load(),
+        color_scale_transform=residence_time_scale,
+        residence_time_cutoff=residence_time_cutoff,
+    )
+
+
+@functools.lru_cache(maxsize=1)
+def _get_empty_tile():
+    return _save_img(PIL.Image.new('RGBA', (256, 256)))
+
+
+@functools.lru_cache(maxsize=FOOTPRINT_TILE_CACHE_SIZE)
+def get_footprint_tile(flight_id, profile, layer, residence_time_scale, residence_time_cutoff, z, x, y):
+    """
+    :return: bytes; the tile image in the format FOOTPRINT_IMG_FORMAT, or None if the footprint is not available
+    """
+    tile_source = get_footprint_tile_source(flight_id, profile, layer, residence_time_scale, residence_time_cutoff)
+    if tile_source is None:
+        return None
+    img = footprint_viz.get_footprint_tile(tile_source, z, x, y)
+    return _save_img(img) if img is not None else _get_empty_tile()
+
+
+@functools.lru_cache(maxsize=32)
+def get_footprint_grid(flight_id, profile, layer):
+    """
+    A footprint to be rendered in the browser (FOOTPRINT_MAP_SOURCE = 'client'): the footprint grid is cropped
+    and quantized on a log scale into 1 byte per cell (see quantized_footprint.quantize).
+    :return: JSON-compatible dict with keys 'shape' ([nlat, nlon]), 'codes' (base64 of uint8 codes, row-major,
+    from the south), 'log_offset', 'log_scale' and the keys of footprint_viz.get_footprint_grid other than 'values';
+    or None if the footprint is not available
+    """
+    res_time_per_km2 = get_residence_time(flight_id, profile, layer)
+    if res_time_per_km2 is None:
+        return None
+    grid = footprint_viz.get_footprint_grid(res_time_per_km2.load(), floor=CLIENT_GRID_FLOOR)
+    values = grid.pop('values')
+    codes, log_offset, log_scale = quantize(values, dtype='u1', floor=CLIENT_GRID_FLOOR)
+    grid.update({
+        'shape': list(codes.shape),
+        'codes': base64.b64encode(codes.tobytes()).decode('ascii'),
+        'log_offset': log_offset.item(),
+        'log_scale': log_scale.item(),
+    })
+    return json.loads(json.dumps(grid, cls=plotly.utils.PlotlyJSONEncoder))
+
+
+def get_footprint_grid_coordinates(grid):
+    """
+    :param grid: dict; see get_footprint_grid
+    :return: lon-lat corners of the footprint grid, in the order of mapbox image layers
+    """
+    (lon0, lon1), (lat0, lat1) = grid['lon'], grid['lat']
+    lon0, lon1 = lon0 - grid['dlon'] / 2, lon1 + grid['dlon'] / 2
+    lat0, lat1 = lat0 - grid['dlat'] / 2, lat1 + grid['dlat'] / 2
+    return [[lon0, lat1], [lon1, lat1], [lon1, lat0], [lon0, lat0]]
+
+
+@functools.lru_cache(maxsize=32)
+def get_footprint_contours(flight_id, profile, layer, residence_time_scale, residence_time_cutoff):
+    """
+    :return: JSON-compatible tuple (mapbox_layers, coordinates, colorscale_trace)
+    (see footprint_viz.get_footprint_contours) or None if the footprint is not available
+    """
+    res_time_per_km2 = get_residence_time(flight_id, profile, layer)
+    if res_time_per_km2 is None:
+        return None
+    contours = footprint_viz.get_footprint_contours(
+        res_time_per_km2.load(),
+        color_scale_transform=residence_time_scale,
+        residence_time_cutoff=residence_time_cutoff,
+    )
+    return tuple(json.loads(json.dumps(contours, cls=plotly.utils.PlotlyJSONEncoder)))
+
+
+def _get_query(flight_id, profile, layer, residence_time_scale, residence_time_cutoff):
+    return urllib.parse.urlencode({
+        'flight_id': flight_id,
+        'profile': profile,
+        'layer': layer,
+        'scale': residence_time_scale,
+        'cutoff': residence_time_cutoff,
+    })
+
+
+def _get_params_from_query():
+    args = flask.request.args
+    try:
+        return (
+            int(args['flight_id']),
+            args['profile'],
+            args['layer'],
+            args['scale'],
+            float(args['cutoff']),
+        )
+    except (KeyError, ValueError):
+        flask.abort(400)
+
+
+def _get_url_key(query, img_format):
+    """
+    The key of a URL of footprint images or tiles: a hash of the exact query string, so that it is validated
+    without parsing the query (see _get_params_from_query), and of all else which determines the content.
+    :param query: str; see _get_query
+    :param img_format: str; FOOTPRINT_IMG_FORMAT, with the suffix '-tiles' for tiles
+    """
+    return render_cache.get_key({
+        'query': query,
+        'format': img_format,
+        'footprint_store': get_footprint_store_signature(),
+        'version': RENDERING_VERSION,
+    })
+
+
+def _get_request_query():
+    return flask.request.query_string.decode('ascii', errors='replace')
+
+
+def get_footprint_img_url(flight_id, profile, layer, residence_time_scale, residence_time_cutoff):
+    """
+    URL of a footprint image served by serve_footprint_img; to be called within a Dash callback.
+    """
+    query = _get_query(flight_id, profile, layer, residence_time_scale, residence_time_cutoff)
+    key = _get_url_key(query, FOOTPRINT_IMG_FORMAT)
+    return dash.get_relative_path(f'/{FOOTPRINT_IMG_ROUTE}{key}.{FOOTPRINT_IMG_FORMAT}') + f'?{query}'
+
+
+def get_footprint_tiles_url(flight_id, profile, layer, residence_time_scale, residence_time_cutoff):
+    """
+    URL template ({z}/{x}/{y}) of footprint tiles served by serve_footprint_tile; to be called within a Dash callback.
+    """
+    query = _get_query(flight_id, profile, layer, residence_time_scale, residence_time_cutoff)
+    key = _get_url_key(query, f'{FOOTPRINT_IMG_FORMAT}-tiles')
+    return dash.get_relative_path(f'/{FOOTPRINT_TILES_ROUTE}{key}/') + '{z}/{x}/{y}.' + f'{FOOTPRINT_IMG_FORMAT}?{query}'
+
+
+@single_flight
+def _get_footprint_map_layers(flight_id, profile, layer, residence_time_scale, residence_time_cutoff):
+    params = flight_id, profile, layer, residence_time_scale, residence_time_cutoff
+    if FOOTPRINT_MAP_SOURCE == 'client':
+        grid = get_footprint_grid(flight_id, profile, layer)
+        if grid is None:
+            return None
+        return None, get_footprint_grid_coordinates(grid), None
+    elif FOOTPRINT_MAP_SOURCE == 'contours':
+        return get_footprint_contours(*params)
+    elif FOOTPRINT_MAP_SOURCE == 'tiles':
+        tile_source = get_footprint_tile_source(*params)
+        if tile_source is None:
+            return None
+        mapbox_layer = {
+            'sourcetype': 'raster',
+            'source': [get_footprint_tiles_url(*params)],
+        }
+        return [mapbox_layer], tile_source['coordinates'], tile_source['colorscale_trace']
+    else:
+        rendering = get_footprint_rendering(*params)
+        if rendering is None:
+            return None
+        _, meta = rendering
+        mapbox_layer = {
+            'sourcetype': 'image',
+            # the image itself is fetched by the browser (and cached there)
+            'source': get_footprint_img_url(*params),
+            'coordinates': meta['coordinates'],
+        }
+        return [mapbox_layer], meta['coordinates'], meta['colorscale_trace']
+
+
+@functools.lru_cache(maxsize=32)
+def _get_footprint_map_layers_in_memory(flight_id, profile, layer, residence_time_scale, residence_time_cutoff):
+    return _get_footprint_map_layers(flight_id, profile, layer, residence_time_scale, residence_time_cutoff)
+
+
+def _get_map_cache():
+    """
+    :return: tuple (cache of map layers, cache of its locks and counters, without eviction) or None if the cache
+    is disabled
+    """
+    global _map_cache, _map_cache_meta
+    if FOOTPRINT_MAP_CACHE_DIR is None:
+        return None
+
+    import diskcache
+    if _map_cache is None:
+        _map_cache = diskcache.Cache(
+            directory=FOOTPRINT_MAP_CACHE_DIR,
+            size_limit=FOOTPRINT_MAP_CACHE_SIZE,
+            eviction_policy='least-recently-used',
+            statistics=True,
+        )
+        _map_cache_meta = diskcache.Cache(directory=f'{FOOTPRINT_MAP_CACHE_DIR}/meta', eviction_policy='none')
+    return _map_cache, _map_cache_meta
+
+
+def get_footprint_map_layers(flight_id, profile, layer, residence_time_scale, residence_time_cutoff):
+    """
+    Mapbox layers of a footprint, according to FOOTPRINT_MAP_SOURCE; to be called within a Dash callback.
+    Served from the cache FOOTPRINT_MAP_CACHE_DIR, if available, or from memory.
+    :param residence_time_scale: str; a key of footprint_viz.COLOR_SCALE_TRANSFORMS
+    :return: tuple (mapbox_layers, coordinates, colorscale_trace) or None if the footprint is not available;
+    coordinates are the lon-lat corners of the footprint; with FOOTPRINT_MAP_SOURCE = 'client', mapbox_layers
+    and colorscale_trace are None, as they are made in the browser from get_footprint_grid
+    """
+    params = flight_id, profile, layer, residence_time_scale, residence_time_cutoff
+    caches = _get_map_cache()
+    if caches is None:
+        return _get_footprint_map_layers_in_memory(*params)
+    cache, meta = caches
+
+    key = render_cache.get_key({
+        'flight_id': flight_id,
+        'profile': profile,
+        'layer': layer,
+        'scale': residence_time_scale,
+        'cutoff': residence_time_cutoff,
+        'source': FOOTPRINT_MAP_SOURCE,
+        'format': FOOTPRINT_IMG_FORMAT,
+        # URLs of images and tiles depend on it
+        'path_prefix': dash.get_relative_path('/'),
+        'footprint_store': get_footprint_store_signature(),
+        'version': RENDERING_VERSION,
+    })
+    map_layers = cache.get(key, default=_MISSING)
+    if map_layers is _MISSING:
+        # one worker on the host computes, the others wait and take the result from the cache
+        import diskcache
+        with diskcache.Lock(meta, f'lock/{key}', expire=_MAP_CACHE_LOCK_EXPIRE):
+            map_layers = cache.get(key, default=_MISSING, retry=True)
+            if map_layers is _MISSING:
+                map_layers = _get_footprint_map_layers(*params)
+                # a footprint not available is kept for a while only, in case it becomes available
+                cache.set(key, map_layers, expire=_MAP_CACHE_NOT_AVAILABLE_EXPIRE if map_layers is None else None)
+            else:
+                meta.incr('stats/coalesced', retry=True)
+    return map_layers
+
+
+def get_footprint_map_cache_stats():
+    """
+    Statistics of the footprint map layers cache, shared by all workers on a host.
+    :return: dict or None if the cache is disabled (see FOOTPRINT_MAP_CACHE_DIR in config)
+    """
+    if _map_cache is None:
+        return None
+    hits, misses = _map_cache.stats()
+    return {
+        'hits': hits,
+        'misses': misses,
+        # misses which waited for another worker computing the same map layers
+        'coalesced': _map_cache_meta.get('stats/coalesced', default=0),
+        'volume': _map_cache.volume(),
+        'size_limit': _map_cache.size_limit,
+    }
+
+
+def _set_cache_headers(response, etag):
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = _FOOTPRINT_IMG_MAX_AGE
+    response.cache_control.immutable = True
+    return response
+
+
+def serve_footprint_img(key, img_format):
+    # the key must agree with the query, so that a URL is never reused for other content
+    if img_format != FOOTPRINT_IMG_FORMAT or key != _get_url_key(_get_request_query(), img_format):
+        flask.abort(404)
+    params = _get_params_from_query()
+
+    if flask.request.if_none_match.contains(key):
+        return _set_cache_headers(flask.Response(status=304), key)
+    rendering = get_footprint_rendering(*params)
+    if rendering is None:
+        flask.abort(404)
+    img_bytes, _ = rendering
+    return _set_cache_headers(flask.Response(img_bytes, mimetype=_MIMETYPE_BY_IMG_FORMAT[img_format]), key)
+
+
+def serve_footprint_tile(key, z, x, y, img_format):
+    if img_format != FOOTPRINT_IMG_FORMAT or key != _get_url_key(_get_request_query(), f'{img_format}-tiles') or \
+            not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        flask.abort(404)
+    params = _get_params_from_query()
+
+    etag = f'{key}-{z}-{x}-{y}'
+    if flask.request.if_none_match.contains(etag):
+        return _set_cache_headers(flask.Response(status=304), etag)
+    tile = get_footprint_tile(*params, z, x, y)
+    if tile is None:
+        flask.abort(404)
+    return _set_cache_headers(flask.Response(tile, mimetype=_MIMETYPE_BY_IMG_FORMAT[img_format]), etag)
+
+
+def register_footprint_routes(app):
+    """
+    Adds the routes of footprint images and tiles to the Flask server of a Dash app.
+    :param app: dash.Dash
+    """
+    app.server.add_url_rule(
+        f'{app.config.routes_pathname_prefix}{FOOTPRINT_IMG_ROUTE}<key>.<img_format>',
+        view_func=serve_footprint_img,
+    )
+    app.server.add_url_rule(
+        f'{app.config.routes_pathname_prefix}{FOOTPRINT_TILES_ROUTE}<key>/<int:z>/<int:x>/<int:y>.<img_format>',
+        view_func=serve_footprint_tile,
+    )
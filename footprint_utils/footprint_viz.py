@@ -1,9 +1,13 @@
+import copy
+import functools
 import colorcet
 import numpy as np
+import xarray as xr
+import numba
 import plotly
+import PIL.Image
 from pyproj import Transformer
 import datashader
-from datashader import transfer_functions as tf
 
 from footprint_utils import xarray_extras  # noq
 
@@ -12,6 +16,23 @@ _gcs_to_3857 = Transformer.from_crs(4326, 3857, always_xy=True)
 _3857_to_gcs = Transformer.from_crs(3857, 4326, always_xy=True)
 
 
+def _identity(x):
+    return x
+
+
+def _square(x):
+    return x ** 2
+
+
+# (value_to_color, color_to_value) by residence time scale name;
+# module-level functions (not lambdas), so that the transforms can be hashed and pickled
+COLOR_SCALE_TRANSFORMS = {
+    'lin': (_identity, _identity),
+    'sqrt': (np.sqrt, _square),
+    'log': (np.log, np.exp),
+}
+
+
 def trim_small_values(da, threshold=0.01, check_if_lon_lat_increasing=False):
     lon, lat = da.geo.get_lon_lat_label()
     if check_if_lon_lat_increasing:
@@ -85,57 +106,272 @@ def regrid(da, upsampling_resol_factor=None, proj=3857, regrid_resol=None, is_pr
     return da_regridded, get_spatial_extent(da_regridded, proj_tr_inv)
 
 
-def color_to_alpha(x):
-    return np.power(x, 1/2)
-
-
-def get_footprint_viz(da, color_scale_transform, residence_time_cutoff):
-    value_to_color, color_to_value = color_scale_transform
-
-    lat = da.geo.get_lat_label()
-
-    # BUG fix: must avoid poles - otherwise dash/plotly does not want to refresh the image layer on the map
-    # lat in [-85, 85] is because of the range of web Mercator projection
-    da = da.sel({lat: slice(-85, 85)})
-
-    # must increase precision from float16 to float32, otherwise problems with positivity before taking log or sqrt
-    da = da.astype('f4')
+def _get_quadmesh_cells(centers, npixels):
+    """
+    Maps pixels of a datashader Canvas to the cells of a rectilinear quadmesh along one axis,
+    the same way as datashader.Canvas.quadmesh does (with the Canvas range fitted to the quadmesh).
+    A pixel is covered by at most two cells (which holds as long as cells are not smaller than pixels);
+    datashader aggregates them with the mean.
+    :param centers: 1d numpy array; cell centers (in projected coordinates), increasing
+    :param npixels: int
+    :return: tuple (cell0, cell1, x_range); cell0 and cell1 are int numpy arrays of shape (npixels, ) with the first
+    and the last cell covering a pixel, -1 for pixels not covered
+    """
+    deltas = 0.5 * np.diff(centers)
+    breaks = np.concatenate([centers[:1] - deltas[:1], centers[:-1] + deltas, centers[-1:] + deltas[-1:]])
+    x_range = breaks[0], breaks[-1]
+    xs = ((breaks - x_range[0]) / (x_range[1] - x_range[0]) * npixels).astype(int).clip(0, npixels)
+    # the cell i covers pixels [lo[i], hi[i]); a cell which collapses to no pixel still covers one
+    lo = xs[:-1]
+    hi = np.maximum(xs[1:], lo + 1)
+    pixels = np.arange(npixels)
+    cell0 = np.searchsorted(hi, pixels, side='right')
+    cell1 = np.searchsorted(lo, pixels, side='right') - 1
+    covered = cell0 <= cell1
+    return np.where(covered, cell0, -1), np.where(covered, cell1, -1), x_range
+
+
+def _get_linear_upsampling(nsrc, nout):
+    """
+    Source positions and weights of the linear upsampling from nsrc to nout pixels along one axis,
+    the same way as datashader.Canvas.raster does.
+    :return: tuple (idx0, idx1, weight) of numpy arrays of shape (nout, )
+    """
+    if nsrc == nout:
+        idx = np.arange(nout)
+        return idx, idx, np.zeros(nout, dtype='f4')
+    scale = (nsrc - 1.) / ((nout - 1.) if nout > 1 else 1.)
+    src_f = scale * np.arange(nout)
+    idx0 = src_f.astype(int)
+    idx1 = np.minimum(idx0 + 1, nsrc - 1)
+    return idx0, idx1, (src_f - idx0).astype('f4')
+
+
+def _get_window(cell0, cell1, idx0, idx1, src_slice):
+    """
+    :param cell0, cell1: source cells of the intermediate pixels (see _get_quadmesh_cells)
+    :param idx0, idx1: intermediate pixels of the output pixels (see _get_linear_upsampling)
+    :param src_slice: slice of the source cells
+    :return: slice of the output pixels computed from any intermediate pixel computed from any of the source cells
+    """
+    start, stop, _ = src_slice.indices(max(cell0.max(), cell1.max()) + 1)
+    pixels, = np.nonzero(((cell0 >= start) & (cell0 < stop)) | ((cell1 >= start) & (cell1 < stop)))
+    if len(pixels) == 0:
+        return slice(0, 0)
+    out, = np.nonzero(((idx0 >= pixels[0]) & (idx0 <= pixels[-1])) | ((idx1 >= pixels[0]) & (idx1 <= pixels[-1])))
+    return slice(out[0], out[-1] + 1) if len(out) > 0 else slice(0, 0)
+
+
+class MercatorRemap:
+    """
+    Precomputed remapping of a rectilinear lon-lat grid onto an EPSG:3857 raster. It reproduces
+    regrid(da, upsampling_resol_factor, is_proj_rectilinear=True), i.e. datashader's quadmesh (the mean of the source
+    cells covering a pixel) followed by raster (linear upsampling, falling back to the nearest pixel next to nan's),
+    with both stages as NumPy gathers along precomputed row and column indices. A window of the raster (e.g. covering
+    a crop of the grid, see get_window) can be computed alone.
+    """
+    def __init__(self, lon_coords, lat_coords, regrid_resol, upsampling_resol):
+        """
+        :param lon_coords: 1d numpy array; increasing
+        :param lat_coords: 1d numpy array; increasing
+        :param regrid_resol: tuple (width, height) of the intermediate (quadmesh) raster
+        :param upsampling_resol: tuple (width, height) of the output raster
+        """
+        x, _ = _gcs_to_3857.transform(lon_coords, np.zeros_like(lon_coords))
+        _, y = _gcs_to_3857.transform(np.zeros_like(lat_coords), lat_coords)
+        # -1 points to the nan row / column appended to the source in apply
+        self._cell_col0, self._cell_col1, x_range = _get_quadmesh_cells(x, regrid_resol[0])
+        self._cell_row0, self._cell_row1, y_range = _get_quadmesh_cells(y, regrid_resol[1])
+
+        self._col0, self._col1, self._wx = _get_linear_upsampling(regrid_resol[0], upsampling_resol[0])
+        self._row0, self._row1, self._wy = _get_linear_upsampling(regrid_resol[1], upsampling_resol[1])
+        self._nearest_col = np.where(self._wx < 0.5, self._col0, self._col1)
+        self._nearest_row = np.where(self._wy < 0.5, self._row0, self._row1)
+
+        width, height = upsampling_resol
+        self.x = x_range[0] + (np.arange(width) + 0.5) * (x_range[1] - x_range[0]) / width
+        self.y = y_range[0] + (np.arange(height) + 0.5) * (y_range[1] - y_range[0]) / height
+        self.coordinates = get_spatial_extent(xr.Dataset(coords={'x': self.x, 'y': self.y}), _3857_to_gcs)
+
+    def get_window(self, lon_slice, lat_slice):
+        """
+        :param lon_slice: slice of the grid columns
+        :param lat_slice: slice of the grid rows
+        :return: tuple (rows, cols) of slices of the output raster; outside of them, the output is nan if the source
+        is nan outside of the slices
+        """
+        cols = _get_window(self._cell_col0, self._cell_col1, self._col0, self._col1, lon_slice)
+        rows = _get_window(self._cell_row0, self._cell_row1, self._row0, self._row1, lat_slice)
+        return rows, cols
+
+    def _quadmesh(self, values, cell_row0, cell_row1, cell_col0, cell_col1):
+        shape = values.shape[:-2] + (values.shape[-2] + 1, values.shape[-1] + 1)
+        src = np.zeros(shape, dtype='f4')
+        src[..., :-1, :-1] = values
+        count = np.zeros(shape, dtype='f4')
+        count[..., :-1, :-1] = np.isfinite(values)
+        src[count == 0] = 0
+
+        # nan-skipping mean over the (up to 2 x 2) cells covering a pixel;
+        # a pixel covered by a single cell takes it twice along the axis, which does not change the mean
+        agg, agg_count = [
+            (a[..., cell_col0] + a[..., cell_col1])[..., cell_row0, :] +
+            (a[..., cell_col0] + a[..., cell_col1])[..., cell_row1, :]
+            for a in (src, count)
+        ]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return agg / agg_count
+
+    def apply(self, values, window=None):
+        """
+        :param values: numpy array of shape (..., lat, lon); any leading dimensions (e.g. a stack of footprints)
+        :param window: None or tuple (rows, cols) of slices of the output raster (see get_window)
+        :return: float32 numpy array of shape (..., height, width) (of the window), with rows in increasing y
+        """
+        rows, cols = window if window is not None else (slice(None), slice(None))
+        col0, col1, wx = self._col0[cols], self._col1[cols], self._wx[cols]
+        row0, row1, wy = self._row0[rows], self._row1[rows], self._wy[rows]
+        if len(col0) == 0 or len(row0) == 0:
+            return np.empty(values.shape[:-2] + (len(row0), len(col0)), dtype='f4')
+
+        # only the quadmesh pixels the window is upsampled from
+        qcols, qrows = slice(col0.min(), col1.max() + 1), slice(row0.min(), row1.max() + 1)
+        agg = self._quadmesh(
+            values, self._cell_row0[qrows], self._cell_row1[qrows], self._cell_col0[qcols], self._cell_col1[qcols]
+        )
+        col0, col1, nearest_col = col0 - qcols.start, col1 - qcols.start, self._nearest_col[cols] - qcols.start
+        row0, row1, nearest_row = row0 - qrows.start, row1 - qrows.start, self._nearest_row[rows] - qrows.start
+
+        t = agg[..., col0]
+        t += wx * (agg[..., col1] - t)
+        out = t[..., row0, :]
+        out += wy[:, None] * (t[..., row1, :] - out)
+
+        nan_idx = np.nonzero(np.isnan(out))
+        out[nan_idx] = agg[nan_idx[:-2] + (nearest_row[nan_idx[-2]], nearest_col[nan_idx[-1]])]
+        return out
+
+
+@functools.lru_cache(maxsize=16)
+def _get_mercator_remap(lon_coords, lat_coords, regrid_resol, upsampling_resol):
+    return MercatorRemap(np.array(lon_coords), np.array(lat_coords), regrid_resol, upsampling_resol)
+
+
+def remap_to_mercator(da, upsampling_resol_factor=(10, 10), grid=None):
+    """
+    Same as regrid(da, upsampling_resol_factor=upsampling_resol_factor, is_proj_rectilinear=True), with the remapping
+    precomputed once per grid (see MercatorRemap).
+    :param da: DataArray with (increasing) lon and lat dimensions as the last two ones; other dimensions are kept
+    :param grid: None or tuple (lon_coords, lat_coords) of a grid of which da is a crop (e.g. by trim_small_values),
+    with nan's outside the crop; the remapping is then the one of the grid, and only the window of its raster which
+    covers the crop is computed; so the result is the one of regrid of the uncropped da, restricted to the window
+    :return: tuple (DataArray with dimensions (..., y, x), list of lon-lat coordinates of the corners)
+    """
+    lon, lat = da.geo.get_lon_lat_label()
+    da = da.reset_coords(drop=True).transpose(..., lat, lon)
+    lon_coords, lat_coords = (da[lon].values, da[lat].values) if grid is None else grid
+    nlon, nlat = len(lon_coords), len(lat_coords)
+    remap = _get_mercator_remap(
+        tuple(lon_coords.tolist()),
+        tuple(lat_coords.tolist()),
+        (nlon, nlat * 4),
+        (upsampling_resol_factor[0] * nlon, upsampling_resol_factor[1] * nlat),
+    )
+
+    values = da.values
+    window = None
+    if grid is not None:
+        i0, j0 = np.searchsorted(lon_coords, da[lon].values[0]), np.searchsorted(lat_coords, da[lat].values[0])
+        lon_slice, lat_slice = slice(i0, i0 + len(da[lon])), slice(j0, j0 + len(da[lat]))
+        if values.shape[-2:] != (nlat, nlon):
+            values = np.full(values.shape[:-2] + (nlat, nlon), np.nan, dtype=values.dtype)
+            values[..., lat_slice, lon_slice] = da.values
+        window = remap.get_window(lon_slice, lat_slice)
+
+    rows, cols = window if window is not None else (slice(None), slice(None))
+    x, y = remap.x[cols], remap.y[rows]
+    da_regridded = xr.DataArray(
+        remap.apply(values, window=window),
+        dims=da.dims[:-2] + ('y', 'x'),
+        coords={**{dim: da[dim] for dim in da.dims[:-2]}, 'x': x, 'y': y},
+        name=da.name,
+    )
+    if window is None:
+        coordinates = remap.coordinates
+    else:
+        coordinates = get_spatial_extent(xr.Dataset(coords={'x': x, 'y': y}), _3857_to_gcs)
+    return da_regridded, coordinates
 
-    da = trim_small_values(da, threshold=residence_time_cutoff)
 
-    agg, coordinates = regrid(da, upsampling_resol_factor=(10, 10), is_proj_rectilinear=True)
-    agg_max = agg.max().item()
-    agg_min = agg.min().item()
-    # print(agg_max, agg_min)
+def color_to_alpha(x):
+    return np.power(x, 1/2)
 
-    agg_color = value_to_color(agg)
-    color_max = value_to_color(agg_max)
-    color_min = value_to_color(agg_min)
 
-    agg_alpha = color_to_alpha(agg_color - color_min)
-    alpha_max = color_to_alpha(color_max - color_min)
-    im1 = tf.shade(agg_color, cmap=colorcet.CET_L17, how='linear', alpha=0, span=[color_min, color_max])
-    im2 = tf.shade(agg_alpha, cmap='#000000', how='linear', alpha=255, min_alpha=0, span=[0, alpha_max])
-    im = im1 + im2
-    img = im[::-1].to_pil()
+def _hex_and_alpha_to_rgba(_hex, a):
+    r, g, b = plotly.colors.hex_to_rgb(_hex)
+    return f'rgba({r}, {g}, {b}, {a})'
+
+
+def _get_shading_lut(colormap):
+    """
+    RGBA lookup table of the footprint shading: colors of the colormap with the alpha ramp color_to_alpha;
+    as color_to_alpha is a power function, the ramp relative to the color span does not depend on the span.
+    The extra last entry (fully transparent) is for nan's.
+    :return: uint32 numpy array of shape (len(colormap) + 1, ); each item is an RGBA pixel
+    """
+    ncolors = len(colormap)
+    lut = np.zeros((ncolors + 1, 4), dtype='u1')
+    lut[:-1, :3] = [plotly.colors.hex_to_rgb(c) for c in colormap]
+    lut[:-1, 3] = 255 * color_to_alpha(np.linspace(0, 1, ncolors)) / color_to_alpha(1)
+    return lut.view('u4').ravel()
+
+
+_COLORMAP = colorcet.CET_L17
+_SHADING_LUT = _get_shading_lut(_COLORMAP)
+# colorscale of the colorbar; the same for any color span (see _get_shading_lut)
+_COLOR_FRAC = np.linspace(0, 1, len(_COLORMAP))
+_COLORSCALE = [
+    [c, _hex_and_alpha_to_rgba(_hex, a)]
+    for c, _hex, a in zip(_COLOR_FRAC, _COLORMAP, color_to_alpha(_COLOR_FRAC) / color_to_alpha(1))
+]
+
+
+def shade(color, color_min, color_max):
+    """
+    Shades footprint colors through the lookup table _SHADING_LUT; replaces datashader's tf.shade of colors and alpha
+    composed into one image.
+    :param color: float numpy array of shape (height, width), with rows in increasing y; nan's are transparent
+    :param color_min: float; color mapped to the first entry of the colormap
+    :param color_max: float; color mapped to the last entry of the colormap
+    :return: uint8 numpy array of shape (height, width, 4) of RGBA pixels, with rows as in color
+    (which agrees with the corners' order of get_spatial_extent)
+    """
+    nlevels = len(_SHADING_LUT) - 1
+    out = np.empty(color.shape + (4, ), dtype='u1')
+    idx = np.subtract(color, color_min, dtype='f4')
+    if color_max > color_min:
+        idx *= (nlevels - 1) / (color_max - color_min)
+        np.rint(idx, out=idx)
+        np.clip(idx, 0, nlevels - 1, out=idx)
+    else:
+        idx[...] = nlevels - 1
+    idx[np.isnan(color)] = nlevels
+    np.take(_SHADING_LUT, idx.astype(np.intp), out=out.view('u4').reshape(color.shape))
+    return out
 
-    # setup colorscale
-    colorscale = colorcet.CET_L17
-    ncolors = len(colorscale)
 
-    def hex_and_alpha_to_rgba(_hex, a):
-        r, g, b = plotly.colors.hex_to_rgb(_hex)
-        return f'rgba({r}, {g}, {b}, {a})'
+def _bucket(x, significant_digits=4):
+    return float(f'{x:.{significant_digits}g}')
 
-    color_frac = np.linspace(0, 1, ncolors)
-    alpha = color_to_alpha(color_frac * (color_max - color_min)) / alpha_max
-    cs = [hex_and_alpha_to_rgba(c, a) for c, a in zip(colorscale, alpha)]
 
+@functools.lru_cache(maxsize=1024)
+def _get_colorscale_trace(color_scale_transform, color_min, color_max):
+    _, color_to_value = color_scale_transform
     nticks = 11
     tickpos = np.linspace(0, 1, nticks)
     tickvals = color_to_value((1 - tickpos) * color_min + tickpos * color_max)
     ticktext = [f'{v:.1e}' for v in tickvals]
-    colorscale_trace = {
+    return {
         'marker': {
             'cmax': 1, 'cmin': 0,
             'colorbar': {
@@ -157,7 +393,7 @@ def get_footprint_viz(da, color_scale_transform, residence_time_cutoff):
                 'yanchor': 'bottom',
                 'yref': 'paper',
             },
-            'colorscale': [[c, rgba] for c, rgba in zip(color_frac, cs)],
+            'colorscale': _COLORSCALE,
             'showscale': True,
         },
         'mode': 'markers',
@@ -167,4 +403,375 @@ def get_footprint_viz(da, color_scale_transform, residence_time_cutoff):
         'y': [None],
     }
 
+
+def get_colorscale_trace(color_scale_transform, color_min, color_max):
+    """
+    Colorbar of a footprint; memoized by color_scale_transform and the color span rounded to 4 significant digits
+    (which is far below the precision of tick labels).
+    :return: dict; a plotly trace
+    """
+    trace = _get_colorscale_trace(color_scale_transform, _bucket(color_min), _bucket(color_max))
+    return copy.deepcopy(trace)
+
+
+def get_footprint_viz(da, color_scale_transform, residence_time_cutoff):
+    if isinstance(color_scale_transform, str):
+        color_scale_transform = COLOR_SCALE_TRANSFORMS[color_scale_transform]
+    value_to_color, color_to_value = color_scale_transform
+
+    lon, lat = da.geo.get_lon_lat_label()
+
+    # BUG fix: must avoid poles - otherwise dash/plotly does not want to refresh the image layer on the map
+    # lat in [-85, 85] is because of the range of web Mercator projection
+    da = da.sel({lat: slice(-85, 85)})
+
+    # must increase precision from float16 to float32, otherwise problems with positivity before taking log or sqrt
+    da = da.astype('f4')
+    # trim_small_values crops da; its remap is a window of the one of the whole grid, which is computed once
+    grid = da[lon].values, da[lat].values
+
+    da = trim_small_values(da, threshold=residence_time_cutoff)
+
+    agg, coordinates = remap_to_mercator(da, upsampling_resol_factor=(10, 10), grid=grid)
+    agg = agg.values
+    agg_max = np.nanmax(agg)
+    agg_min = np.nanmin(agg)
+
+    # value_to_color is increasing, so it is enough to apply it to the min and max
+    color_max = value_to_color(agg_max)
+    color_min = value_to_color(agg_min)
+    img = PIL.Image.fromarray(shade(value_to_color(agg), color_min, color_max), mode='RGBA')
+
+    colorscale_trace = get_colorscale_trace(color_scale_transform, color_min.item(), color_max.item())
+
     return img, coordinates, colorscale_trace
+
+
+def get_footprint_grid(da, floor):
+    """
+    Prepares a footprint for rendering in the browser (see assets/footprint_client_rendering.js), where the color
+    scale transform and the cutoff are applied; the counterpart of get_footprint_viz.
+    :param floor: float; relative to the max of the footprint; the footprint is cropped to the values above it,
+    so it must not exceed the smallest residence time cutoff available
+    :return: dict with keys 'values' (numpy array of shape (lat, lon); 0 below the floor), 'lon', 'lat'
+    (the first and the last cell centers), 'dlon', 'dlat' (cell sizes), 'colormap' (list of RGB triples)
+    and 'colorscale_trace' (a template; the client sets its ticks)
+    """
+    lon, lat = da.geo.get_lon_lat_label()
+    dlon, dlat = (da[lon][1] - da[lon][0]).item(), (da[lat][1] - da[lat][0]).item()
+    da = da.sel({lat: slice(-85, 85)}).astype('f4')
+    da = trim_small_values(da, threshold=floor, check_if_lon_lat_increasing=True).transpose(lat, lon)
+    lon_coords, lat_coords = da[lon].values, da[lat].values
+    return {
+        'values': np.nan_to_num(da.values, nan=0),
+        'lon': [lon_coords[0].item(), lon_coords[-1].item()],
+        'lat': [lat_coords[0].item(), lat_coords[-1].item()],
+        'dlon': abs(dlon),
+        'dlat': abs(dlat),
+        'colormap': [list(plotly.colors.hex_to_rgb(c)) for c in _COLORMAP],
+        'colorscale_trace': get_colorscale_trace(COLOR_SCALE_TRANSFORMS['lin'], 0, 1),
+    }
+
+
+# half of the extent of the EPSG:3857 (web Mercator) plane, in metres
+_MERCATOR_HALF_EXTENT = 20037508.342789244
+
+
+def _get_linear_interpolation(centers, points):
+    """
+    Indices and weights of the linear interpolation between cell centers along one axis; points within a half cell
+    beyond the outer centers take the outer cell.
+    :param centers: 1d numpy array; increasing, of length >= 2
+    :param points: 1d numpy array
+    :return: tuple (idx0, idx1, weight) of numpy arrays of the shape of points; -1 for points outside the cells
+    """
+    idx0 = np.clip(np.searchsorted(centers, points, side='right') - 1, 0, len(centers) - 2)
+    idx1 = idx0 + 1
+    weight = np.clip((points - centers[idx0]) / (centers[idx1] - centers[idx0]), 0, 1).astype('f4')
+    half_cell0, half_cell1 = (centers[1] - centers[0]) / 2, (centers[-1] - centers[-2]) / 2
+    outside = (points < centers[0] - half_cell0) | (points > centers[-1] + half_cell1)
+    return np.where(outside, -1, idx0), np.where(outside, -1, idx1), weight
+
+
+def get_footprint_tile_source(da, color_scale_transform, residence_time_cutoff):
+    """
+    Prepares a footprint for rendering XYZ map tiles with get_footprint_tile; the counterpart of get_footprint_viz.
+    :return: dict with keys 'values' (numpy array of shape (lat, lon); nan below the cutoff), 'x', 'y'
+    (EPSG:3857 coordinates of the cell centers), 'color_scale_transform', 'color_min', 'color_max',
+    'coordinates' (lon-lat corners of the footprint extent) and 'colorscale_trace'
+    """
+    if isinstance(color_scale_transform, str):
+        color_scale_transform = COLOR_SCALE_TRANSFORMS[color_scale_transform]
+    value_to_color, _ = color_scale_transform
+
+    lon, lat = da.geo.get_lon_lat_label()
+    da = da.sel({lat: slice(-85, 85)}).astype('f4')
+    da = trim_small_values(da, threshold=residence_time_cutoff).transpose(lat, lon)
+    x, _ = _gcs_to_3857.transform(da[lon].values, np.zeros(len(da[lon])))
+    _, y = _gcs_to_3857.transform(np.zeros(len(da[lat])), da[lat].values)
+
+    values = da.values
+    color_min = value_to_color(np.nanmin(values)).item()
+    color_max = value_to_color(np.nanmax(values)).item()
+    extent = xr.Dataset(coords={'x': [1.5 * x[0] - 0.5 * x[1], 1.5 * x[-1] - 0.5 * x[-2]],
+                                'y': [1.5 * y[0] - 0.5 * y[1], 1.5 * y[-1] - 0.5 * y[-2]]})
+    return {
+        'values': values,
+        'x': x,
+        'y': y,
+        'color_scale_transform': color_scale_transform,
+        'color_min': color_min,
+        'color_max': color_max,
+        'coordinates': get_spatial_extent(extent, _3857_to_gcs),
+        'colorscale_trace': get_colorscale_trace(color_scale_transform, color_min, color_max),
+    }
+
+
+def get_footprint_tile(tile_source, z, x, y, tile_size=256):
+    """
+    Renders an XYZ (web Mercator) map tile of a footprint: values are interpolated linearly in EPSG:3857 between
+    cell centers (falling back to the nearest cell next to nan's) and shaded as in get_footprint_viz.
+    :param tile_source: dict; see get_footprint_tile_source
+    :return: PIL.Image or None if the tile does not intersect the footprint
+    """
+    res = 2 * _MERCATOR_HALF_EXTENT / (2 ** z * tile_size)
+    pixels = np.arange(tile_size) + 0.5
+    px = -_MERCATOR_HALF_EXTENT + (x * tile_size + pixels) * res
+    py = _MERCATOR_HALF_EXTENT - (y * tile_size + pixels) * res  # rows from the top
+
+    col0, col1, wx = _get_linear_interpolation(tile_source['x'], px)
+    row0, row1, wy = _get_linear_interpolation(tile_source['y'], py)
+    if (col0 < 0).all() or (row0 < 0).all():
+        return None
+
+    values = tile_source['values']
+    # -1 points to the nan row / column appended
+    src = np.full((values.shape[0] + 1, values.shape[1] + 1), np.nan, dtype='f4')
+    src[:-1, :-1] = values
+    t = src[:, col0]
+    t += wx * (src[:, col1] - t)
+    out = t[row0, :]
+    out += wy[:, None] * (t[row1, :] - out)
+    nan_idx = np.nonzero(np.isnan(out))
+    nearest_row, nearest_col = np.where(wy < 0.5, row0, row1), np.where(wx < 0.5, col0, col1)
+    out[nan_idx] = src[nearest_row[nan_idx[0]], nearest_col[nan_idx[1]]]
+
+    value_to_color, _ = tile_source['color_scale_transform']
+    rgba = shade(value_to_color(out), tile_source['color_min'], tile_source['color_max'])
+    return PIL.Image.fromarray(rgba, mode='RGBA')
+
+
+@numba.njit('int64(int64[:], int64[:], int64[:], int64[:])', cache=True)
+def _chain_isoline_segments(next_edge, start_edges, order, ring_start):
+    """
+    Chains isoline segments into closed rings; each crossed edge is the start of exactly one segment.
+    :param next_edge: numpy 1d-array; next_edge[e] is the end edge of the segment starting at the edge e
+    :param start_edges: numpy 1d-array of the crossed edges
+    :param order: numpy 1d-array of size len(start_edges) + (number of rings); receives the edges of consecutive
+    rings, each one closed (the first edge repeated at the end)
+    :param ring_start: numpy 1d-array of size len(start_edges) + 1; receives the offsets of rings in order
+    :return: number of rings
+    """
+    visited = np.zeros(len(next_edge), dtype=np.bool_)
+    nrings = 0
+    j = 0
+    for i in range(len(start_edges)):
+        e0 = start_edges[i]
+        if visited[e0]:
+            continue
+        ring_start[nrings] = j
+        nrings += 1
+        e = e0
+        while True:
+            visited[e] = True
+            order[j] = e
+            j += 1
+            e = next_edge[e]
+            if e == e0:
+                break
+        order[j] = e0
+        j += 1
+    ring_start[nrings] = j
+    return nrings
+
+
+def _get_isoline_rings(values, level):
+    """
+    Marching squares: closed isolines of values at level, oriented so that values >= level are on the left
+    (hence exterior rings are counter-clockwise and holes are clockwise); saddles are resolved by the cell mean.
+    :param values: 2d numpy array (y, x) with no nan's; its border must be below level, so that isolines are closed
+    :return: list of numpy arrays of shape (n, 2) of (x, y) in index coordinates; the first point is repeated at the end
+    """
+    ny, nx = values.shape
+    high = values >= level
+    # cell corners counter-clockwise from the bottom-left: a, b, c, d; the cell edge k goes from corner k to k + 1
+    corners = np.stack([high[:-1, :-1], high[:-1, 1:], high[1:, 1:], high[1:, :-1]], axis=-1)
+    next_corners = np.roll(corners, -1, axis=-1)
+    high_to_low = corners & ~next_corners
+    low_to_high = ~corners & next_corners
+
+    ci, cj, k = np.nonzero(high_to_low)
+    if len(k) == 0:
+        return []
+    # a segment goes from a high-to-low edge to a low-to-high edge of the cell; in saddles (two segments per cell),
+    # to the next edge if the center is high, to the previous edge otherwise
+    end_k = np.argmax(low_to_high[ci, cj], axis=-1)
+    saddle = high_to_low[ci, cj].sum(axis=-1) == 2
+    center = (values[ci, cj] + values[ci, cj + 1] + values[ci + 1, cj + 1] + values[ci + 1, cj]) / 4
+    end_k = np.where(saddle, np.where(center >= level, k + 1, k + 3) % 4, end_k)
+
+    # edge ids: horizontal edges (i, j)-(i, j+1) first, then vertical edges (i, j)-(i+1, j)
+    nh = ny * (nx - 1)
+    cell_edges = np.stack([ci * (nx - 1) + cj, nh + ci * nx + cj + 1, (ci + 1) * (nx - 1) + cj, nh + ci * nx + cj], axis=-1)
+    start_edges = np.take_along_axis(cell_edges, k[:, None], axis=-1)[:, 0]
+    end_edges = np.take_along_axis(cell_edges, end_k[:, None], axis=-1)[:, 0]
+
+    next_edge = np.full(nh + (ny - 1) * nx, -1, dtype='i8')
+    next_edge[start_edges] = end_edges
+    order = np.empty(2 * len(start_edges), dtype='i8')
+    ring_start = np.empty(len(start_edges) + 1, dtype='i8')
+    nrings = _chain_isoline_segments(next_edge, start_edges, order, ring_start)
+    order = order[:ring_start[nrings]]
+
+    # positions of crossing points, interpolated linearly along edges
+    vertical = order >= nh
+    h_idx, v_idx = order, order - nh
+    i = np.where(vertical, v_idx // nx, h_idx // (nx - 1))
+    j = np.where(vertical, v_idx % nx, h_idx % (nx - 1))
+    v0 = values[i, j]
+    v1 = np.where(vertical, values[np.minimum(i + 1, ny - 1), j], values[i, np.minimum(j + 1, nx - 1)])
+    t = (level - v0) / (v1 - v0)
+    points = np.stack([np.where(vertical, j, j + t), np.where(vertical, i + t, i)], axis=-1)
+    return [points[ring_start[r]:ring_start[r + 1]] for r in range(nrings)]
+
+
+def _simplify_ring(ring, tolerance):
+    """
+    Douglas-Peucker simplification of a closed ring.
+    :param ring: numpy array of shape (n, 2); the first point is repeated at the end
+    :param tolerance: float; max distance of removed points from the simplified ring
+    :return: numpy array of shape (m, 2), m <= n
+    """
+    keep = np.zeros(len(ring), dtype=bool)
+    keep[[0, -1]] = True
+    stack = [(0, len(ring) - 1)]
+    while stack:
+        i0, i1 = stack.pop()
+        if i1 - i0 < 2:
+            continue
+        p0, p1 = ring[i0], ring[i1]
+        pts = ring[i0 + 1:i1]
+        d = p1 - p0
+        norm = np.hypot(*d)
+        if norm > 0:
+            dist = np.abs(d[0] * (pts[:, 1] - p0[1]) - d[1] * (pts[:, 0] - p0[0])) / norm
+        else:
+            dist = np.hypot(pts[:, 0] - p0[0], pts[:, 1] - p0[1])
+        i = np.argmax(dist)
+        if dist[i] > tolerance:
+            keep[i0 + 1 + i] = True
+            stack.extend([(i0, i0 + 1 + i), (i0 + 1 + i, i1)])
+    return ring[keep]
+
+
+def _get_signed_area(ring):
+    x, y = ring[:, 0], ring[:, 1]
+    return (np.dot(x[:-1], y[1:]) - np.dot(x[1:], y[:-1])) / 2
+
+
+def _is_inside(point, ring):
+    x, y = point
+    x0, y0, x1, y1 = ring[:-1, 0], ring[:-1, 1], ring[1:, 0], ring[1:, 1]
+    crosses = (y0 > y) != (y1 > y)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x_cross = x0 + (y - y0) * (x1 - x0) / (y1 - y0)
+    return np.count_nonzero(crosses & (x < x_cross)) % 2 == 1
+
+
+def _get_superlevel_polygons(values, level, tolerance):
+    """
+    :return: list of polygons covering values >= level; a polygon is a list of rings (numpy arrays of shape (n, 2)
+    in index coordinates), the exterior one (counter-clockwise) first, then its holes (clockwise)
+    """
+    rings = [_simplify_ring(ring, tolerance) for ring in _get_isoline_rings(values, level)]
+    rings = [ring for ring in rings if len(ring) >= 4]
+    areas = np.array([_get_signed_area(ring) for ring in rings])
+    exteriors = [i for i in np.argsort(areas) if areas[i] > 0]  # from the smallest
+    polygons = {i: [rings[i]] for i in exteriors}
+    for i in np.nonzero(areas < 0)[0]:
+        # a hole belongs to the smallest exterior ring containing it
+        for e in exteriors:
+            if areas[e] > -areas[i] and _is_inside(rings[i][0], rings[e]):
+                polygons[e].append(rings[i])
+                break
+    return list(polygons.values())
+
+
+def get_footprint_contours(da, color_scale_transform, residence_time_cutoff, nlevels=10, tolerance=0.2):
+    """
+    Renders a footprint as filled contours at log-spaced levels of residence time, from the cutoff to the max, as mapbox
+    fill layers of GeoJSON polygons; the counterpart of get_footprint_viz. A layer covers the values above its level
+    and is drawn over the lower ones; its color is taken at the middle of the band up to the next level, and its
+    opacity is such that the opacity of the stack matches the alpha ramp of shade.
+    :param nlevels: int; number of contour levels
+    :param tolerance: float; tolerance of the polygon simplification, in grid cells
+    :return: tuple (mapbox_layers, coordinates, colorscale_trace); coordinates are the lon-lat corners of
+    the footprint extent
+    """
+    if isinstance(color_scale_transform, str):
+        color_scale_transform = COLOR_SCALE_TRANSFORMS[color_scale_transform]
+    value_to_color, _ = color_scale_transform
+
+    lon, lat = da.geo.get_lon_lat_label()
+    dlon, dlat = (da[lon][1] - da[lon][0]).item(), (da[lat][1] - da[lat][0]).item()
+    da = da.sel({lat: slice(-85, 85)}).astype('f4')
+    da = trim_small_values(da, threshold=residence_time_cutoff).transpose(lat, lon)
+    lon0, lat0 = da[lon][0].item(), da[lat][0].item()
+
+    # zero border, so that all isolines are closed
+    values = np.pad(np.nan_to_num(da.values, nan=0), 1)
+    value_max = values.max().item()
+
+    lon1, lat1 = lon0 + (values.shape[1] - 3) * dlon, lat0 + (values.shape[0] - 3) * dlat
+    x0, x1, y0, y1 = lon0 - abs(dlon) / 2, lon1 + abs(dlon) / 2, lat0 - abs(dlat) / 2, lat1 + abs(dlat) / 2
+    coordinates = [[x0, y0], [x1, y0], [x1, y1], [x0, y1]]
+    if not value_max > 0:
+        # all nan or zero (as in get_footprint_viz, the color span is then nan)
+        color_nan = float(value_to_color(np.nan))
+        return [], coordinates, get_colorscale_trace(color_scale_transform, color_nan, color_nan)
+
+    levels = np.geomspace(residence_time_cutoff * value_max, value_max, nlevels + 1)
+    color_min, color_max = float(value_to_color(levels[0])), float(value_to_color(value_max))
+    band_colors = value_to_color(np.sqrt(levels[:-1] * levels[1:]))
+    color_frac = np.clip((band_colors - color_min) / (color_max - color_min), 0, 1) if color_max > color_min else \
+        np.ones_like(band_colors)
+    alpha = color_to_alpha(color_frac) / color_to_alpha(1)
+
+    mapbox_layers = []
+    stack_alpha = 0
+    for level, frac, a in zip(levels[:-1], color_frac, alpha):
+        polygons = _get_superlevel_polygons(values, level, tolerance)
+        if not polygons:
+            continue
+        # from index coordinates (with the border) to lon-lat
+        geometry = {
+            'type': 'MultiPolygon',
+            'coordinates': [
+                [
+                    np.stack([lon0 + (ring[:, 0] - 1) * dlon, lat0 + (ring[:, 1] - 1) * dlat], axis=-1).round(4).tolist()
+                    for ring in polygon
+                ]
+                for polygon in polygons
+            ],
+        }
+        mapbox_layers.append({
+            'sourcetype': 'geojson',
+            'source': {'type': 'Feature', 'properties': {'level': level.item()}, 'geometry': geometry},
+            'type': 'fill',
+            'color': _COLORMAP[int(np.rint(frac * (len(_COLORMAP) - 1)))],
+            'opacity': 1 - (1 - a) / (1 - stack_alpha) if stack_alpha < 1 else 0,
+        })
+        stack_alpha = a
+
+    colorscale_trace = get_colorscale_trace(color_scale_transform, color_min, color_max)
+    return mapbox_layers, coordinates, colorscale_trace
@@ -20,32 +20,12 @@ def hasl_by_pressure(p):
     return (1 - (p / p_0) ** (R_0 / (c_p * M))) * c_p * T_0 / g
 
 
-@numba.njit
-def _insert_nan(a, na, nan_idx, ni, b):
+@numba.njit('int64[:](int64, int64[:], int64, int64[:])', cache=True)
+def _insert_nan2(na, nan_idx, ni, idx):
     """
     For each index i in the array b, find the last index j in the array a, such that a[j] <= b[i];
     if it does not exist, j == -1.
-    :param a: numpy 1d-array
-    :param nan_idx: numpy 1d-array
-    :return: numpy array of int8 of size of the array b
-    """
-    j = 0
-    k = 0
-    for i in range(na):
-        b[j] = a[i]
-        j += 1
-        if k < ni and nan_idx[k] == i:
-            j += 1
-            k += 1
-    return b
-
-
-@numba.njit
-def _insert_nan2(a, na, nan_idx, ni, idx):
-    """
-    For each index i in the array b, find the last index j in the array a, such that a[j] <= b[i];
-    if it does not exist, j == -1.
-    :param a: numpy 1d-array
+    :param na: int; length of the array a
     :param nan_idx: numpy 1d-array
     :return: numpy array of int8 of size of the array b
     """
@@ -60,7 +40,28 @@ def _insert_nan2(a, na, nan_idx, ni, idx):
     return idx
 
 
+def _get_fill_value(dtype):
+    dtype_kind = dtype.kind
+    if dtype_kind == 'f' or dtype_kind == 'O':
+        return np.nan
+    elif dtype_kind == 'M':
+        return np.datetime64('nat')
+    elif dtype_kind == 'm':
+        return np.timedelta64('nat')
+    elif dtype_kind == 'i':
+        return 0
+    else:
+        raise ValueError(f'a has unsupported dtype kind={dtype_kind}; dtype={dtype}')
+
+
 def insert_nan(a_, nan_idx, fill_value=None):
+    """
+    Inserts a fill value after each of the positions nan_idx of an array or a Series.
+    :param a_: numpy array (1d or 2d, in which case rows are inserted) or pandas Series; in the latter case,
+    NaT is inserted into its index
+    :param nan_idx: numpy 1d-array of int; increasing
+    :param fill_value: if None, nan, NaT or 0, depending on dtype of a_; float arrays are cast to float64
+    """
     ni = len(nan_idx)
     if ni == 0:
         return a_
@@ -69,24 +70,15 @@ def insert_nan(a_, nan_idx, fill_value=None):
 
     dtype_kind = a.dtype.kind
     if fill_value is None:
-        if dtype_kind == 'f' or dtype_kind == 'O':
-            fill_value = np.nan
-        elif dtype_kind == 'M':
-            fill_value = np.datetime64('nat')
-        elif dtype_kind == 'm':
-            fill_value = np.timedelta64('nat')
-        elif dtype_kind == 'i':
-            fill_value = 0
-        else:
-            raise ValueError(f'a has unsupported dtype kind={dtype_kind}; dtype={a.dtype}')
+        fill_value = _get_fill_value(a.dtype)
 
     if dtype_kind == 'f':
         a = a.astype('f8')
 
     na = len(a)
-    b = np.full(shape=na + ni, fill_value=fill_value, dtype=a.dtype)
-    idx = np.empty_like(a, dtype='i8')
-    idx = _insert_nan2(a, na, nan_idx, ni, idx)
+    b = np.full(shape=(na + ni, ) + a.shape[1:], fill_value=fill_value, dtype=a.dtype)
+    idx = np.empty(na, dtype='i8')
+    idx = _insert_nan2(na, np.asarray(nan_idx, dtype='i8'), ni, idx)
     b[idx] = a
 
     if isinstance(a_, pd.Series):
@@ -96,12 +88,207 @@ def insert_nan(a_, nan_idx, fill_value=None):
         return b
 
 
+def get_timeseries_gaps(time, gap=np.timedelta64(4, 'D')):
+    """
+    :param time: numpy 1d-array of datetime64; increasing
+    :return: numpy 1d-array of int; the positions after which a time gap longer than gap starts (see insert_nan)
+    """
+    nan_idx, = np.nonzero(np.diff(time) > gap)
+    return nan_idx
+
+
 def insert_nan_into_timeseries_gaps(timeseries, gap=np.timedelta64(4, 'D'), fill_value=None):
-    dtime = timeseries.index.to_series().diff().values[1:]
-    nan_idx, = np.nonzero(dtime > gap)
+    nan_idx = get_timeseries_gaps(timeseries.index.values, gap=gap)
     return insert_nan(timeseries, nan_idx, fill_value=fill_value)
 
 
+@numba.njit('int64(uint8[:, :], int64[:], boolean[:], uint8[:], uint8[:, :])', cache=True)
+def _insert_gap_rows(src, row_idx, is_gap, fill, dst):
+    """
+    Copies the rows row_idx of the array src into the array dst, with the row fill after each row flagged by is_gap.
+    :param src: numpy 2d-array of uint8; rows are records (see insert_nan_into_gaps)
+    :param row_idx: numpy 1d-array of int
+    :param is_gap: numpy 1d-array of bool, aligned with row_idx
+    :param fill: numpy 1d-array of uint8; a record
+    :param dst: numpy 2d-array of uint8 with len(row_idx) + is_gap.sum() rows
+    :return: number of rows filled
+    """
+    j = 0
+    for r in range(len(row_idx)):
+        dst[j, :] = src[row_idx[r], :]
+        j += 1
+        if is_gap[r]:
+            dst[j, :] = fill
+            j += 1
+    return j
+
+
+def insert_nan_into_gaps(time, arrays, gap=np.timedelta64(4, 'D'), rows=None):
+    """
+    Batched version of insert_nan_into_timeseries_gaps for several arrays sharing a time index, and possibly several
+    series made of subsets of rows. The time and all the arrays are packed into one record per row, so that
+    the gaps of all the series are filled in one pass into a preallocated array.
+    :param time: numpy 1d-array of datetime64
+    :param arrays: numpy 2d-array with rows aligned with time, or list of numpy arrays of any dtypes supported by
+    insert_nan, with the first axis aligned with time; float arrays are cast to float64
+    :param gap: numpy timedelta64
+    :param rows: None or list of numpy 1d-arrays of int or bool; each selects the rows of a series, increasing
+    in time; if None, one series of all rows
+    :return: list (one per series of rows) of tuples (time, arrays) with nan's (NaT's in time) inserted into time gaps
+    of the series; arrays are of the structure of the argument arrays, and are views on a common array
+    """
+    is_block = isinstance(arrays, np.ndarray)
+    arrays = [time] + ([arrays] if is_block else list(arrays))
+    arrays = [a.astype('f8', copy=False) if a.dtype.kind == 'f' else a for a in arrays]
+    for a in arrays:
+        if a.dtype.kind == 'O':
+            raise ValueError('object arrays are not supported')
+    names = [f'a{i}' for i in range(len(arrays))]
+    record_dtype = np.dtype({'names': names, 'formats': [(a.dtype, a.shape[1:]) for a in arrays]}, align=True)
+
+    n = len(time)
+    src = np.empty(n, dtype=record_dtype)
+    fill = np.empty(1, dtype=record_dtype)
+    for name, a in zip(names, arrays):
+        src[name] = a
+        fill[name] = _get_fill_value(a.dtype)
+
+    if rows is None:
+        rows = [np.arange(n)]
+    rows = [np.nonzero(r)[0] if r.dtype.kind == 'b' else r for r in rows]
+    row_idx = np.concatenate(rows).astype('i8') if rows else np.empty(0, dtype='i8')
+    seg_stop = np.cumsum([len(r) for r in rows], dtype='i8')
+
+    # a gap within a series; none after the last row of a series
+    row_time = time[row_idx]
+    is_gap = np.zeros(len(row_idx), dtype=bool)
+    is_gap[:-1] = row_time[1:] - row_time[:-1] > gap
+    is_gap[seg_stop[seg_stop > 0] - 1] = False
+    ngaps_before = np.concatenate([[0], np.cumsum(is_gap)])
+
+    dst = np.empty(len(row_idx) + ngaps_before[-1], dtype=record_dtype)
+    _insert_gap_rows(
+        src.view('u1').reshape(n, record_dtype.itemsize),
+        row_idx,
+        is_gap,
+        fill.view('u1'),
+        dst.view('u1').reshape(len(dst), record_dtype.itemsize)
+    )
+
+    series = []
+    out_stop = seg_stop + ngaps_before[seg_stop]
+    out_start = np.concatenate([[0], out_stop[:-1]])
+    for start, stop in zip(out_start, out_stop):
+        _dst = dst[start:stop]
+        _time, *_arrays = [_dst[name] for name in names]
+        series.append((_time, _arrays[0] if is_block else _arrays))
+    return series
+
+
+@numba.njit('int64(float64[:], float64[:], int64[:], int64[:], int64[:], int64[:])', cache=True)
+def _lttb(x, y, seg_start, seg_stop, seg_nout, out):
+    """
+    Largest-Triangle-Three-Buckets downsampling of segments of a series; the first and the last point of each segment
+    are kept.
+    :param x: numpy 1d-array of float
+    :param y: numpy 1d-array of float
+    :param seg_start: numpy 1d-array of int; the first index of each segment
+    :param seg_stop: numpy 1d-array of int; the index past the last one of each segment
+    :param seg_nout: numpy 1d-array of int; the number of points to keep of each segment, >= 2
+    :param out: numpy 1d-array of int; receives the (increasing) indices of points kept
+    :return: number of points kept
+    """
+    k = 0
+    for s in range(len(seg_start)):
+        start, stop, nout = seg_start[s], seg_stop[s], seg_nout[s]
+        n = stop - start
+        if n <= nout:
+            for i in range(start, stop):
+                out[k] = i
+                k += 1
+            continue
+        out[k] = start
+        k += 1
+        bucket_size = (n - 2) / (nout - 2) if nout > 2 else 0.
+        a = start
+        for i in range(nout - 2):
+            # the average point of the next bucket
+            next_start = start + int((i + 1) * bucket_size) + 1
+            next_stop = min(start + int((i + 2) * bucket_size) + 1, stop)
+            avg_x = 0.
+            avg_y = 0.
+            for j in range(next_start, next_stop):
+                avg_x += x[j]
+                avg_y += y[j]
+            avg_x /= next_stop - next_start
+            avg_y /= next_stop - next_start
+            # the point of the current bucket making the largest triangle with the previous point kept and the average
+            max_area = -1.
+            max_j = start + int(i * bucket_size) + 1
+            for j in range(start + int(i * bucket_size) + 1, start + int((i + 1) * bucket_size) + 1):
+                area = abs((x[a] - avg_x) * (y[j] - y[a]) - (x[a] - x[j]) * (avg_y - y[a]))
+                if area > max_area:
+                    max_area = area
+                    max_j = j
+            out[k] = max_j
+            k += 1
+            a = max_j
+        out[k] = stop - 1
+        k += 1
+    return k
+
+
+def lttb_indices(x, y, nout):
+    """
+    Indices of points kept by Largest-Triangle-Three-Buckets downsampling. Points with y nan (e.g. inserted by
+    insert_nan_into_timeseries_gaps) are all kept and split the series into segments, which are downsampled
+    separately, with nout distributed among them in proportion to their lengths; so gaps are preserved.
+    :param x: numpy 1d-array of float; increasing (except at nan's of y)
+    :param y: numpy 1d-array of float
+    :param nout: int; approximate number of points kept
+    :return: numpy 1d-array of int; increasing
+    """
+    y = np.asarray(y, dtype='f8')
+    valid = ~np.isnan(y)
+    nvalid = np.count_nonzero(valid)
+    if nvalid <= nout:
+        return np.arange(len(y))
+
+    # segments of consecutive valid points
+    edges = np.diff(np.concatenate([[False], valid, [False]]).astype('i1'))
+    seg_start, = np.nonzero(edges == 1)
+    seg_stop, = np.nonzero(edges == -1)
+    seg_len = seg_stop - seg_start
+    seg_nout = np.minimum(np.maximum(nout * seg_len // nvalid, 2), seg_len)
+
+    out = np.empty(seg_nout.sum(), dtype='i8')
+    k = _lttb(np.asarray(x, dtype='f8'), y, seg_start, seg_stop, seg_nout, out)
+    nan_idx, = np.nonzero(~valid)
+    return np.sort(np.concatenate([out[:k], nan_idx]))
+
+
+def get_downsampling_indices(timeseries, nout, window=None):
+    """
+    Indices of points of a time series kept by lttb_indices.
+    :param timeseries: pandas Series of float with a datetime index; possibly with nan's and NaT's in gaps
+    :param nout: int
+    :param window: None or tuple (time_from, time_to); if given, the points within the window (and one point
+    beyond on each side) are downsampled to nout points too, and merged with the points of the whole series
+    :return: numpy 1d-array of int; increasing
+    """
+    t = timeseries.index.values
+    x = (t - t[0]).astype('m8[ns]').astype('i8') / 1e9 if len(t) > 0 else np.empty(0)
+    y = timeseries.values
+    idx = lttb_indices(x, y, nout)
+    if window is not None:
+        window_from, window_to = np.datetime64(window[0], 'ns'), np.datetime64(window[1], 'ns')
+        in_window, = np.nonzero((t >= window_from) & (t <= window_to))
+        if len(in_window) > 0:
+            i0, i1 = max(in_window[0] - 1, 0), min(in_window[-1] + 2, len(t))
+            idx = np.union1d(idx, i0 + lttb_indices(x[i0:i1], y[i0:i1], nout))
+    return idx
+
+
 def patch_update(patch, dic):
     for k, v in dic.items():
         if not isinstance(v, dict):
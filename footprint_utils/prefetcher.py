@@ -0,0 +1,92 @@
+import itertools
+import threading
+import collections
+import concurrent.futures
+
+from log import logger
+
+
+class Prefetcher:
+    """
+    Runs speculative tasks (e.g. filling caches) in a bounded thread pool. Tasks are submitted in batches, by group
+    (e.g. of a client session or an airport), and a new batch supersedes the previous one of its group only: its tasks
+    not yet started are cancelled, and the running ones can stop at their next check of is_cancelled.
+    """
+    def __init__(self, max_workers=2, max_pending=16):
+        """
+        :param max_workers: int; max number of tasks run concurrently
+        :param max_pending: int; max number of tasks of a batch
+        """
+        self._max_workers = max_workers
+        self._max_pending = max_pending
+        # created on the first use, so that it belongs to the (forked) worker process
+        self._executor = None
+        self._lock = threading.Lock()
+        # by group
+        self._batch = collections.Counter()
+        self._futures = {}
+        self._stats = collections.Counter()
+
+    def submit(self, tasks, group=None):
+        """
+        Cancels the tasks of the previous batch of a group and submits a new batch.
+        :param tasks: iterable of callables taking one argument, is_cancelled (a callable returning bool);
+        in the order of priority; only the first max_pending ones are submitted
+        :param group: hashable
+        """
+        with self._lock:
+            if self._executor is None:
+                self._executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=self._max_workers, thread_name_prefix='prefetch'
+                )
+            self._cancel_pending(group)
+            batch = self._batch[group]
+
+            def is_cancelled():
+                return self._batch[group] != batch
+
+            futures = [
+                self._executor.submit(self._run, task, is_cancelled)
+                for task in itertools.islice(tasks, self._max_pending)
+            ]
+            self._futures[group] = futures
+            self._stats['submitted'] += len(futures)
+
+    def cancel(self, group=None):
+        """
+        Cancels all tasks submitted in a group.
+        :param group: hashable
+        """
+        with self._lock:
+            self._cancel_pending(group)
+
+    def _cancel_pending(self, group):
+        self._batch[group] += 1
+        for future in self._futures.pop(group, []):
+            if future.cancel():
+                self._stats['cancelled'] += 1
+
+    def _run(self, task, is_cancelled):
+        if is_cancelled():
+            outcome = 'cancelled'
+        else:
+            try:
+                task(is_cancelled)
+                outcome = 'done'
+            except Exception as e:
+                outcome = 'failed'
+                logger().exception('prefetch task failed', exc_info=e)
+        with self._lock:
+            self._stats[outcome] += 1
+
+    def stats(self):
+        """
+        :return: dict with the numbers of tasks 'submitted', 'done', 'cancelled' and 'failed', and 'groups'
+        (the number of groups with tasks not done)
+        """
+        with self._lock:
+            stats = {k: self._stats[k] for k in ['submitted', 'done', 'cancelled', 'failed']}
+            stats['groups'] = sum(
+                any(not future.done() for future in futures) for futures in self._futures.values()
+            )
+            return stats
@@ -0,0 +1,64 @@
+import os
+import json
+import hashlib
+import pathlib
+import tempfile
+import plotly
+
+
+def get_key(params):
+    """
+    Content address of a rendering.
+    :param params: JSON-serializable dict of all parameters which determine the rendering
+    :return: str; hex digest
+    """
+    return hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()
+
+
+def _get_paths(cache_dir, key):
+    path = pathlib.Path(cache_dir) / key[:2]
+    return path / f'{key}.img', path / f'{key}.json'
+
+
+def _write_atomically(path, data):
+    fd, tmp_path = tempfile.mkstemp(prefix=f'.{path.name}-', dir=path.parent)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except Exception:
+        os.unlink(tmp_path)
+        raise
+
+
+def contains(cache_dir, key):
+    _, meta_path = _get_paths(cache_dir, key)
+    return meta_path.exists()
+
+
+def get(cache_dir, key):
+    """
+    :return: tuple (img_bytes, meta) or None if key is not in the cache
+    """
+    img_path, meta_path = _get_paths(cache_dir, key)
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+        with open(img_path, 'rb') as f:
+            img_bytes = f.read()
+    except FileNotFoundError:
+        return None
+    return img_bytes, meta
+
+
+def put(cache_dir, key, img_bytes, meta):
+    """
+    Stores a rendered image and its metadata; safe for concurrent writers (the last one wins).
+    :param img_bytes: bytes
+    :param meta: dict; JSON-serializable with plotly.utils.PlotlyJSONEncoder (e.g. with numpy arrays)
+    """
+    img_path, meta_path = _get_paths(cache_dir, key)
+    img_path.parent.mkdir(parents=True, exist_ok=True)
+    _write_atomically(img_path, img_bytes)
+    # the metadata go last, so that an incomplete entry is never considered present
+    _write_atomically(meta_path, json.dumps(meta, cls=plotly.utils.PlotlyJSONEncoder).encode())
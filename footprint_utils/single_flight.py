@@ -0,0 +1,54 @@
+import threading
+import functools
+import collections
+import concurrent.futures
+
+
+_stats_by_func = {}
+
+
+def single_flight(func):
+    """
+    Decorator which coalesces concurrent calls of func with equal arguments (within a process): the first caller
+    computes, the others wait for its result (or exception). Unlike a cache, the result is not kept afterwards,
+    so it is meant to be placed under a cache, e.g. functools.lru_cache. Arguments must be hashable.
+    """
+    lock = threading.Lock()
+    futures = {}
+    stats = _stats_by_func.setdefault(f'{func.__module__}.{func.__qualname__}', collections.Counter())
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        key = (args, tuple(sorted(kwargs.items())))
+        with lock:
+            future = futures.get(key)
+            is_first = future is None
+            if is_first:
+                future = futures[key] = concurrent.futures.Future()
+                stats['computed'] += 1
+            else:
+                stats['coalesced'] += 1
+        if not is_first:
+            return future.result()
+
+        try:
+            result = func(*args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with lock:
+                del futures[key]
+
+    return wrapper
+
+
+def get_single_flight_stats():
+    """
+    :return: dict of dicts with the numbers of calls 'computed' and 'coalesced' (i.e. computations avoided)
+    by the name of a function decorated with single_flight
+    """
+    return {name: {k: stats[k] for k in ['computed', 'coalesced']} for name, stats in _stats_by_func.items()}
@@ -0,0 +1,21 @@
+import argparse
+
+from footprint_data_access import data_access, CO_aggregates
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Build aggregates (mean, min, max, count) of CO time series by airport and time period, '
+                    'so that the CO graph of long periods can be plotted without reading all profiles'
+    )
+    parser.add_argument(
+        '-r', '--resolutions',
+        nargs='+',
+        choices=CO_aggregates.RESOLUTIONS,
+        default=['week', 'month'],
+        help='time periods to aggregate profiles over (default: week month)',
+    )
+    args = parser.parse_args()
+
+    data_access.build_CO_aggregates(resolutions=args.resolutions)
+    print(f'CO aggregates {args.resolutions} written into {data_access.CO_aggregates_url}')
@@ -0,0 +1,21 @@
+import argparse
+
+from footprint_data_access import data_access
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Build a snapshot of the data structures derived from CO_data.nc, '
+                    'so that application workers do not need to rebuild them at start'
+    )
+    parser.add_argument(
+        '-f', '--force',
+        action='store_true',
+        help='rebuild the snapshot even if it is valid',
+    )
+    args = parser.parse_args()
+
+    # importing data_access already builds the snapshot if it is missing or outdated
+    if args.force:
+        data_access.build_snapshot()
+    print(f'Snapshot in {data_access.SNAPSHOT_DIR} is ready')
@@ -0,0 +1,31 @@
+import argparse
+import xarray as xr
+
+from footprint_data_access.data_access import footprint_data_url, quantized_footprint_data_url
+from footprint_data_access.quantized_footprint import write_quantized_footprints, FOOTPRINT_VAR
+from repack_footprint_zarr import get_store_size
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Convert the footprint zarr store into log-quantized codes with per-footprint scale and offset; '
+                    'set FOOTPRINT_STORE = \'quantized\' in config to use it'
+    )
+    parser.add_argument('--src', default=str(footprint_data_url), help='source zarr store')
+    parser.add_argument('--dst', default=str(quantized_footprint_data_url), help='destination zarr store')
+    parser.add_argument('--dtype', choices=['u1', 'u2'], default='u1', help='dtype of the codes')
+    parser.add_argument(
+        '--floor', type=float, default=1e-4,
+        help='relative to the max of a footprint; smaller values are set to 0; '
+             'must be below the smallest residence time cutoff of the application (3e-4)'
+    )
+    parser.add_argument('--batch-size', type=int, default=100, help='number of flight_id\'s processed at once')
+    args = parser.parse_args()
+
+    fp_da = xr.open_zarr(args.src)[FOOTPRINT_VAR]
+    nflight = fp_da.sizes['flight_id']
+    write_quantized_footprints(
+        fp_da, args.dst, dtype=args.dtype, floor=args.floor, batch_size=args.batch_size,
+        progress=lambda n: print(f'{n}/{nflight} flight_id\'s done'),
+    )
+    print(f'size: {get_store_size(args.src) / 1e6:.1f}MB -> {get_store_size(args.dst) / 1e6:.1f}MB (quantized)')
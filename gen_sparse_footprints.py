@@ -0,0 +1,30 @@
+import argparse
+import xarray as xr
+
+from footprint_data_access.data_access import footprint_data_url, sparse_footprint_data_url
+from footprint_data_access.sparse_footprint import write_sparse_footprints, FOOTPRINT_VAR
+from repack_footprint_zarr import get_store_size
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Convert the dense footprint zarr store into a sparse one; '
+                    'set FOOTPRINT_STORE = \'sparse\' in config to use it'
+    )
+    parser.add_argument('--src', default=str(footprint_data_url), help='source (dense) zarr store')
+    parser.add_argument('--dst', default=str(sparse_footprint_data_url), help='destination (sparse) zarr store')
+    parser.add_argument(
+        '--floor', type=float, default=1e-4,
+        help='relative to the max of a footprint; smaller values are dropped; '
+             'must be below the smallest residence time cutoff of the application (3e-4)'
+    )
+    parser.add_argument('--batch-size', type=int, default=100, help='number of flight_id\'s processed at once')
+    args = parser.parse_args()
+
+    fp_da = xr.open_zarr(args.src)[FOOTPRINT_VAR]
+    nflight = fp_da.sizes['flight_id']
+    write_sparse_footprints(
+        fp_da, args.dst, floor=args.floor, batch_size=args.batch_size,
+        progress=lambda n: print(f'{n}/{nflight} flight_id\'s done'),
+    )
+    print(f'size: {get_store_size(args.src) / 1e6:.1f}MB (dense) -> {get_store_size(args.dst) / 1e6:.1f}MB (sparse)')
@@ -0,0 +1,25 @@
+# gunicorn server hooks; see: https://docs.gunicorn.org/en/stable/settings.html#server-hooks
+import sys
+import pathlib
+import subprocess
+
+
+_APP_DIR = pathlib.Path(__file__).resolve().parent
+
+
+def on_starting(server):
+    # build the data access snapshot and preload shared data once, in a separate process,
+    # so that the master does not hold any data nor open files inherited by workers;
+    # the process also fills the on-disk cache of numba kernels, which workers then load
+    subprocess.run([sys.executable, str(_APP_DIR / 'preload_shared_data.py')], cwd=_APP_DIR, check=True)
+
+
+def post_worker_init(worker):
+    from log import logger
+    import footprint_data_access
+    import warm_up
+    import worker_stats
+    # so that neither numba kernels nor the first CO graph are compiled / computed on a user request
+    warm_up.warm_up()
+    logger().info(f'worker memory report: {footprint_data_access.get_memory_report()}')
+    worker_stats.start_logging_worker_stats()
@@ -76,6 +76,8 @@ MAPBOX_STYLES = {
 DEFAULT_MAPBOX_STYLE = 'carto-positron'
 
 CURRENT_PROFILE_IDX_BY_AIRPORT_STORE_ID = 'current_profile_idx_by_airport_store'
+FOOTPRINT_GRID_STORE_ID = 'footprint_grid_store'
+CO_GRAPH_STATE_STORE_ID = 'CO_graph_state_store'
 
 AIRPORT_SELECT_ID = 'airport_select'
 VERTICAL_LAYER_RADIO_ID = 'vertical_layer_radio'
@@ -102,8 +104,16 @@ ONLY_SIGNIFICANT_REGIONS_PERCENTAGE_ID = 'only_significant_regions_percentage'
 RESIDENCE_TIME_SCALE_RADIO_ID = 'residence_time_scale_radio'
 RESIDENCE_TIME_CUTOFF_RADIO_ID = 'residence_time_cutoff_radio'
 
+# options of the residence time cutoff (relative to the max of a footprint); see also prerender_footprints.py
+RESIDENCE_TIME_CUTOFFS = [3e-4, 1e-3, 3e-3, 1e-2, 3e-2]
+
 GEO_REGIONS_WITHOUT_TOTAL = ['BONA', 'TENA', 'CEAM', 'NHSA', 'SHSA', 'EURO', 'MIDE', 'NHAF', 'SHAF', 'BOAS', 'CEAS', 'SEAS', 'EQAS', 'AUST']
 GEO_REGIONS = ['TOTAL'] + GEO_REGIONS_WITHOUT_TOTAL
+
+# initial values of the controls of the CO graph (see also warm_up.py)
+DEFAULT_VERTICAL_LAYER = 'LT'
+DEFAULT_EMISSION_INVENTORY = ['GFAS', 'CAMS']
+DEFAULT_EMISSION_REGION = 'TOTAL'
 COLOR_HEX_BY_GFED4_REGION = {
     'BONA': '#3460ff',
     'TENA': '#ffab00',
@@ -297,6 +307,10 @@ def get_app_tooltips():
 def get_app_data_stores():
     return [
         dcc.Store(id=CURRENT_PROFILE_IDX_BY_AIRPORT_STORE_ID, data={}, storage_type='session'),
+        # footprint to be rendered in the browser (FOOTPRINT_MAP_SOURCE = 'client' in config)
+        dcc.Store(id=FOOTPRINT_GRID_STORE_ID, data=None, storage_type='memory'),
+        # parameters of the CO figure in the browser, which is patched if possible
+        dcc.Store(id=CO_GRAPH_STATE_STORE_ID, data=None, storage_type='memory'),
     ]
 
 
@@ -392,7 +406,7 @@ def get_layout(title_bar, app):
             {'label': 'FT (3km - 8km)', 'value': 'FT'},
             {'label': 'UT (> 8km)', 'value': 'UT'},
         ],
-        value='LT',
+        value=DEFAULT_VERTICAL_LAYER,
         inline=True,
         persistence=True,
         persistence_type='session',
@@ -419,7 +433,7 @@ def get_layout(title_bar, app):
             {'label': 'Biomass burning (GFAS v1.2)', 'value': 'GFAS'},
             {'label': 'Anthropogenic (CAMS-GLOB-ANT v5.3)', 'value': 'CAMS'},
         ],
-        value=['GFAS', 'CAMS'],
+        value=DEFAULT_EMISSION_INVENTORY,
         inline=False,
         persistence=True,
         persistence_type='session',
@@ -431,7 +445,7 @@ def get_layout(title_bar, app):
             {'label': region, 'value': region}
             for region in GEO_REGIONS
         ],
-        value='TOTAL',
+        value=DEFAULT_EMISSION_REGION,
         persistence=True,
         persistence_type='session',
         size='lg',
@@ -666,11 +680,8 @@ def get_layout(title_bar, app):
                 dbc.RadioItems(
                     id=RESIDENCE_TIME_CUTOFF_RADIO_ID,
                     options=[
-                        {'label': '0.03 %', 'value': 3e-4},
-                        {'label': '0.1 %', 'value': 1e-3},
-                        {'label': '0.3 %', 'value': 3e-3},
-                        {'label': '1 %', 'value': 1e-2},
-                        {'label': '3 %', 'value': 3e-2},
+                        {'label': f'{cutoff * 100:g} %', 'value': cutoff}
+                        for cutoff in RESIDENCE_TIME_CUTOFFS
                     ],
                     value=3e-3,
                     inline=True,
@@ -0,0 +1,66 @@
+import functools
+
+import config
+from footprint_utils.prefetcher import Prefetcher
+from footprint_data_access import get_flight_id_and_profile_by_airport_and_profile_idx, get_COprofile
+import footprint_rendering
+
+
+# optional; after each step in time, the footprint maps and CO profiles of the profiles up to PREFETCH_DISTANCE steps
+# (and one big step) away are prepared in the background by PREFETCH_MAX_WORKERS threads of each worker;
+# PREFETCH_DISTANCE = 0 disables it
+PREFETCH_DISTANCE = getattr(config, 'PREFETCH_DISTANCE', 2)
+PREFETCH_MAX_WORKERS = getattr(config, 'PREFETCH_MAX_WORKERS', 2)
+
+# the latest navigation at an airport supersedes the previous prefetching of the airport only, so that sessions
+# at different airports served by a worker do not cancel each other's prefetching
+_prefetcher = Prefetcher(max_workers=PREFETCH_MAX_WORKERS, max_pending=2 * PREFETCH_DISTANCE + 2)
+
+
+def get_prefetch_profile_indices(profile_idx, big_time_step, min_profile_idx, max_profile_idx,
+                                 distance=PREFETCH_DISTANCE):
+    """
+    :return: list of profile indices within distance and one big_time_step from profile_idx, the nearest first
+    """
+    steps = [step for d in range(1, distance + 1) for step in (d, -d)]
+    if distance > 0 and big_time_step > distance:
+        steps += [big_time_step, -big_time_step]
+    profile_indices = []
+    for step in steps:
+        idx = profile_idx + step
+        if min_profile_idx <= idx <= max_profile_idx and idx not in profile_indices:
+            profile_indices.append(idx)
+    return profile_indices
+
+
+def _prefetch_profile(airport_code, profile_idx, layer, residence_time_scale, residence_time_cutoff, is_cancelled):
+    flight_id, profile = get_flight_id_and_profile_by_airport_and_profile_idx(airport_code, profile_idx)
+    get_COprofile(flight_id, profile)
+    if is_cancelled():
+        return
+    footprint_rendering.get_footprint_map_layers(flight_id, profile, layer, residence_time_scale, residence_time_cutoff)
+
+
+def prefetch_profiles(airport_code, profile_idx, big_time_step, min_profile_idx, max_profile_idx,
+                      layer, residence_time_scale, residence_time_cutoff):
+    """
+    Prepares in the background the footprint maps and CO profiles next to the current profile of an airport,
+    which are likely to be shown next when stepping in time; cancels the previous prefetching at the airport.
+    """
+    if PREFETCH_DISTANCE <= 0:
+        return
+    profile_indices = get_prefetch_profile_indices(profile_idx, big_time_step, min_profile_idx, max_profile_idx)
+    _prefetcher.submit(
+        (
+            functools.partial(_prefetch_profile, airport_code, idx, layer, residence_time_scale, residence_time_cutoff)
+            for idx in profile_indices
+        ),
+        group=airport_code,
+    )
+
+
+def get_prefetch_stats():
+    """
+    :return: dict; see footprint_utils.prefetcher.Prefetcher.stats
+    """
+    return _prefetcher.stats()
@@ -0,0 +1,12 @@
+from footprint_data_access import data_access, shared_data
+# compiles the numba kernels into their on-disk cache (or loads them), so that workers need not compile them
+from footprint_utils import footprint_viz  # noqa
+
+
+if __name__ == '__main__':
+    if shared_data.SHARED_DATA_DIR is None:
+        print('SHARED_DATA_DIR is not set in config; nothing to do')
+    else:
+        # importing data_access has also built the snapshot of CO data if it was missing or outdated
+        data_access.write_shared_data()
+        print(f'Shared data in {shared_data.SHARED_DATA_DIR} are ready')
@@ -0,0 +1,110 @@
+import time
+import argparse
+import itertools
+import concurrent.futures
+import pandas as pd
+
+from footprint_utils import footprint_viz, render_cache
+from footprint_data_access import get_iagos_airports, get_CO_ts, get_CO_time_range, \
+    get_flight_id_and_profile_by_airport_and_profile_idx
+import footprint_rendering
+from layout import RESIDENCE_TIME_CUTOFFS
+
+
+LAYERS = ['LT', 'FT', 'UT']
+
+
+def prerender_profile(cache_dir, flight_id, profile, layers, scales, cutoffs):
+    """
+    Renders all combinations of layers, scales and cutoffs of a profile which are not yet in the cache.
+    Runs in a worker process.
+    :return: tuple (nrendered, nskipped, nunavailable)
+    """
+    nrendered, nskipped, nunavailable = 0, 0, 0
+    for layer, scale, cutoff in itertools.product(layers, scales, cutoffs):
+        key = footprint_rendering.get_rendering_key(flight_id, profile, layer, scale, cutoff)
+        if render_cache.contains(cache_dir, key):
+            nskipped += 1
+            continue
+        rendering = footprint_rendering.render_footprint(flight_id, profile, layer, scale, cutoff)
+        if rendering is None:
+            nunavailable += 1
+            continue
+        render_cache.put(cache_dir, key, *rendering)
+        nrendered += 1
+    return nrendered, nskipped, nunavailable
+
+
+def get_profiles(top, date_from, date_to):
+    """
+    :param top: int or None; if None, all airports
+    :return: list of (flight_id, profile) of the top airports (by the number of profiles) between date_from and date_to,
+    of the same types as in the application (hence with the same rendering keys)
+    """
+    airports, _ = get_iagos_airports(date_from=date_from, date_to=date_to, top=top)
+    profiles = {}
+    for airport_code in airports['short_name']:
+        CO_ts = get_CO_ts(airport_code, date_from=date_from, date_to=date_to)
+        for profile_idx in CO_ts['profile_idx_for_airport'].values:
+            profiles[get_flight_id_and_profile_by_airport_and_profile_idx(airport_code, profile_idx.item())] = None
+    return list(profiles)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Pre-render footprint images of the profiles at the busiest airports (or at all airports) '
+                    'into the render cache (FOOTPRINT_RENDER_CACHE_DIR in config), from which the application '
+                    'serves them; renderings already in the cache are skipped, so an interrupted run can be resumed'
+    )
+    parser.add_argument('--cache-dir', default=footprint_rendering.FOOTPRINT_RENDER_CACHE_DIR, help='render cache')
+    parser.add_argument(
+        '--top', type=int, default=10, help='number of airports with the most profiles; 0 for all airports'
+    )
+    parser.add_argument('--all', action='store_true', help='all airports (same as --top 0)')
+    parser.add_argument('--date-from', default=None, help='YYYY-MM-DD; default: the first profile')
+    parser.add_argument('--date-to', default=None, help='YYYY-MM-DD; default: the last profile')
+    parser.add_argument('--days', type=int, default=None, help='number of days before --date-to (instead of --date-from)')
+    parser.add_argument('--layers', nargs='+', choices=LAYERS, default=LAYERS)
+    parser.add_argument(
+        '--scales', nargs='+', choices=list(footprint_viz.COLOR_SCALE_TRANSFORMS),
+        default=list(footprint_viz.COLOR_SCALE_TRANSFORMS)
+    )
+    parser.add_argument('--cutoffs', nargs='+', type=float, default=RESIDENCE_TIME_CUTOFFS)
+    parser.add_argument('--processes', type=int, default=None, help='default: number of CPUs')
+    args = parser.parse_args()
+
+    if args.cache_dir is None:
+        parser.error('--cache-dir is required if FOOTPRINT_RENDER_CACHE_DIR is not set in config')
+
+    time_min, time_max = get_CO_time_range()
+    date_to = pd.Timestamp(args.date_to) if args.date_to is not None else time_max
+    if args.days is not None:
+        date_from = date_to - pd.Timedelta(days=args.days)
+    else:
+        date_from = pd.Timestamp(args.date_from) if args.date_from is not None else time_min
+    top = None if args.all or args.top == 0 else args.top
+    profiles = get_profiles(top, str(date_from), str(date_to))
+    nrenderings = len(profiles) * len(args.layers) * len(args.scales) * len(args.cutoffs)
+    print(f'{len(profiles)} profiles between {date_from} and {date_to}, {nrenderings} renderings')
+
+    start = time.perf_counter()
+    nrendered, nskipped, nunavailable = 0, 0, 0
+    with concurrent.futures.ProcessPoolExecutor(max_workers=args.processes) as executor:
+        futures = [
+            executor.submit(
+                prerender_profile, args.cache_dir, flight_id, profile, args.layers, args.scales, args.cutoffs
+            )
+            for flight_id, profile in profiles
+        ]
+        for i, future in enumerate(concurrent.futures.as_completed(futures), start=1):
+            _nrendered, _nskipped, _nunavailable = future.result()
+            nrendered += _nrendered
+            nskipped += _nskipped
+            nunavailable += _nunavailable
+            if i % 10 == 0 or i == len(futures):
+                elapsed = time.perf_counter() - start
+                print(f'{i}/{len(futures)} profiles done; {nrendered / elapsed:.1f} renderings/s')
+
+    elapsed = time.perf_counter() - start
+    print(f'rendered: {nrendered}, already in cache: {nskipped}, footprint not available: {nunavailable}')
+    print(f'elapsed: {elapsed:.1f}s; throughput: {nrendered / elapsed:.1f} renderings/s')
@@ -0,0 +1,118 @@
+import time
+import pathlib
+import argparse
+import numpy as np
+import xarray as xr
+import numcodecs
+
+from footprint_data_access.data_access import footprint_data_url
+
+
+FOOTPRINT_VAR = 'res_time_per_km2'
+COMPRESSORS = ['blosc-zstd', 'blosc-lz4', 'zstd', 'none']
+
+
+def get_compressor(name, clevel):
+    if name == 'blosc-zstd':
+        return numcodecs.Blosc(cname='zstd', clevel=clevel, shuffle=numcodecs.Blosc.BITSHUFFLE)
+    elif name == 'blosc-lz4':
+        return numcodecs.Blosc(cname='lz4', clevel=clevel, shuffle=numcodecs.Blosc.SHUFFLE)
+    elif name == 'zstd':
+        return numcodecs.Zstd(level=clevel)
+    elif name == 'none':
+        return None
+    else:
+        raise ValueError(f'unknown compressor={name}')
+
+
+def get_store_size(path):
+    return sum(f.stat().st_size for f in pathlib.Path(path).rglob('*') if f.is_file())
+
+
+def repack(src, dst, compressor, batch_size=100):
+    """
+    Rewrites the footprint store so that all layers of a (flight_id, profile) are in one chunk.
+    :param src: pathlib.Path; source zarr store
+    :param dst: pathlib.Path; destination zarr store (overwritten)
+    :param compressor: numcodecs codec or None
+    :param batch_size: int; number of flight_id's processed at once
+    """
+    ds = xr.open_zarr(src)
+    chunks = {dim: 1 if dim in ['flight_id', 'profile'] else -1 for dim in ds[FOOTPRINT_VAR].dims}
+    chunk_shape = tuple(1 if dim in ['flight_id', 'profile'] else ds.sizes[dim] for dim in ds[FOOTPRINT_VAR].dims)
+    for var in ds.variables.values():
+        for k in ['chunks', 'preferred_chunks', 'compressor', 'filters']:
+            var.encoding.pop(k, None)
+    encoding = {FOOTPRINT_VAR: {'chunks': chunk_shape, 'compressor': compressor}}
+
+    n = ds.sizes['flight_id']
+    for i in range(0, n, batch_size):
+        batch_ds = ds.isel({'flight_id': slice(i, i + batch_size)}).load().chunk(chunks)
+        if i == 0:
+            batch_ds.to_zarr(dst, mode='w', encoding=encoding, consolidated=True)
+        else:
+            batch_ds.to_zarr(dst, append_dim='flight_id', consolidated=True)
+        print(f'{min(i + batch_size, n)}/{n} flight_id\'s done')
+
+
+def benchmark(path, nsamples=50, seed=0):
+    """
+    Measures read latency of single footprints, the same way as footprint_data_access.get_residence_time does.
+    :return: dict
+    """
+    fp_da = xr.open_zarr(path)[FOOTPRINT_VAR]
+    rng = np.random.default_rng(seed)
+    flight_ids = rng.choice(fp_da['flight_id'].values, size=nsamples)
+    profiles = rng.choice(fp_da['profile'].values, size=nsamples)
+    layers = rng.choice(fp_da['layer'].values, size=nsamples)
+
+    latencies = []
+    for flight_id, profile, layer in zip(flight_ids, profiles, layers):
+        start = time.perf_counter()
+        fp_da.sel({'flight_id': flight_id, 'profile': profile, 'layer': layer}, drop=True).load()
+        latencies.append(time.perf_counter() - start)
+    latencies = np.array(latencies)
+
+    return {
+        'size_MB': get_store_size(path) / 1e6,
+        'chunks': fp_da.encoding.get('chunks'),
+        'compressor': str(fp_da.encoding.get('compressor')),
+        'latency_mean_ms': latencies.mean() * 1e3,
+        'latency_median_ms': np.median(latencies) * 1e3,
+        'latency_p95_ms': np.percentile(latencies, 95) * 1e3,
+    }
+
+
+def print_report(reports):
+    keys = list(next(iter(reports.values())))
+    print(f'{"":20}' + ''.join(f'{name:>64}' for name in reports))
+    for k in keys:
+        values = [r[k] for r in reports.values()]
+        print(f'{k:20}' + ''.join(f'{v:>64.3f}' if isinstance(v, float) else f'{str(v):>64}' for v in values))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Repack the footprint zarr store, so that one (flight_id, profile) holds all layers in one chunk, '
+                    'and compare read latency and on-disk size before and after'
+    )
+    parser.add_argument('--src', default=str(footprint_data_url), help='source zarr store')
+    parser.add_argument(
+        '--dst',
+        default=str(footprint_data_url.with_name(f'{footprint_data_url.stem}.repacked.zarr')),
+        help='destination zarr store; once checked, it can replace the source store'
+    )
+    parser.add_argument('--compressor', choices=COMPRESSORS, default='blosc-zstd')
+    parser.add_argument('--clevel', type=int, default=5, help='compression level')
+    parser.add_argument('--batch-size', type=int, default=100, help='number of flight_id\'s processed at once')
+    parser.add_argument('--nsamples', type=int, default=50, help='number of footprints read by the benchmark')
+    parser.add_argument('--benchmark-only', action='store_true', help='do not repack, only benchmark --src and --dst')
+    args = parser.parse_args()
+
+    if not args.benchmark_only:
+        repack(args.src, args.dst, get_compressor(args.compressor, args.clevel), batch_size=args.batch_size)
+
+    print_report({
+        'before': benchmark(args.src, nsamples=args.nsamples),
+        'after': benchmark(args.dst, nsamples=args.nsamples),
+    })
@@ -0,0 +1,40 @@
+import numpy as np
+
+from footprint_utils import helper, footprint_viz
+from footprint_data_access import get_iagos_airports
+from log import log_exectime, logger
+from layout import DEFAULT_VERTICAL_LAYER, DEFAULT_EMISSION_INVENTORY, DEFAULT_EMISSION_REGION
+
+
+def warm_up_kernels():
+    """
+    Runs the numba kernels of footprint_utils on small inputs. They are compiled for explicit signatures when
+    imported (or loaded from the on-disk cache in __pycache__, or in NUMBA_CACHE_DIR if set in the environment),
+    so this only completes their dispatch and the first-call overheads of the code around them.
+    """
+    time = np.datetime64('2020-01-01', 'ns') + np.array([0, 1, 10, 11], dtype='m8[D]')
+    values = np.arange(8, dtype='f8').reshape(4, 2)
+    helper.insert_nan_into_gaps(time, [np.arange(4), values], rows=[np.ones(4, dtype=bool)])
+    helper.insert_nan(values[:, 0], helper.get_timeseries_gaps(time))
+    helper.lttb_indices(np.arange(8, dtype='f8'), np.arange(8, dtype='f8'), 4)
+    footprint_viz._get_isoline_rings(np.pad(np.ones((2, 2)), 1), 0.5)
+
+
+@log_exectime
+def warm_up():
+    """
+    Warms up an application worker before it takes requests (see post_worker_init in gunicorn.conf.py):
+    the numba kernels and the CO graph of the airport with the most profiles.
+    """
+    warm_up_kernels()
+
+    import callbacks
+    airports, _ = get_iagos_airports(top=1)
+    if len(airports) == 0:
+        return
+    airport_code = airports['short_name'].iloc[0]
+    # the initial values of the controls
+    callbacks._get_CO_fig(
+        airport_code, DEFAULT_VERTICAL_LAYER, DEFAULT_EMISSION_INVENTORY, DEFAULT_EMISSION_REGION, None, None, None
+    )
+    logger().info(f'warmed up with the CO graph of {airport_code}')
@@ -0,0 +1,45 @@
+import threading
+
+import config
+import prefetch
+import footprint_rendering
+from log import logger
+from footprint_utils.single_flight import get_single_flight_stats
+from footprint_data_access import get_footprint_chunk_cache_stats
+
+
+# optional; each worker logs its statistics (prefetching, caches) every WORKER_STATS_LOG_INTERVAL seconds
+# (None or 0 disables it)
+WORKER_STATS_LOG_INTERVAL = getattr(config, 'WORKER_STATS_LOG_INTERVAL', 600)
+
+
+def get_worker_stats():
+    """
+    :return: dict of statistics of a worker, by component
+    """
+    return {
+        'prefetch': prefetch.get_prefetch_stats(),
+        'single_flight': get_single_flight_stats(),
+        # the caches below are shared by all workers on a host
+        'footprint_map_cache': footprint_rendering.get_footprint_map_cache_stats(),
+        'footprint_chunk_cache': get_footprint_chunk_cache_stats(),
+    }
+
+
+def _log_worker_stats(interval):
+    stopped = threading.Event()
+    while not stopped.wait(interval):
+        try:
+            logger().info(f'worker stats: {get_worker_stats()}')
+        except Exception as e:
+            logger().exception('could not get worker stats', exc_info=e)
+
+
+def start_logging_worker_stats(interval=WORKER_STATS_LOG_INTERVAL):
+    """
+    Starts logging get_worker_stats periodically in a daemon thread; to be called in a worker process.
+    :param interval: float; in seconds; None or 0 disables logging
+    """
+    if not interval:
+        return
+    threading.Thread(target=_log_worker_stats, args=(interval, ), name='worker-stats', daemon=True).start()